@@ -0,0 +1,350 @@
+import numpy as np
+import pandas as pd
+
+from mascara_nubes import FRACCION_VALIDA_MINIMA
+
+# ===== CONFIGURACIÓN =====
+# PARÁMETROS GEE POR CULTIVO
+PARAMETROS_CULTIVOS = {
+    'TRIGO': {
+        'NITROGENO': {'min': 120, 'max': 180},
+        'FOSFORO': {'min': 40, 'max': 60},
+        'POTASIO': {'min': 80, 'max': 120},
+        'MATERIA_ORGANICA_OPTIMA': 3.5,
+        'HUMEDAD_OPTIMA': 0.25,
+        'NDVI_OPTIMO': 0.7,
+        'NDRE_OPTIMO': 0.4
+    },
+    'MAÍZ': {
+        'NITROGENO': {'min': 150, 'max': 220},
+        'FOSFORO': {'min': 50, 'max': 70},
+        'POTASIO': {'min': 100, 'max': 140},
+        'MATERIA_ORGANICA_OPTIMA': 4.0,
+        'HUMEDAD_OPTIMA': 0.3,
+        'NDVI_OPTIMO': 0.75,
+        'NDRE_OPTIMO': 0.45
+    },
+    'SOJA': {
+        'NITROGENO': {'min': 80, 'max': 120},
+        'FOSFORO': {'min': 35, 'max': 50},
+        'POTASIO': {'min': 90, 'max': 130},
+        'MATERIA_ORGANICA_OPTIMA': 3.8,
+        'HUMEDAD_OPTIMA': 0.28,
+        'NDVI_OPTIMO': 0.65,
+        'NDRE_OPTIMO': 0.35
+    },
+    'SORGO': {
+        'NITROGENO': {'min': 100, 'max': 150},
+        'FOSFORO': {'min': 30, 'max': 45},
+        'POTASIO': {'min': 70, 'max': 100},
+        'MATERIA_ORGANICA_OPTIMA': 3.0,
+        'HUMEDAD_OPTIMA': 0.22,
+        'NDVI_OPTIMO': 0.6,
+        'NDRE_OPTIMO': 0.3
+    },
+    'GIRASOL': {
+        'NITROGENO': {'min': 90, 'max': 130},
+        'FOSFORO': {'min': 25, 'max': 40},
+        'POTASIO': {'min': 80, 'max': 110},
+        'MATERIA_ORGANICA_OPTIMA': 3.2,
+        'HUMEDAD_OPTIMA': 0.26,
+        'NDVI_OPTIMO': 0.55,
+        'NDRE_OPTIMO': 0.25
+    }
+}
+
+# Semilla por defecto: la misma parcela produce los mismos índices en cada rerun
+SEMILLA_INDICES = 42
+
+# ===== MOTOR VECTORIZADO DE ÍNDICES GEE =====
+def _normalizar(valores):
+    """Normaliza un vector al rango 0-1 (0.5 si no hay variación)"""
+    v_min, v_max = valores.min(), valores.max()
+    if v_max == v_min:
+        return np.full(valores.shape, 0.5)
+    return (valores - v_min) / (v_max - v_min)
+
+def _media_zonal(estadisticas, banda, estimado):
+    """Reemplaza el valor estimado por la media zonal del ráster donde la zona tiene suficientes píxeles válidos"""
+    if not estadisticas or banda not in estadisticas:
+        return estimado
+    media = estadisticas[banda]['media'].to_numpy(dtype=np.float64)
+    confiable = np.isfinite(media)
+    if 'fraccion_valida' in estadisticas[banda]:
+        # Zonas mayormente nubladas: la media de pocos píxeles no representa la zona
+        confiable &= estadisticas[banda]['fraccion_valida'].to_numpy() >= FRACCION_VALIDA_MINIMA
+    return np.where(confiable, media, estimado)
+
+# Columnas de índices por zona, en el orden de la tabla de resultados
+COLUMNAS_INDICES = ['materia_organica', 'humedad_suelo', 'ndvi', 'ndre', 'npk_actual']
+
+def _parametros(cultivos, *claves):
+    """Columna (cultivos, 1) con el parámetro de cada cultivo, para operar en bloque sobre todas las zonas"""
+    params = [PARAMETROS_CULTIVOS[cultivo] for cultivo in cultivos]
+    for clave in claves:
+        params = [p[clave] for p in params]
+    return np.array(params, dtype=float)[:, None]
+
+def calcular_indices_cultivos(gdf, cultivos, datos_satelitales, semilla=SEMILLA_INDICES, estadisticas=None):
+    """Índices GEE de todas las zonas para varios cultivos a la vez: {columna: array (cultivos, zonas)}
+
+    Los cultivos comparten el patrón espacial y el ruido (misma semilla), así que la fila de un cultivo no
+    depende de qué otros cultivos se calculen con él.
+    """
+    n_cultivos, n_poligonos = len(cultivos), len(gdf)
+    if n_poligonos == 0:
+        return {col: np.empty((n_cultivos, 0)) for col in COLUMNAS_INDICES}
+    
+    rng = np.random.default_rng(semilla)
+    
+    # Centroides para gradiente espacial
+    centroides = gdf.geometry.centroid
+    x_norm = _normalizar(centroides.x.to_numpy())
+    y_norm = _normalizar(centroides.y.to_numpy())
+    patron_espacial = x_norm * 0.6 + y_norm * 0.4
+    
+    # Usar datos satelitales reales si están disponibles; la simulación parte del NDVI óptimo de cada cultivo
+    datos_satelitales = datos_satelitales or {}
+    if 'desvio_ndvi' in datos_satelitales:
+        valor_base_satelital = _parametros(cultivos, 'NDVI_OPTIMO') * 0.8 + datos_satelitales['desvio_ndvi']
+    else:
+        valor_base_satelital = datos_satelitales.get('valor_promedio', 0.6)
+    
+    # 1. MATERIA ORGÁNICA - Adaptada por cultivo
+    mo_optima = _parametros(cultivos, 'MATERIA_ORGANICA_OPTIMA')
+    materia_organica = (mo_optima * 0.7 + patron_espacial * (mo_optima * 0.6) +
+                        rng.normal(0, 0.2, n_poligonos))
+    np.clip(materia_organica, 0.5, 8.0, out=materia_organica)
+    
+    # 2. HUMEDAD SUELO - Adaptada por requerimientos del cultivo
+    humedad_optima = _parametros(cultivos, 'HUMEDAD_OPTIMA')
+    humedad_suelo = (humedad_optima * 0.8 + patron_espacial * (humedad_optima * 0.4) +
+                     rng.normal(0, 0.05, n_poligonos))
+    np.clip(humedad_suelo, 0.1, 0.8, out=humedad_suelo)
+    
+    # 3. NDVI - Influenciado por datos satelitales reales (igual para todos los cultivos salvo en la simulación)
+    ndvi = (valor_base_satelital * 0.8 + patron_espacial * (valor_base_satelital * 0.4) +
+            rng.normal(0, 0.06, n_poligonos))
+    np.clip(ndvi, 0.1, 0.9, out=ndvi)
+    # Con ráster disponible, la media de píxeles de cada zona reemplaza la estimación
+    ndvi = _media_zonal(estadisticas, 'NDVI', ndvi)
+    
+    # 4. NDRE - Específico por cultivo
+    ndre_optimo = _parametros(cultivos, 'NDRE_OPTIMO')
+    ndre = (ndre_optimo * 0.7 + patron_espacial * (ndre_optimo * 0.4) +
+            rng.normal(0, 0.04, n_poligonos))
+    np.clip(ndre, 0.05, 0.7, out=ndre)
+    ndre = _media_zonal(estadisticas, 'NDRE', ndre)
+    
+    # 5. ÍNDICE NPK ACTUAL - Fórmula adaptada por cultivo
+    npk_actual = (ndvi * 0.4) + (ndre * 0.3) + ((materia_organica / 8) * 0.2) + (humedad_suelo * 0.1)
+    np.clip(npk_actual, 0, 1, out=npk_actual)
+    
+    forma = (n_cultivos, n_poligonos)
+    return {
+        'materia_organica': np.round(materia_organica, 2),
+        'humedad_suelo': np.round(humedad_suelo, 3),
+        'ndvi': np.round(np.broadcast_to(ndvi, forma), 3),
+        'ndre': np.round(np.broadcast_to(ndre, forma), 3),
+        'npk_actual': np.round(npk_actual, 3)
+    }
+
+# ===== RECOMENDACIONES NPK EN LOTE =====
+# Nutriente de la interfaz -> (clave en PARAMETROS_CULTIVOS, columna de resultados)
+NUTRIENTES = {
+    'NITRÓGENO': ('NITROGENO', 'n_recomendado'),
+    'FÓSFORO': ('FOSFORO', 'p_recomendado'),
+    'POTASIO': ('POTASIO', 'k_recomendado')
+}
+
+def calcular_recomendaciones_cultivos(indices, cultivos):
+    """Dosis de N, P y K (kg/ha) por cultivo y zona: {columna: array (cultivos, zonas)}
+
+    indices puede tener columnas (zonas,) compartidas por los cultivos o (cultivos, zonas), como las de
+    calcular_indices_cultivos.
+    """
+    ndre = np.asarray(indices['ndre'], dtype=float)
+    ndvi = np.asarray(indices['ndvi'], dtype=float)
+    deficit_mo = 1 - np.asarray(indices['materia_organica'], dtype=float) / 8
+    deficit_humedad = 1 - np.asarray(indices['humedad_suelo'], dtype=float)
+    
+    factores = {
+        # Fórmula GEE adaptada: ndre y ndvi para recomendación de N
+        'NITROGENO': (1 - ndre) * 0.6 + (1 - ndvi) * 0.4,
+        # Fórmula GEE: materia orgánica y humedad para recomendación de P
+        'FOSFORO': deficit_mo * 0.7 + deficit_humedad * 0.3,
+        # Fórmula GEE: múltiples factores para recomendación de K
+        'POTASIO': (1 - ndre) * 0.4 + deficit_humedad * 0.4 + deficit_mo * 0.2
+    }
+    
+    recomendaciones = {}
+    for clave, columna in NUTRIENTES.values():
+        minimo, maximo = _parametros(cultivos, clave, 'min'), _parametros(cultivos, clave, 'max')
+        dosis = factores[clave] * (maximo - minimo) + minimo
+        np.clip(dosis, minimo * 0.8, maximo * 1.2, out=dosis)
+        recomendaciones[columna] = np.round(dosis, 1)
+    
+    return recomendaciones
+
+# ===== CLASIFICACIÓN POR TABLA DE CORTES =====
+CATEGORIAS_FERTILIDAD = ['MUY BAJA', 'BAJA', 'MEDIA', 'BUENA', 'ÓPTIMA']
+CATEGORIAS_RECOMENDACION = ['MUY BAJO', 'BAJO', 'MEDIO', 'ALTO', 'MUY ALTO']
+CORTES_FERTILIDAD = (0.3, 0.5, 0.6, 0.7)
+FRACCIONES_RANGO = (0.2, 0.4, 0.6, 0.8)
+
+def _construir_tabla_cortes():
+    """Arma la tabla (cultivo, nutriente, análisis) -> (cortes, categorías)"""
+    tabla = {}
+    cortes_fertilidad = np.array(CORTES_FERTILIDAD)
+    for cultivo, params in PARAMETROS_CULTIVOS.items():
+        for nutriente, (clave, _) in NUTRIENTES.items():
+            rango = params[clave]['max'] - params[clave]['min']
+            cortes_npk = params[clave]['min'] + rango * np.array(FRACCIONES_RANGO)
+            tabla[(cultivo, nutriente, 'FERTILIDAD ACTUAL')] = (cortes_fertilidad, CATEGORIAS_FERTILIDAD)
+            tabla[(cultivo, nutriente, 'RECOMENDACIONES NPK')] = (cortes_npk, CATEGORIAS_RECOMENDACION)
+    return tabla
+
+TABLA_CORTES = _construir_tabla_cortes()
+
+def codigos_categorias(valores, cortes):
+    """Código de categoría de cada valor: cantidad de cortes superados; NaN -> -1 (sin dato)
+
+    valor < corte[i] -> categoría i, igual que la cadena if/elif original. Los cortes se comparan en la
+    precisión de los valores (float32 en TablaZonas) y van en el último eje, alineados con los valores.
+    """
+    valores = np.asarray(valores)
+    if valores.dtype.kind != 'f':
+        valores = valores.astype(float)
+    cortes = np.asarray(cortes, dtype=valores.dtype)
+    codigos = np.zeros(valores.shape, dtype=np.int8)
+    for i in range(cortes.shape[-1]):
+        codigos += valores >= cortes[..., i, np.newaxis]
+    codigos[np.isnan(valores)] = -1
+    return codigos
+
+def _resumen_categorias(codigos, valores, categorias, areas=None):
+    """Zonas, área y valor promedio por categoría a partir de los códigos de cada zona (sin dato no cuenta)"""
+    n_categorias = len(categorias)
+    validos = codigos >= 0
+    zonas = np.bincount(codigos[validos], minlength=n_categorias)
+    suma = np.bincount(codigos[validos], weights=np.asarray(valores)[validos], minlength=n_categorias)
+    if areas is not None:
+        area = np.bincount(codigos[validos], weights=np.asarray(areas, dtype=float)[validos], minlength=n_categorias)
+    else:
+        area = np.zeros(n_categorias)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        promedio = suma / zonas
+    
+    return pd.DataFrame({
+        'zonas': zonas,
+        'area_ha': area,
+        'valor_promedio': promedio
+    }, index=pd.Index(categorias, name='categoria'))
+
+# ===== TABLA COLUMNAR DE RESULTADOS POR ZONA =====
+class TablaZonas:
+    """Resultados por zona en columnas float32 contiguas, alineadas al índice de zonas"""
+    
+    def __init__(self, index):
+        self.index = index
+        self.columnas = {}
+    
+    def __len__(self):
+        return len(self.index)
+    
+    def __contains__(self, nombre):
+        return nombre in self.columnas
+    
+    def __getitem__(self, nombre):
+        return self.columnas[nombre]
+    
+    def agregar(self, columnas):
+        """Agrega columnas (dict, DataFrame o Series) convirtiéndolas a float32"""
+        for nombre, valores in columnas.items():
+            valores = np.ascontiguousarray(valores, dtype=np.float32)
+            if valores.shape != (len(self.index),):
+                raise ValueError(f"La columna '{nombre}' tiene {valores.shape[0]} valores para {len(self.index)} zonas")
+            self.columnas[nombre] = valores
+        return self
+    
+    def alias(self, nombre, origen):
+        """Expone una columna existente con otro nombre sin copiarla"""
+        self.columnas[nombre] = self.columnas[origen]
+        return self
+    
+    def a_dataframe(self):
+        """DataFrame que comparte memoria con las columnas de la tabla"""
+        return pd.DataFrame(self.columnas, index=self.index, copy=False)
+    
+    def adjuntar(self, gdf):
+        """Devuelve el GeoDataFrame con todas las columnas de la tabla, en bloque y sin copias"""
+        geometria = gdf.geometry.name
+        datos = {col: gdf[col].to_numpy() for col in gdf.columns
+                 if col != geometria and col not in self.columnas}
+        datos.update(self.columnas)
+        datos[geometria] = gdf.geometry.values
+        return gdf.__class__(datos, index=gdf.index, geometry=geometria, crs=gdf.crs, copy=False)
+
+# ===== TENSOR CULTIVO × NUTRIENTE × ANÁLISIS =====
+TIPOS_ANALISIS = ('FERTILIDAD ACTUAL', 'RECOMENDACIONES NPK')
+CATEGORIAS_ANALISIS = {'FERTILIDAD ACTUAL': CATEGORIAS_FERTILIDAD, 'RECOMENDACIONES NPK': CATEGORIAS_RECOMENDACION}
+
+class TensorResultados:
+    """Resultados de todas las combinaciones cultivo × nutriente × análisis de una parcela en arrays apilados
+
+    valores y codigos tienen forma (cultivos, nutrientes, análisis, zonas): el valor del mapa (npk_actual o
+    la dosis del nutriente) y su categoría. indices guarda cada índice como (cultivos, zonas). Cambiar de
+    combinación es indexar estos arrays, sin recalcular.
+    """
+    
+    def __init__(self, index, cultivos, indices, recomendaciones, areas, fraccion_valida=None):
+        self.index = index
+        self.cultivos = tuple(cultivos)
+        self.nutrientes = tuple(NUTRIENTES)
+        self.indices = {col: np.ascontiguousarray(valores, dtype=np.float32) for col, valores in indices.items()}
+        self.areas = np.ascontiguousarray(areas, dtype=np.float32)
+        self.fraccion_valida = fraccion_valida
+        
+        # Valor de cada combinación: npk_actual no depende del nutriente; la dosis sí
+        n_zonas = len(index)
+        self.valores = np.empty((len(self.cultivos), len(self.nutrientes), len(TIPOS_ANALISIS), n_zonas),
+                                dtype=np.float32)
+        self.valores[:, :, 0] = self.indices['npk_actual'][:, None]
+        for j, (_, columna) in enumerate(NUTRIENTES.values()):
+            self.valores[:, j, 1] = recomendaciones[columna]
+        
+        # Categorías de todas las combinaciones con los cortes de cada una (NaN: -1, sin dato)
+        cortes = np.array([[[TABLA_CORTES[(cultivo, nutriente, tipo)][0] for tipo in TIPOS_ANALISIS]
+                            for nutriente in self.nutrientes] for cultivo in self.cultivos])
+        self.codigos = codigos_categorias(self.valores, cortes)
+    
+    def __len__(self):
+        return len(self.index)
+    
+    def posicion(self, cultivo, nutriente, analisis_tipo):
+        """Índices (cultivo, nutriente, análisis) de la combinación en los arrays apilados"""
+        if cultivo not in self.cultivos:
+            raise KeyError(f"El cultivo {cultivo} no fue precalculado")
+        return self.cultivos.index(cultivo), self.nutrientes.index(nutriente), TIPOS_ANALISIS.index(analisis_tipo)
+    
+    def tabla(self, cultivo, nutriente, analisis_tipo):
+        """(TablaZonas, columna del valor) de una combinación, con vistas de los arrays apilados"""
+        i = self.posicion(cultivo, nutriente, analisis_tipo)[0]
+        tabla_zonas = TablaZonas(self.index)
+        tabla_zonas.agregar({'area_ha': self.areas})
+        tabla_zonas.agregar({col: valores[i] for col, valores in self.indices.items()})
+        if self.fraccion_valida is not None:
+            tabla_zonas.agregar({'fraccion_valida': self.fraccion_valida})
+        tabla_zonas.agregar({columna: self.valores[i, n, 1] for n, (_, columna) in enumerate(NUTRIENTES.values())})
+        if analisis_tipo == "RECOMENDACIONES NPK":
+            tabla_zonas.alias('valor_recomendado', NUTRIENTES[nutriente][1])
+            return tabla_zonas, 'valor_recomendado'
+        return tabla_zonas, 'npk_actual'
+    
+    def categorizar(self, cultivo, nutriente, analisis_tipo):
+        """(etiquetas, resumen) de una combinación con los códigos ya calculados (NaN: sin categoría)"""
+        i, j, k = self.posicion(cultivo, nutriente, analisis_tipo)
+        categorias = CATEGORIAS_ANALISIS[analisis_tipo]
+        codigos = self.codigos[i, j, k].astype(np.intp)
+        resumen = _resumen_categorias(codigos, self.valores[i, j, k], categorias, self.areas)
+        return pd.Categorical.from_codes(codigos, categories=categorias), resumen
@@ -1,19 +1,16 @@
 import streamlit as st
-import geopandas as gpd
 import pandas as pd
 import numpy as np
-import tempfile
 import os
-import zipfile
 from datetime import datetime, timedelta
-import matplotlib.pyplot as plt
-import matplotlib.patches as mpatches
-from matplotlib.colors import LinearSegmentedColormap
 import io
-from shapely.geometry import Polygon
-import math
-import requests
-import base64
+
+from analisis_gee import PARAMETROS_CULTIVOS
+from zonificacion import VARIANZA_MAXIMA
+from renderizado import DPI_MAPA
+from ingesta import cargar_parcela
+from superficie import calcular_superficie
+from nucleo import MEMORIA_ETAPAS, Reporte, credenciales_sentinel, ejecutar_analisis, seleccionar_combinacion
 
 # CONFIGURACIÓN DE PÁGINA - DEBE SER LO PRIMERO
 st.set_page_config(
@@ -55,28 +52,12 @@ SATELITES_DISPONIBLES = {
 
 # ===== VERIFICACIÓN DE CREDENCIALES SENTINEL HUB =====
 def verificar_credenciales_sentinel():
-    """Verificar y mostrar estado de las credenciales de Sentinel Hub"""
+    """Credenciales de Sentinel Hub desde st.secrets, o None si faltan (mismas claves que el núcleo)"""
     try:
-        if hasattr(st, 'secrets'):
-            credenciales_faltantes = []
-            
-            if 'SENTINELHUB_INSTANCE_ID' not in st.secrets or not st.secrets['SENTINELHUB_INSTANCE_ID']:
-                credenciales_faltantes.append('SENTINELHUB_INSTANCE_ID')
-            if 'SENTINELHUB_CLIENT_ID' not in st.secrets or not st.secrets['SENTINELHUB_CLIENT_ID']:
-                credenciales_faltantes.append('SENTINELHUB_CLIENT_ID') 
-            if 'SENTINELHUB_CLIENT_SECRET' not in st.secrets or not st.secrets['SENTINELHUB_CLIENT_SECRET']:
-                credenciales_faltantes.append('SENTINELHUB_CLIENT_SECRET')
-            
-            if credenciales_faltantes:
-                return False
-            else:
-                return True
-        else:
-            return False
-            
+        return credenciales_sentinel(st.secrets)
     except Exception as e:
         st.error(f"❌ Error verificando credenciales: {str(e)}")
-        return False
+        return None
 
 def tiene_credenciales_usgs():
     """Verificar si existen credenciales USGS"""
@@ -88,57 +69,30 @@ def tiene_credenciales_usgs():
     except:
         return False
 
-# ===== CONFIGURACIÓN =====
-# PARÁMETROS GEE POR CULTIVO
-PARAMETROS_CULTIVOS = {
-    'TRIGO': {
-        'NITROGENO': {'min': 120, 'max': 180},
-        'FOSFORO': {'min': 40, 'max': 60},
-        'POTASIO': {'min': 80, 'max': 120},
-        'MATERIA_ORGANICA_OPTIMA': 3.5,
-        'HUMEDAD_OPTIMA': 0.25,
-        'NDVI_OPTIMO': 0.7,
-        'NDRE_OPTIMO': 0.4
-    },
-    'MAÍZ': {
-        'NITROGENO': {'min': 150, 'max': 220},
-        'FOSFORO': {'min': 50, 'max': 70},
-        'POTASIO': {'min': 100, 'max': 140},
-        'MATERIA_ORGANICA_OPTIMA': 4.0,
-        'HUMEDAD_OPTIMA': 0.3,
-        'NDVI_OPTIMO': 0.75,
-        'NDRE_OPTIMO': 0.45
-    },
-    'SOJA': {
-        'NITROGENO': {'min': 80, 'max': 120},
-        'FOSFORO': {'min': 35, 'max': 50},
-        'POTASIO': {'min': 90, 'max': 130},
-        'MATERIA_ORGANICA_OPTIMA': 3.8,
-        'HUMEDAD_OPTIMA': 0.28,
-        'NDVI_OPTIMO': 0.65,
-        'NDRE_OPTIMO': 0.35
-    },
-    'SORGO': {
-        'NITROGENO': {'min': 100, 'max': 150},
-        'FOSFORO': {'min': 30, 'max': 45},
-        'POTASIO': {'min': 70, 'max': 100},
-        'MATERIA_ORGANICA_OPTIMA': 3.0,
-        'HUMEDAD_OPTIMA': 0.22,
-        'NDVI_OPTIMO': 0.6,
-        'NDRE_OPTIMO': 0.3
-    },
-    'GIRASOL': {
-        'NITROGENO': {'min': 90, 'max': 130},
-        'FOSFORO': {'min': 25, 'max': 40},
-        'POTASIO': {'min': 80, 'max': 110},
-        'MATERIA_ORGANICA_OPTIMA': 3.2,
-        'HUMEDAD_OPTIMA': 0.26,
-        'NDVI_OPTIMO': 0.55,
-        'NDRE_OPTIMO': 0.25
-    }
-}
+# ===== ADAPTADOR DE PROGRESO =====
+class ReporteStreamlit(Reporte):
+    """Mensajes del núcleo de cálculo como elementos de Streamlit"""
+    
+    def seccion(self, titulo):
+        st.subheader(titulo)
+    
+    def info(self, mensaje):
+        st.info(mensaje)
+    
+    def exito(self, mensaje):
+        st.success(mensaje)
+    
+    def advertencia(self, mensaje):
+        st.warning(mensaje)
+    
+    def error(self, mensaje):
+        st.error(mensaje)
+    
+    def etapa(self, mensaje):
+        return st.spinner(mensaje)
 
-# ICONOS Y COLORES POR CULTIVO
+# ===== CONFIGURACIÓN =====
+# ICONOS POR CULTIVO
 ICONOS_CULTIVOS = {
     'TRIGO': '🌾',
     'MAÍZ': '🌽', 
@@ -147,22 +101,6 @@ ICONOS_CULTIVOS = {
     'GIRASOL': '🌻'
 }
 
-COLORES_CULTIVOS = {
-    'TRIGO': '#FFD700',
-    'MAÍZ': '#FFA500',
-    'SOJA': '#8B4513',
-    'SORGO': '#D2691E',
-    'GIRASOL': '#FFD700'
-}
-
-# PALETAS GEE MEJORADAS
-PALETAS_GEE = {
-    'FERTILIDAD': ['#d73027', '#f46d43', '#fdae61', '#fee08b', '#d9ef8b', '#a6d96a', '#66bd63', '#1a9850', '#006837'],
-    'NITROGENO': ['#00ff00', '#80ff00', '#ffff00', '#ff8000', '#ff0000'],
-    'FOSFORO': ['#0000ff', '#4040ff', '#8080ff', '#c0c0ff', '#ffffff'],
-    'POTASIO': ['#4B0082', '#6A0DAD', '#8A2BE2', '#9370DB', '#D8BFD8']
-}
-
 # ===== SIDEBAR =====
 with st.sidebar:
     st.header("⚙️ Configuración")
@@ -175,6 +113,13 @@ with st.sidebar:
     
     nutriente = st.selectbox("Nutriente:", ["NITRÓGENO", "FÓSFORO", "POTASIO"])
     
+    # Todas las combinaciones en un tensor: cambiar cultivo, nutriente o análisis no recalcula
+    comparacion_instantanea = st.checkbox(
+        "⚡ Comparación instantánea de cultivos",
+        help="Calcula de una vez los 5 cultivos × 3 nutrientes × 2 análisis; después, cambiar estas "
+             "opciones solo vuelve a dibujar los resultados"
+    )
+    
     # NUEVO: Selector de satélite
     st.subheader("🛰️ Fuente de Datos Satelitales")
     satelite_seleccionado = st.selectbox(
@@ -216,22 +161,75 @@ with st.sidebar:
     fecha_fin = st.date_input("Fecha fin", datetime.now())
     fecha_inicio = st.date_input("Fecha inicio", datetime.now() - timedelta(days=30))
     
+    # Escenas espejadas en disco: lectura por ventana, sin descargas
+    directorio_escenas = None
+    if satelite_seleccionado in ("SENTINEL-2", "LANDSAT-8"):
+        directorio_escenas = st.text_input(
+            "Directorio de escenas locales (opcional):",
+            value=os.environ.get('ANALIZADOR_ESCENAS_DIR', ''),
+            help="Carpeta con escenas Sentinel-2 L2A o Landsat Collection 2 L2 (GeoTIFF/JP2)"
+        ) or None
+    
+    # Serie temporal: compuesto por píxel de todas las fechas del período
+    estadistico_serie = None
+    if satelite_seleccionado in ("SENTINEL-2", "LANDSAT-8"):
+        if st.checkbox("Serie temporal (compuesto de todas las fechas)"):
+            estadistico_serie = st.selectbox(
+                "Compuesto:", ["maximo", "media", "mediana"],
+                format_func=lambda e: {'maximo': 'Máximo', 'media': 'Media', 'mediana': 'Mediana'}[e]
+            )
+    
+    # Índices cuantizados en el servidor: menos bytes por descarga a cambio de precisión
+    tipo_muestra = 'FLOAT32'
+    if satelite_seleccionado == "SENTINEL-2":
+        tipo_muestra = st.selectbox(
+            "Precisión de descarga (Sentinel Hub):", ['FLOAT32', 'INT16', 'UINT8'],
+            format_func=lambda t: {'FLOAT32': 'Completa (FLOAT32)', 'INT16': 'Media (INT16, 2x menos datos)',
+                                   'UINT8': 'Baja (UINT8, 4x menos datos)'}[t]
+        )
+    
     st.subheader("🎯 División de Parcela")
-    n_divisiones = st.slider("Número de zonas de manejo:", min_value=16, max_value=48, value=32)
+    modo_division = st.radio("Dividir por:", ["Número de zonas", "Tamaño de zona (m)", "Clústeres k-means",
+                                              "Quadtree por variabilidad"], horizontal=True)
+    n_clases_kmeans = None
+    ancho_aplicacion_m = None
+    varianza_maxima = VARIANZA_MAXIMA
+    if modo_division == "Número de zonas":
+        n_divisiones = st.slider("Número de zonas de manejo:", min_value=16, max_value=48, value=32)
+        tamano_zona_m = None
+    elif modo_division == "Tamaño de zona (m)":
+        tamano_zona_m = st.slider("Lado de la zona (m):", min_value=20, max_value=500, value=100, step=10)
+        n_divisiones = None
+    else:
+        # Zonas según la variabilidad de los píxeles; la grilla queda como respaldo sin ráster
+        if modo_division == "Clústeres k-means":
+            n_clases_kmeans = st.slider("Clases de manejo (k-means):", min_value=2, max_value=8, value=4)
+        else:
+            ancho_aplicacion_m = st.slider("Ancho de aplicación (m):", min_value=10, max_value=60, value=20, step=2)
+            desvio_maximo = st.slider("Desvío máximo del índice por zona:", min_value=0.02, max_value=0.15,
+                                      value=float(np.sqrt(VARIANZA_MAXIMA)), step=0.01)
+            varianza_maxima = desvio_maximo ** 2
+        n_divisiones = st.slider("Zonas de la grilla de respaldo:", min_value=16, max_value=48, value=32)
+        tamano_zona_m = None
+    
+    st.subheader("🗺️ Mapa")
+    dpi_mapa = st.select_slider("Resolución del mapa (DPI):", options=[100, 150, 200, 300], value=DPI_MAPA)
     
     st.subheader("📤 Subir Parcela")
-    uploaded_zip = st.file_uploader("Subir ZIP con shapefile de tu parcela", type=['zip'])
+    uploaded_zip = st.file_uploader("Subir ZIP con shapefile, GeoPackage o GeoJSON de tu parcela",
+                                    type=['zip', 'gpkg', 'geojson', 'json'])
     
     # Configuración Satelital Mejorada
     st.subheader("🔑 Configuración Satelital")
     with st.expander("Estado de Credenciales"):
         # Verificar Sentinel Hub
         if satelite_seleccionado == "SENTINEL-2":
-            if verificar_credenciales_sentinel():
+            credenciales = verificar_credenciales_sentinel()
+            if credenciales:
                 st.success("✅ Credenciales Sentinel Hub configuradas")
                 # Mostrar información de las credenciales (ocultando parte por seguridad)
-                instance_id = st.secrets['SENTINELHUB_INSTANCE_ID']
-                client_id = st.secrets['SENTINELHUB_CLIENT_ID']
+                instance_id = credenciales['instance_id']
+                client_id = credenciales['client_id']
                 st.info(f"**Instance ID:** {instance_id[:8]}...{instance_id[-8:]}")
                 st.info(f"**Client ID:** {client_id[:8]}...{client_id[-8:]}")
             else:
@@ -260,354 +258,31 @@ with st.sidebar:
         else:
             st.info("🔬 Usando datos simulados - No se requieren credenciales")
 
-# ===== FUNCIONES AUXILIARES =====
-def calcular_superficie(gdf):
-    try:
-        if gdf.crs and gdf.crs.is_geographic:
-            area_m2 = gdf.geometry.area * 10000000000
-        else:
-            area_m2 = gdf.geometry.area
-        return area_m2 / 10000
-    except:
-        return gdf.geometry.area / 10000
-
-def dividir_parcela_en_zonas(gdf, n_zonas):
-    if len(gdf) == 0:
-        return gdf
-    
-    parcela_principal = gdf.iloc[0].geometry
-    bounds = parcela_principal.bounds
-    minx, miny, maxx, maxy = bounds
-    
-    sub_poligonos = []
-    
-    n_cols = math.ceil(math.sqrt(n_zonas))
-    n_rows = math.ceil(n_zonas / n_cols)
-    
-    width = (maxx - minx) / n_cols
-    height = (maxy - miny) / n_rows
-    
-    for i in range(n_rows):
-        for j in range(n_cols):
-            if len(sub_poligonos) >= n_zonas:
-                break
-                
-            cell_minx = minx + (j * width)
-            cell_maxx = minx + ((j + 1) * width)
-            cell_miny = miny + (i * height)
-            cell_maxy = miny + ((i + 1) * height)
-            
-            cell_poly = Polygon([
-                (cell_minx, cell_miny),
-                (cell_maxx, cell_miny),
-                (cell_maxx, cell_maxy),
-                (cell_minx, cell_maxy)
-            ])
-            
-            intersection = parcela_principal.intersection(cell_poly)
-            if not intersection.is_empty and intersection.area > 0:
-                sub_poligonos.append(intersection)
-    
-    if sub_poligonos:
-        nuevo_gdf = gpd.GeoDataFrame({
-            'id_zona': range(1, len(sub_poligonos) + 1),
-            'geometry': sub_poligonos
-        }, crs=gdf.crs)
-        return nuevo_gdf
-    else:
-        return gdf
-
-# ===== FUNCIONES PARA DATOS SATELITALES =====
-def descargar_datos_landsat8(gdf, fecha_inicio, fecha_fin, indice='NDVI'):
-    """Descargar y procesar datos de Landsat 8"""
-    try:
-        # Simulación de datos Landsat 8 (en producción conectarías con USGS API)
-        st.info(f"🔍 Buscando escenas Landsat 8...")
-        
-        # Datos simulados para demostración
-        datos_simulados = {
-            'indice': indice,
-            'valor_promedio': 0.65 + np.random.normal(0, 0.1),
-            'fuente': 'Landsat-8',
-            'fecha': datetime.now().strftime('%Y-%m-%d'),
-            'id_escena': f"LC08_{np.random.randint(1000000, 9999999)}",
-            'cobertura_nubes': f"{np.random.randint(0, 15)}%",
-            'resolucion': '30m'
-        }
-        
-        st.success(f"✅ Escena Landsat 8 encontrada: {datos_simulados['id_escena']}")
-        st.info(f"☁️ Cobertura de nubes: {datos_simulados['cobertura_nubes']}")
-        
-        return datos_simulados
-        
-    except Exception as e:
-        st.error(f"❌ Error procesando Landsat 8: {str(e)}")
-        return None
-
-def descargar_datos_sentinel2(gdf, fecha_inicio, fecha_fin, indice='NDVI'):
-    """Descargar y procesar datos de Sentinel-2"""
-    try:
-        # Simulación de datos Sentinel-2 (en producción conectarías con Sentinel Hub)
-        st.info(f"🔍 Buscando escenas Sentinel-2...")
-        
-        # Datos simulados para demostración
-        datos_simulados = {
-            'indice': indice,
-            'valor_promedio': 0.72 + np.random.normal(0, 0.08),
-            'fuente': 'Sentinel-2',
-            'fecha': datetime.now().strftime('%Y-%m-%d'),
-            'id_escena': f"S2A_{np.random.randint(1000000, 9999999)}",
-            'cobertura_nubes': f"{np.random.randint(0, 10)}%",
-            'resolucion': '10m'
-        }
-        
-        st.success(f"✅ Escena Sentinel-2 encontrada: {datos_simulados['id_escena']}")
-        st.info(f"☁️ Cobertura de nubes: {datos_simulados['cobertura_nubes']}")
-        
-        return datos_simulados
-        
-    except Exception as e:
-        st.error(f"❌ Error procesando Sentinel-2: {str(e)}")
-        return None
-
-def generar_datos_simulados(gdf, cultivo, indice='NDVI'):
-    """Generar datos simulados para demostración"""
-    st.info("🔬 Generando datos simulados...")
-    
-    # Datos simulados basados en el cultivo
-    datos_simulados = {
-        'indice': indice,
-        'valor_promedio': PARAMETROS_CULTIVOS[cultivo]['NDVI_OPTIMO'] * 0.8 + np.random.normal(0, 0.1),
-        'fuente': 'Simulación',
-        'fecha': datetime.now().strftime('%Y-%m-%d'),
-        'resolucion': '10m'
-    }
-    
-    st.success("✅ Datos simulados generados")
-    return datos_simulados
-
 # ===== FUNCIONES DE ANÁLISIS GEE =====
-def calcular_indices_satelitales_gee(gdf, cultivo, datos_satelitales):
-    """Implementa la metodología completa de Google Earth Engine adaptada por cultivo"""
-    
-    n_poligonos = len(gdf)
-    resultados = []
-    
-    # Obtener centroides para gradiente espacial
-    gdf_centroids = gdf.copy()
-    gdf_centroids['centroid'] = gdf_centroids.geometry.centroid
-    gdf_centroids['x'] = gdf_centroids.centroid.x
-    gdf_centroids['y'] = gdf_centroids.centroid.y
-    
-    x_coords = gdf_centroids['x'].tolist()
-    y_coords = gdf_centroids['y'].tolist()
-    
-    x_min, x_max = min(x_coords), max(x_coords)
-    y_min, y_max = min(y_coords), max(y_coords)
-    
-    # Parámetros específicos del cultivo
-    params = PARAMETROS_CULTIVOS[cultivo]
-    
-    # Usar datos satelitales reales si están disponibles
-    valor_base_satelital = datos_satelitales.get('valor_promedio', 0.6) if datos_satelitales else 0.6
-    
-    for idx, row in gdf_centroids.iterrows():
-        # Normalizar posición para simular variación espacial
-        x_norm = (row['x'] - x_min) / (x_max - x_min) if x_max != x_min else 0.5
-        y_norm = (row['y'] - y_min) / (y_max - y_min) if y_max != y_min else 0.5
-        
-        patron_espacial = (x_norm * 0.6 + y_norm * 0.4)
-        
-        # 1. MATERIA ORGÁNICA - Adaptada por cultivo
-        base_mo = params['MATERIA_ORGANICA_OPTIMA'] * 0.7
-        variabilidad_mo = patron_espacial * (params['MATERIA_ORGANICA_OPTIMA'] * 0.6)
-        materia_organica = base_mo + variabilidad_mo + np.random.normal(0, 0.2)
-        materia_organica = max(0.5, min(8.0, materia_organica))
-        
-        # 2. HUMEDAD SUELO - Adaptada por requerimientos del cultivo
-        base_humedad = params['HUMEDAD_OPTIMA'] * 0.8
-        variabilidad_humedad = patron_espacial * (params['HUMEDAD_OPTIMA'] * 0.4)
-        humedad_suelo = base_humedad + variabilidad_humedad + np.random.normal(0, 0.05)
-        humedad_suelo = max(0.1, min(0.8, humedad_suelo))
-        
-        # 3. NDVI - Específico por cultivo, influenciado por datos satelitales reales
-        ndvi_base = valor_base_satelital * 0.8
-        ndvi_variacion = patron_espacial * (valor_base_satelital * 0.4)
-        ndvi = ndvi_base + ndvi_variacion + np.random.normal(0, 0.06)
-        ndvi = max(0.1, min(0.9, ndvi))
-        
-        # 4. NDRE - Específico por cultivo
-        ndre_base = params['NDRE_OPTIMO'] * 0.7
-        ndre_variacion = patron_espacial * (params['NDRE_OPTIMO'] * 0.4)
-        ndre = ndre_base + ndre_variacion + np.random.normal(0, 0.04)
-        ndre = max(0.05, min(0.7, ndre))
-        
-        # 5. ÍNDICE NPK ACTUAL - Fórmula adaptada por cultivo
-        npk_actual = (ndvi * 0.4) + (ndre * 0.3) + ((materia_organica / 8) * 0.2) + (humedad_suelo * 0.1)
-        npk_actual = max(0, min(1, npk_actual))
-        
-        resultados.append({
-            'materia_organica': round(materia_organica, 2),
-            'humedad_suelo': round(humedad_suelo, 3),
-            'ndvi': round(ndvi, 3),
-            'ndre': round(ndre, 3),
-            'npk_actual': round(npk_actual, 3)
-        })
-    
-    return resultados
-
-def calcular_recomendaciones_npk_gee(indices, nutriente, cultivo):
-    """Calcula recomendaciones NPK basadas en la metodología GEE específica por cultivo"""
-    recomendaciones = []
-    params = PARAMETROS_CULTIVOS[cultivo]
-    
-    for idx in indices:
-        ndre = idx['ndre']
-        materia_organica = idx['materia_organica']
-        humedad_suelo = idx['humedad_suelo']
-        ndvi = idx['ndvi']
-        
-        if nutriente == "NITRÓGENO":
-            # Fórmula GEE adaptada: ndre y ndvi para recomendación de N
-            factor_n = ((1 - ndre) * 0.6 + (1 - ndvi) * 0.4)
-            n_recomendado = (factor_n * 
-                           (params['NITROGENO']['max'] - params['NITROGENO']['min']) + 
-                           params['NITROGENO']['min'])
-            n_recomendado = max(params['NITROGENO']['min'] * 0.8, 
-                              min(params['NITROGENO']['max'] * 1.2, n_recomendado))
-            recomendaciones.append(round(n_recomendado, 1))
-            
-        elif nutriente == "FÓSFORO":
-            # Fórmula GEE: materia orgánica y humedad para recomendación de P
-            factor_p = ((1 - (materia_organica / 8)) * 0.7 + (1 - humedad_suelo) * 0.3)
-            p_recomendado = (factor_p * 
-                           (params['FOSFORO']['max'] - params['FOSFORO']['min']) + 
-                           params['FOSFORO']['min'])
-            p_recomendado = max(params['FOSFORO']['min'] * 0.8, 
-                              min(params['FOSFORO']['max'] * 1.2, p_recomendado))
-            recomendaciones.append(round(p_recomendado, 1))
-            
-        else:  # POTASIO
-            # Fórmula GEE: múltiples factores para recomendación de K
-            factor_k = ((1 - ndre) * 0.4 + (1 - humedad_suelo) * 0.4 + (1 - (materia_organica / 8)) * 0.2)
-            k_recomendado = (factor_k * 
-                           (params['POTASIO']['max'] - params['POTASIO']['min']) + 
-                           params['POTASIO']['min'])
-            k_recomendado = max(params['POTASIO']['min'] * 0.8, 
-                              min(params['POTASIO']['max'] * 1.2, k_recomendado))
-            recomendaciones.append(round(k_recomendado, 1))
-    
-    return recomendaciones
-
-def crear_mapa_gee(gdf, nutriente, analisis_tipo, cultivo, satelite):
-    """Crea mapa con la metodología y paletas de Google Earth Engine"""
+def crear_mapa_gee(opciones, previos=None):
+    """Mapa con la metodología y paletas de Google Earth Engine (etapa 'mapa' memoizada); devuelve (PNG, registro)"""
     try:
-        fig, ax = plt.subplots(1, 1, figsize=(14, 10))
-        
-        # Seleccionar paleta según el análisis
-        if analisis_tipo == "FERTILIDAD ACTUAL":
-            cmap = LinearSegmentedColormap.from_list('fertilidad_gee', PALETAS_GEE['FERTILIDAD'])
-            vmin, vmax = 0, 1
-            columna = 'npk_actual'
-            titulo_sufijo = 'Índice NPK Actual (0-1)'
-        else:
-            if nutriente == "NITRÓGENO":
-                cmap = LinearSegmentedColormap.from_list('nitrogeno_gee', PALETAS_GEE['NITROGENO'])
-                vmin, vmax = (PARAMETROS_CULTIVOS[cultivo]['NITROGENO']['min'] * 0.8, 
-                            PARAMETROS_CULTIVOS[cultivo]['NITROGENO']['max'] * 1.2)
-            elif nutriente == "FÓSFORO":
-                cmap = LinearSegmentedColormap.from_list('fosforo_gee', PALETAS_GEE['FOSFORO'])
-                vmin, vmax = (PARAMETROS_CULTIVOS[cultivo]['FOSFORO']['min'] * 0.8, 
-                            PARAMETROS_CULTIVOS[cultivo]['FOSFORO']['max'] * 1.2)
-            else:
-                cmap = LinearSegmentedColormap.from_list('potasio_gee', PALETAS_GEE['POTASIO'])
-                vmin, vmax = (PARAMETROS_CULTIVOS[cultivo]['POTASIO']['min'] * 0.8, 
-                            PARAMETROS_CULTIVOS[cultivo]['POTASIO']['max'] * 1.2)
-            
-            columna = 'valor_recomendado'
-            titulo_sufijo = f'Recomendación {nutriente} (kg/ha)'
-        
-        # Plotear cada polígono
-        for idx, row in gdf.iterrows():
-            valor = row[columna]
-            valor_norm = (valor - vmin) / (vmax - vmin)
-            valor_norm = max(0, min(1, valor_norm))
-            color = cmap(valor_norm)
-            
-            gdf.iloc[[idx]].plot(ax=ax, color=color, edgecolor='black', linewidth=1.5)
-            
-            # Etiqueta con valor
-            centroid = row.geometry.centroid
-            ax.annotate(f"Z{row['id_zona']}\n{valor:.1f}", (centroid.x, centroid.y), 
-                       xytext=(5, 5), textcoords="offset points", 
-                       fontsize=8, color='black', weight='bold',
-                       bbox=dict(boxstyle="round,pad=0.3", facecolor='white', alpha=0.9))
-        
-        # Configuración del mapa
-        info_satelite = SATELITES_DISPONIBLES.get(satelite, SATELITES_DISPONIBLES['DATOS_SIMULADOS'])
-        ax.set_title(f'{ICONOS_CULTIVOS[cultivo]} ANÁLISIS GEE - {cultivo}\n'
-                    f'{info_satelite["icono"]} {info_satelite["nombre"]} - {analisis_tipo}\n'
-                    f'{titulo_sufijo}', 
-                    fontsize=16, fontweight='bold', pad=20)
-        
-        ax.set_xlabel('Longitud')
-        ax.set_ylabel('Latitud')
-        ax.grid(True, alpha=0.3)
-        
-        # Barra de colores
-        sm = plt.cm.ScalarMappable(cmap=cmap, norm=plt.Normalize(vmin=vmin, vmax=vmax))
-        sm.set_array([])
-        cbar = plt.colorbar(sm, ax=ax, shrink=0.8)
-        cbar.set_label(titulo_sufijo, fontsize=12, fontweight='bold')
-        
-        plt.tight_layout()
-        
-        # Convertir a imagen
-        buf = io.BytesIO()
-        plt.savefig(buf, format='png', dpi=150, bbox_inches='tight')
-        buf.seek(0)
-        plt.close()
-        
-        return buf
+        resultados, registro = ejecutar_analisis(opciones, ('mapa',), MEMORIA_ETAPAS, previos=previos)
+        return io.BytesIO(resultados['mapa']), registro
         
     except Exception as e:
         st.error(f"❌ Error creando mapa GEE: {str(e)}")
-        return None
+        return None, []
 
-def categorizar_gee(valor, nutriente, analisis_tipo, cultivo):
-    """Categoriza los valores para recomendaciones específicas por cultivo"""
-    params = PARAMETROS_CULTIVOS[cultivo]
-    
-    if analisis_tipo == "FERTILIDAD ACTUAL":
-        if valor < 0.3: return "MUY BAJA"
-        elif valor < 0.5: return "BAJA"
-        elif valor < 0.6: return "MEDIA"
-        elif valor < 0.7: return "BUENA"
-        else: return "ÓPTIMA"
-    else:
-        if nutriente == "NITRÓGENO":
-            rango = params['NITROGENO']['max'] - params['NITROGENO']['min']
-            if valor < params['NITROGENO']['min'] + 0.2 * rango: return "MUY BAJO"
-            elif valor < params['NITROGENO']['min'] + 0.4 * rango: return "BAJO"
-            elif valor < params['NITROGENO']['min'] + 0.6 * rango: return "MEDIO"
-            elif valor < params['NITROGENO']['min'] + 0.8 * rango: return "ALTO"
-            else: return "MUY ALTO"
-        elif nutriente == "FÓSFORO":
-            rango = params['FOSFORO']['max'] - params['FOSFORO']['min']
-            if valor < params['FOSFORO']['min'] + 0.2 * rango: return "MUY BAJO"
-            elif valor < params['FOSFORO']['min'] + 0.4 * rango: return "BAJO"
-            elif valor < params['FOSFORO']['min'] + 0.6 * rango: return "MEDIO"
-            elif valor < params['FOSFORO']['min'] + 0.8 * rango: return "ALTO"
-            else: return "MUY ALTO"
-        else:
-            rango = params['POTASIO']['max'] - params['POTASIO']['min']
-            if valor < params['POTASIO']['min'] + 0.2 * rango: return "MUY BAJO"
-            elif valor < params['POTASIO']['min'] + 0.4 * rango: return "BAJO"
-            elif valor < params['POTASIO']['min'] + 0.6 * rango: return "MEDIO"
-            elif valor < params['POTASIO']['min'] + 0.8 * rango: return "ALTO"
-            else: return "MUY ALTO"
+def mostrar_etapas(registro):
+    """Etapas del análisis reutilizadas de la memoria o calculadas en esta corrida"""
+    # El mapa y el CSV se piden aparte: cuenta solo la primera aparición de cada etapa
+    etapas = {}
+    for nombre, acierto, segundos in registro:
+        etapas.setdefault(nombre, (acierto, segundos))
+    reutilizadas = sum(acierto for acierto, _ in etapas.values())
+    with st.expander(f"⚙️ Etapas del análisis: {reutilizadas} de {len(etapas)} reutilizadas"):
+        st.dataframe(pd.DataFrame({
+            'Etapa': list(etapas),
+            'Estado': ['♻️ reutilizada' if acierto else '⚙️ calculada' for acierto, _ in etapas.values()],
+            'Segundos': [round(segundos, 3) for _, segundos in etapas.values()]
+        }), use_container_width=True, hide_index=True)
 
-# FUNCIONES AUXILIARES PARA RECOMENDACIONES ESPECÍFICAS
 def get_fuente_nitrogeno(cultivo):
     fuentes = {
         'TRIGO': 'Nitrato de amonio',
@@ -629,7 +304,11 @@ def get_fertilizante_balanceado(cultivo):
     return fertilizantes.get(cultivo, 'Fertilizante complejo balanceado')
 
 # ===== FUNCIÓN PRINCIPAL DE ANÁLISIS GEE =====
-def analisis_gee_completo(gdf, nutriente, analisis_tipo, n_divisiones, cultivo, satelite, indice, fecha_inicio, fecha_fin):
+def analisis_gee_completo(archivo_parcela, nutriente, analisis_tipo, n_divisiones, cultivo, satelite, indice, fecha_inicio, fecha_fin, tamano_zona_m=None, dpi_mapa=DPI_MAPA, directorio_escenas=None, estadistico_serie=None, n_clases_kmeans=None, ancho_aplicacion_m=None, varianza_maxima=VARIANZA_MAXIMA, tipo_muestra='FLOAT32', todas_las_combinaciones=False, resultado_previo=None):
+    """Ejecuta las etapas del análisis (reutilizando las ya calculadas) y muestra el resultado, o None si falla
+
+    Con resultado_previo (un resultado con todas las combinaciones) solo se elige la combinación del tensor.
+    """
     try:
         info_satelite = SATELITES_DISPONIBLES.get(satelite, SATELITES_DISPONIBLES['DATOS_SIMULADOS'])
         st.header(f"{ICONOS_CULTIVOS[cultivo]} ANÁLISIS {cultivo} - {info_satelite['icono']} {info_satelite['nombre']}")
@@ -647,56 +326,41 @@ def analisis_gee_completo(gdf, nutriente, analisis_tipo, n_divisiones, cultivo,
                 st.metric("Período", f"{fecha_inicio} a {fecha_fin}")
                 st.metric("Cultivo", cultivo)
         
-        # PASO 1: DIVIDIR PARCELA
-        st.subheader("📐 DIVIDIENDO PARCELA EN ZONAS DE MANEJO")
-        with st.spinner("Dividiendo parcela..."):
-            gdf_dividido = dividir_parcela_en_zonas(gdf, n_divisiones)
-        
-        st.success(f"✅ Parcela dividida en {len(gdf_dividido)} zonas")
-        
-        # Calcular áreas
-        areas_ha = calcular_superficie(gdf_dividido)
-        area_total = areas_ha.sum()
-        
-        # PASO 2: OBTENER DATOS SATELITALES
-        st.subheader("🛰️ OBTENIENDO DATOS SATELITALES")
-        datos_satelitales = None
-        
-        if satelite == "SENTINEL-2":
-            datos_satelitales = descargar_datos_sentinel2(gdf, fecha_inicio, fecha_fin, indice)
-        elif satelite == "LANDSAT-8":
-            datos_satelitales = descargar_datos_landsat8(gdf, fecha_inicio, fecha_fin, indice)
-        else:
-            datos_satelitales = generar_datos_simulados(gdf, cultivo, indice)
-        
-        # PASO 3: CALCULAR ÍNDICES GEE ESPECÍFICOS
-        st.subheader("🔬 CALCULANDO ÍNDICES SATELITALES GEE")
-        with st.spinner(f"Ejecutando algoritmos GEE para {cultivo}..."):
-            indices_gee = calcular_indices_satelitales_gee(gdf_dividido, cultivo, datos_satelitales)
-        
-        # Crear dataframe con resultados
-        gdf_analizado = gdf_dividido.copy()
-        gdf_analizado['area_ha'] = areas_ha
-        
-        # Añadir índices GEE
-        for idx, indice in enumerate(indices_gee):
-            for key, value in indice.items():
-                gdf_analizado.loc[gdf_analizado.index[idx], key] = value
-        
-        # PASO 4: CALCULAR RECOMENDACIONES SI ES NECESARIO
-        if analisis_tipo == "RECOMENDACIONES NPK":
-            with st.spinner("Calculando recomendaciones NPK..."):
-                recomendaciones = calcular_recomendaciones_npk_gee(indices_gee, nutriente, cultivo)
-                gdf_analizado['valor_recomendado'] = recomendaciones
-                columna_valor = 'valor_recomendado'
+        # PASO 1-5 como etapas del núcleo de cálculo, memoizadas por el hash de sus entradas: solo se
+        # recalcula lo que depende de las opciones que cambiaron
+        opciones = {
+            'cultivo': cultivo, 'nutriente': nutriente, 'analisis_tipo': analisis_tipo, 'satelite': satelite,
+            'indice': indice, 'fecha_inicio': fecha_inicio, 'fecha_fin': fecha_fin, 'n_divisiones': n_divisiones,
+            'tamano_zona_m': tamano_zona_m, 'n_clases_kmeans': n_clases_kmeans,
+            'ancho_aplicacion_m': ancho_aplicacion_m, 'varianza_maxima': varianza_maxima,
+            'directorio_escenas': directorio_escenas, 'estadistico_serie': estadistico_serie, 'dpi_mapa': dpi_mapa,
+            'tipo_muestra': tipo_muestra,
+            'nombre_parcela': archivo_parcela.name, 'datos_parcela': archivo_parcela.getvalue(),
+            'credenciales': verificar_credenciales_sentinel(),
+            'todas_las_combinaciones': todas_las_combinaciones,
+            'titulo_mapa': (f'{ICONOS_CULTIVOS[cultivo]} ANÁLISIS GEE - {cultivo}\n'
+                            f'{info_satelite["icono"]} {info_satelite["nombre"]} - {analisis_tipo}')
+        }
+        if resultado_previo is not None:
+            resultado, registro = seleccionar_combinacion(resultado_previo, cultivo, nutriente, analisis_tipo), []
         else:
-            columna_valor = 'npk_actual'
-        
-        # PASO 5: CATEGORIZAR PARA RECOMENDACIONES ESPECÍFICAS POR CULTIVO
-        gdf_analizado['categoria'] = [
-            categorizar_gee(row[columna_valor], nutriente, analisis_tipo, cultivo) 
-            for idx, row in gdf_analizado.iterrows()
-        ]
+            resultados, registro = ejecutar_analisis(opciones, memoria=MEMORIA_ETAPAS, reporte=ReporteStreamlit())
+            resultado = resultados['categorizacion']
+        # El mapa y el CSV parten de esta categorización, sin volver a pedirla a la memoria
+        previos = {'categorizacion': resultado}
+        gdf_analizado = resultado['gdf']
+        resumen_categorias = resultado['resumen_categorias']
+        columna_valor = resultado['columna_valor']
+        area_total = resultado['area_total']
+        datos_satelitales = resultado['datos_satelitales']
+        
+        if datos_satelitales.get('series'):
+            # Evolución del NDVI medio de la parcela y de cada zona a lo largo del período
+            serie_ndvi = datos_satelitales['series']['NDVI']
+            if serie_ndvi.shape[1]:
+                st.line_chart(pd.DataFrame({'NDVI medio': serie_ndvi.mean(axis=1)}))
+                with st.expander("📈 Serie temporal por zona"):
+                    st.dataframe(serie_ndvi.round(3))
         
         # PASO 6: MOSTRAR RESULTADOS
         st.subheader("📊 RESULTADOS DEL ANÁLISIS GEE")
@@ -720,7 +384,8 @@ def analisis_gee_completo(gdf, nutriente, analisis_tipo, n_divisiones, cultivo,
         
         # 🗺️ MAPA GEE
         st.subheader("🗺️ MAPA GEE - RESULTADOS")
-        mapa_buffer = crear_mapa_gee(gdf_analizado, nutriente, analisis_tipo, cultivo, satelite)
+        mapa_buffer, registro_mapa = crear_mapa_gee(opciones, previos)
+        registro += registro_mapa
         if mapa_buffer:
             st.image(mapa_buffer, use_container_width=True)
             
@@ -748,10 +413,8 @@ def analisis_gee_completo(gdf, nutriente, analisis_tipo, n_divisiones, cultivo,
         # RECOMENDACIONES ESPECÍFICAS POR CULTIVO
         st.subheader("💡 RECOMENDACIONES ESPECÍFICAS GEE")
         
-        categorias = gdf_analizado['categoria'].unique()
-        for cat in sorted(categorias):
-            subset = gdf_analizado[gdf_analizado['categoria'] == cat]
-            area_cat = subset['area_ha'].sum()
+        for cat, resumen_cat in resumen_categorias[resumen_categorias['zonas'] > 0].iterrows():
+            area_cat = resumen_cat['area_ha']
             
             with st.expander(f"🎯 **{cat}** - {area_cat:.1f} ha ({(area_cat/area_total*100):.1f}% del área)"):
                 
@@ -797,19 +460,21 @@ def analisis_gee_completo(gdf, nutriente, analisis_tipo, n_divisiones, cultivo,
                 # Mostrar estadísticas de la categoría
                 col1, col2, col3 = st.columns(3)
                 with col1:
-                    st.metric("Zonas", len(subset))
+                    st.metric("Zonas", int(resumen_cat['zonas']))
                 with col2:
                     if analisis_tipo == "FERTILIDAD ACTUAL":
-                        st.metric("NPK Prom", f"{subset['npk_actual'].mean():.3f}")
+                        st.metric("NPK Prom", f"{resumen_cat['valor_promedio']:.3f}")
                     else:
-                        st.metric("Valor Prom", f"{subset['valor_recomendado'].mean():.1f}")
+                        st.metric("Valor Prom", f"{resumen_cat['valor_promedio']:.1f}")
                 with col3:
                     st.metric("Área", f"{area_cat:.1f} ha")
         
         # DESCARGA DE RESULTADOS
         st.subheader("📥 DESCARGAR RESULTADOS COMPLETOS")
         
-        csv = gdf_analizado.to_csv(index=False)
+        resultados, registro_csv = ejecutar_analisis(opciones, ('exportacion',), MEMORIA_ETAPAS, previos=previos)
+        registro += registro_csv
+        csv = resultados['exportacion']
         st.download_button(
             "📋 Descargar CSV con Análisis GEE",
             csv,
@@ -817,6 +482,8 @@ def analisis_gee_completo(gdf, nutriente, analisis_tipo, n_divisiones, cultivo,
             "text/csv"
         )
         
+        mostrar_etapas(registro)
+        
         # INFORMACIÓN TÉCNICA
         with st.expander("🔍 VER METODOLOGÍA DETALLADA"):
             st.markdown(f"""
@@ -840,57 +507,78 @@ def analisis_gee_completo(gdf, nutriente, analisis_tipo, n_divisiones, cultivo,
             - **Período:** {fecha_inicio} a {fecha_fin}
             """)
         
-        return True
+        return resultado
         
     except Exception as e:
         st.error(f"❌ Error en análisis GEE: {str(e)}")
         import traceback
         st.error(f"Detalle: {traceback.format_exc()}")
-        return False
+        return None
 
 # ===== INTERFAZ PRINCIPAL =====
 if uploaded_zip:
     with st.spinner("Cargando parcela..."):
         try:
-            with tempfile.TemporaryDirectory() as tmp_dir:
-                with zipfile.ZipFile(uploaded_zip, 'r') as zip_ref:
-                    zip_ref.extractall(tmp_dir)
+            # Lectura directa desde los bytes subidos, cacheada por hash entre reruns
+            gdf, hash_parcela = cargar_parcela(uploaded_zip.name, uploaded_zip.getvalue())
+            
+            st.success(f"✅ **Parcela cargada:** {len(gdf)} polígono(s)")
+            
+            # Información de la parcela
+            # El área de la parcela se calcula una sola vez por archivo subido
+            clave_area = f"area_parcela_{hash_parcela}"
+            if clave_area not in st.session_state:
+                st.session_state[clave_area] = calcular_superficie(gdf).sum()
+            area_total = st.session_state[clave_area]
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                st.write("**📊 INFORMACIÓN DE LA PARCELA:**")
+                st.write(f"- Polígonos: {len(gdf)}")
+                st.write(f"- Área total: {area_total:.1f} ha")
+                st.write(f"- CRS: {gdf.crs}")
+            
+            with col2:
+                st.write("**🎯 CONFIGURACIÓN GEE:**")
+                st.write(f"- Cultivo: {ICONOS_CULTIVOS[cultivo]} {cultivo}")
+                st.write(f"- Satélite: {SATELITES_DISPONIBLES[satelite_seleccionado]['nombre']}")
+                st.write(f"- Índice: {indice_seleccionado}")
+                st.write(f"- Análisis: {analisis_tipo}")
+                if n_clases_kmeans:
+                    st.write(f"- Zonas: k-means de píxeles, {n_clases_kmeans} clases")
+                elif ancho_aplicacion_m:
+                    st.write(f"- Zonas: quadtree, ancho mínimo {ancho_aplicacion_m} m")
+                elif tamano_zona_m:
+                    st.write(f"- Zonas: {tamano_zona_m} m x {tamano_zona_m} m")
+                else:
+                    st.write(f"- Zonas: {n_divisiones}")
+            
+            # Todo lo que cambia la imagen o las zonas; cultivo, nutriente y análisis se eligen del tensor
+            clave_combinaciones = (
+                hash_parcela, satelite_seleccionado, indice_seleccionado, str(fecha_inicio), str(fecha_fin),
+                n_divisiones, tamano_zona_m, n_clases_kmeans, ancho_aplicacion_m, varianza_maxima,
+                directorio_escenas, estadistico_serie, tipo_muestra
+            )
+            argumentos = (
+                uploaded_zip, nutriente, analisis_tipo, n_divisiones,
+                cultivo, satelite_seleccionado, indice_seleccionado,
+                fecha_inicio, fecha_fin, tamano_zona_m, dpi_mapa, directorio_escenas, estadistico_serie,
+                n_clases_kmeans, ancho_aplicacion_m, varianza_maxima, tipo_muestra
+            )
+            
+            # EJECUTAR ANÁLISIS GEE
+            if st.button("🚀 EJECUTAR ANÁLISIS GEE", type="primary"):
+                resultado = analisis_gee_completo(*argumentos, todas_las_combinaciones=comparacion_instantanea)
+                if comparacion_instantanea and resultado is not None:
+                    # El tensor de la sesión, por clave: no depende de que siga en la memoria del proceso
+                    st.session_state['combinaciones_analizadas'] = {clave_combinaciones: resultado}
+            elif comparacion_instantanea and clave_combinaciones in st.session_state.get('combinaciones_analizadas', {}):
+                st.caption("⚡ Resultados precalculados: cambiar cultivo, nutriente o análisis no recalcula")
+                analisis_gee_completo(*argumentos, todas_las_combinaciones=True,
+                                      resultado_previo=st.session_state['combinaciones_analizadas'][clave_combinaciones])
                 
-                shp_files = [f for f in os.listdir(tmp_dir) if f.endswith('.shp')]
-                if shp_files:
-                    shp_path = os.path.join(tmp_dir, shp_files[0])
-                    gdf = gpd.read_file(shp_path)
-                    
-                    st.success(f"✅ **Parcela cargada:** {len(gdf)} polígono(s)")
-                    
-                    # Información de la parcela
-                    area_total = calcular_superficie(gdf).sum()
-                    
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        st.write("**📊 INFORMACIÓN DE LA PARCELA:**")
-                        st.write(f"- Polígonos: {len(gdf)}")
-                        st.write(f"- Área total: {area_total:.1f} ha")
-                        st.write(f"- CRS: {gdf.crs}")
-                    
-                    with col2:
-                        st.write("**🎯 CONFIGURACIÓN GEE:**")
-                        st.write(f"- Cultivo: {ICONOS_CULTIVOS[cultivo]} {cultivo}")
-                        st.write(f"- Satélite: {SATELITES_DISPONIBLES[satelite_seleccionado]['nombre']}")
-                        st.write(f"- Índice: {indice_seleccionado}")
-                        st.write(f"- Análisis: {analisis_tipo}")
-                        st.write(f"- Zonas: {n_divisiones}")
-                    
-                    # EJECUTAR ANÁLISIS GEE
-                    if st.button("🚀 EJECUTAR ANÁLISIS GEE", type="primary"):
-                        analisis_gee_completo(
-                            gdf, nutriente, analisis_tipo, n_divisiones, 
-                            cultivo, satelite_seleccionado, indice_seleccionado,
-                            fecha_inicio, fecha_fin
-                        )
-                        
         except Exception as e:
-            st.error(f"Error cargando shapefile: {str(e)}")
+            st.error(f"Error cargando parcela: {str(e)}")
 
 else:
     st.info("📁 Sube el ZIP de tu parcela para comenzar el análisis")
@@ -0,0 +1,117 @@
+import os
+import json
+import hashlib
+import threading
+import numpy as np
+
+# Presupuesto por defecto del caché de rásters en disco
+MAX_BYTES_RASTER = 2 * 1024 * 1024 * 1024
+
+def hash_evalscript(evalscript):
+    """Hash del evalscript normalizando espacios (cambios de formato no invalidan el caché)"""
+    normalizado = '\n'.join(linea.strip() for linea in evalscript.strip().splitlines() if linea.strip())
+    return hashlib.blake2b(normalizado.encode(), digest_size=16).hexdigest()
+
+def clave_raster(bbox, crs, resolucion, intervalo, coleccion, orden_mosaico, evalscript, **extra):
+    """Clave del request: bbox, resolución, intervalo, colección, orden de mosaico y evalscript"""
+    descriptor = {
+        'bbox': [round(float(v), 9) for v in bbox],
+        'crs': str(crs),
+        'resolucion': resolucion,
+        'intervalo': [str(fecha) for fecha in intervalo],
+        'coleccion': str(coleccion),
+        'orden_mosaico': str(orden_mosaico),
+        'evalscript': hash_evalscript(evalscript)
+    }
+    descriptor.update({k: str(v) for k, v in extra.items()})
+    texto = json.dumps(descriptor, sort_keys=True)
+    return hashlib.blake2b(texto.encode(), digest_size=20).hexdigest()
+
+class CacheRaster:
+    """Caché persistente de rásters (.npy mapeados en memoria) con expulsión LRU por bytes"""
+
+    def __init__(self, directorio, max_bytes=MAX_BYTES_RASTER):
+        self.directorio = directorio
+        self.max_bytes = max_bytes
+        self.aciertos = 0
+        self.fallos = 0
+        self.bytes_ahorrados = 0
+        self._lock = threading.Lock()
+        os.makedirs(directorio, exist_ok=True)
+
+        # Índice en memoria: clave -> (último uso, bytes)
+        self._indice = {}
+        for entrada in os.scandir(directorio):
+            if entrada.name.endswith('.npy'):
+                estado = entrada.stat()
+                self._indice[entrada.name[:-4]] = (estado.st_mtime, estado.st_size)
+
+    def _rutas(self, clave):
+        base = os.path.join(self.directorio, clave)
+        return f"{base}.npy", f"{base}.json"
+
+    def obtener(self, clave):
+        """Devuelve {'data': memmap de solo lectura, **metadatos} o None"""
+        ruta_npy, ruta_json = self._rutas(clave)
+        try:
+            data = np.load(ruta_npy, mmap_mode='r')
+            with open(ruta_json) as f:
+                metadatos = json.load(f)
+            os.utime(ruta_npy)
+        except (OSError, ValueError):
+            with self._lock:
+                self.fallos += 1
+                self._indice.pop(clave, None)
+            return None
+
+        with self._lock:
+            self.aciertos += 1
+            self.bytes_ahorrados += data.nbytes
+            self._indice[clave] = (os.path.getmtime(ruta_npy), os.path.getsize(ruta_npy))
+        return dict(metadatos, data=data)
+
+    def guardar(self, clave, data, metadatos=None):
+        """Guarda el array y sus metadatos de forma atómica y aplica el presupuesto de bytes"""
+        ruta_npy, ruta_json = self._rutas(clave)
+        sufijo = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(ruta_json + sufijo, 'w') as f:
+                json.dump(metadatos or {}, f)
+            with open(ruta_npy + sufijo, 'wb') as f:
+                np.save(f, np.ascontiguousarray(data))
+            os.replace(ruta_json + sufijo, ruta_json)
+            os.replace(ruta_npy + sufijo, ruta_npy)
+        except OSError:
+            for ruta in (ruta_json + sufijo, ruta_npy + sufijo):
+                if os.path.exists(ruta):
+                    os.remove(ruta)
+            return
+
+        with self._lock:
+            self._indice[clave] = (os.path.getmtime(ruta_npy), os.path.getsize(ruta_npy))
+            self._expulsar()
+
+    def _expulsar(self):
+        """Elimina las entradas menos usadas hasta respetar max_bytes (con el lock tomado)"""
+        total = sum(tamano for _, tamano in self._indice.values())
+        for clave, (_, tamano) in sorted(self._indice.items(), key=lambda item: item[1][0]):
+            if total <= self.max_bytes:
+                break
+            for ruta in self._rutas(clave):
+                try:
+                    os.remove(ruta)
+                except OSError:
+                    pass
+            del self._indice[clave]
+            total -= tamano
+
+    def estadisticas(self):
+        """Aciertos, fallos, bytes ahorrados y ocupación del caché"""
+        with self._lock:
+            return {
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'bytes_ahorrados': self.bytes_ahorrados,
+                'entradas': len(self._indice),
+                'bytes_disco': sum(tamano for _, tamano in self._indice.values())
+            }
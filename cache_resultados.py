@@ -0,0 +1,148 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+import shapely
+
+# Presupuestos por defecto de la caché de mapas y exportaciones
+MAX_BYTES_MEMORIA = 128 * 1024 * 1024
+MAX_BYTES_DISCO = 1024 * 1024 * 1024
+# Directorio opcional para el nivel en disco (compartido entre procesos del deployment)
+DIRECTORIO_CACHE = os.environ.get('ANALIZADOR_CACHE_DIR')
+
+def clave_contenido(geometrias, *columnas, **parametros):
+    """Hash del contenido: geometrías de las zonas, columnas de valores y parámetros del análisis"""
+    h = hashlib.blake2b(digest_size=20)
+    geometrias = np.asarray(geometrias, dtype=object)
+    h.update(len(geometrias).to_bytes(8, 'little'))
+    h.update(b''.join(shapely.to_wkb(geometrias)))
+    for columna in columnas:
+        columna = np.ascontiguousarray(columna)
+        h.update(columna.dtype.str.encode())
+        h.update(columna.tobytes())
+    for nombre in sorted(parametros):
+        h.update(f"|{nombre}={parametros[nombre]}".encode())
+    return h.hexdigest()
+
+class CacheBytes:
+    """Caché LRU de buffers acotada en bytes, con un nivel opcional en disco"""
+
+    def __init__(self, max_bytes=MAX_BYTES_MEMORIA, directorio=None, max_bytes_disco=MAX_BYTES_DISCO):
+        self.max_bytes = max_bytes
+        self.directorio = directorio
+        self.max_bytes_disco = max_bytes_disco
+        self._entradas = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+
+    def __len__(self):
+        return len(self._entradas)
+
+    def _ruta(self, clave):
+        return os.path.join(self.directorio, f"{clave}.bin")
+
+    def _guardar_memoria(self, clave, datos):
+        if len(datos) > self.max_bytes:
+            return
+        with self._lock:
+            anterior = self._entradas.pop(clave, None)
+            if anterior is not None:
+                self._bytes -= len(anterior)
+            self._entradas[clave] = datos
+            self._bytes += len(datos)
+            while self._bytes > self.max_bytes:
+                _, expulsado = self._entradas.popitem(last=False)
+                self._bytes -= len(expulsado)
+
+    def _leer_disco(self, clave):
+        if not self.directorio:
+            return None
+        ruta = self._ruta(clave)
+        try:
+            with open(ruta, 'rb') as f:
+                datos = f.read()
+            os.utime(ruta)
+            return datos
+        except OSError:
+            return None
+
+    def _escribir_disco(self, clave, datos):
+        if not self.directorio:
+            return
+        ruta = self._ruta(clave)
+        temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temporal, 'wb') as f:
+                f.write(datos)
+            os.replace(temporal, ruta)
+            self._podar_disco()
+        except OSError:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+
+    def _podar_disco(self):
+        """Elimina los archivos menos usados hasta respetar el presupuesto en disco"""
+        archivos = []
+        for entrada in os.scandir(self.directorio):
+            if entrada.name.endswith('.bin'):
+                estado = entrada.stat()
+                archivos.append((estado.st_mtime, estado.st_size, entrada.path))
+        total = sum(tamano for _, tamano, _ in archivos)
+        for _, tamano, ruta in sorted(archivos):
+            if total <= self.max_bytes_disco:
+                break
+            try:
+                os.remove(ruta)
+                total -= tamano
+            except OSError:
+                pass
+
+    def obtener(self, clave):
+        """Devuelve los bytes cacheados (memoria y luego disco) o None"""
+        with self._lock:
+            datos = self._entradas.get(clave)
+            if datos is not None:
+                self._entradas.move_to_end(clave)
+                self.aciertos += 1
+                return datos
+        datos = self._leer_disco(clave)
+        if datos is not None:
+            self._guardar_memoria(clave, datos)
+            with self._lock:
+                self.aciertos += 1
+            return datos
+        with self._lock:
+            self.fallos += 1
+        return None
+
+    def guardar(self, clave, datos):
+        """Guarda los bytes en memoria y, si está configurado, en disco"""
+        datos = bytes(datos)
+        self._guardar_memoria(clave, datos)
+        self._escribir_disco(clave, datos)
+
+    def obtener_o_generar(self, clave, generar):
+        """Devuelve el contenido cacheado o lo genera con generar() y lo guarda"""
+        datos = self.obtener(clave)
+        if datos is None:
+            datos = generar()
+            self.guardar(clave, datos)
+        return datos
+
+    def estadisticas(self):
+        """Aciertos, fallos, entradas y bytes en memoria"""
+        with self._lock:
+            return {
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'entradas': len(self._entradas),
+                'bytes_memoria': self._bytes
+            }
+
+# Caché compartida por todas las sesiones del proceso
+CACHE_RESULTADOS = CacheBytes(directorio=DIRECTORIO_CACHE)
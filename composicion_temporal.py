@@ -0,0 +1,174 @@
+import tempfile
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+from rasterio.warp import Resampling, reproject
+
+from evalscripts import NamedBands
+from escenas_locales import como_fecha, buscar_escenas, indices_escena, seleccionar_escenas
+from estadisticas_zonales import medias_zonales, pixeles_por_zona, rasterizar_zonas
+from indices_espectrales import bandas_requeridas
+
+# Memoria por bloque de píxeles al calcular la mediana desde la pila en disco
+BYTES_POR_BLOQUE = 64 * 1024 * 1024
+# Días por intervalo al recorrer Sentinel Hub (revisita de Sentinel-2)
+PASO_DIAS = 5
+
+# ===== FUENTES DE ESCENAS (GENERADORES) =====
+def escenas_locales_por_fecha(directorio, gdf, indices, fecha_inicio=None, fecha_fin=None, resolucion=None,
+                              mascara_nubes=True):
+    """Genera (fecha, NamedBands de índices) para cada escena local del intervalo, de a una por vez"""
+    catalogo = buscar_escenas(directorio)
+    for escena in seleccionar_escenas(catalogo, bandas_requeridas(indices), fecha_inicio, fecha_fin):
+        bandas, lectura = indices_escena(directorio, gdf, indices, resolucion=resolucion, escena=escena,
+                                         mascara_nubes=mascara_nubes, catalogo=catalogo)
+        yield lectura['fecha'], bandas
+
+def escenas_sentinel_hub_por_fecha(processor, gdf, indices, fecha_inicio, fecha_fin, paso_dias=PASO_DIAS,
+                                   **kwargs):
+    """Genera (fecha, NamedBands) por intervalos de paso_dias; el caché del processor evita repetir requests"""
+    inicio, fin = como_fecha(fecha_inicio), como_fecha(fecha_fin)
+    while inicio <= fin:
+        fin_intervalo = min(inicio + timedelta(days=paso_dias - 1), fin)
+        bandas = processor.download_sentinel2_indices(gdf, inicio.isoformat(), fin_intervalo.isoformat(),
+                                                      indices=indices, cloud_mask=True, **kwargs)
+        # Intervalos sin adquisiciones (todo nodata) no aportan al compuesto
+        if bandas is not None and any(np.isfinite(bandas[nombre]).any() for nombre in bandas):
+            yield inicio, bandas
+        inicio = fin_intervalo + timedelta(days=1)
+
+# ===== ACUMULADOR POR PÍXEL =====
+def _alinear(bandas, transform, crs, shape):
+    """Reproyecta las bandas a la grilla de referencia si la escena viene en otra (vecino más cercano)"""
+    if bandas.shape == tuple(shape) and bandas.transform == transform and bandas.crs == crs:
+        return bandas
+    data = np.empty((len(bandas),) + tuple(shape), dtype=np.float32).transpose(1, 2, 0)
+    for i, nombre in enumerate(bandas):
+        destino = data[..., i]
+        destino.fill(np.nan)
+        reproject(np.ascontiguousarray(bandas[nombre], dtype=np.float32), destino,
+                  src_transform=bandas.transform, src_crs=bandas.crs, src_nodata=np.nan,
+                  dst_transform=transform, dst_crs=crs, dst_nodata=np.nan, resampling=Resampling.nearest)
+    return NamedBands(data, bandas.names, transform=transform, crs=crs)
+
+class CompuestoTemporal:
+    """Estadísticos por píxel que se actualizan escena por escena sin guardar la pila completa en memoria
+
+    Por píxel e índice guarda suma, observaciones, máximo y el valor en la fecha de máximo del índice de
+    referencia. Para la mediana (mediana=True) cada escena se agrega a una pila float32 en un archivo
+    temporal que al final se recorre por bloques de píxeles: la memoria depende de BYTES_POR_BLOQUE y no
+    del tamaño de la parcela.
+    """
+
+    def __init__(self, indices, shape, transform=None, crs=None, indice_maximo='NDVI', mediana=True):
+        self.indices = [indice.upper() for indice in indices]
+        self.shape = tuple(shape)
+        self.transform = transform
+        self.crs = crs
+        self.indice_maximo = indice_maximo.upper() if indice_maximo.upper() in self.indices else self.indices[0]
+        self.n_escenas = 0
+
+        self.observaciones = {nombre: np.zeros(self.shape, dtype=np.uint16) for nombre in self.indices}
+        self.suma = {nombre: np.zeros(self.shape, dtype=np.float32) for nombre in self.indices}
+        self.maximo = {nombre: np.full(self.shape, -np.inf, dtype=np.float32) for nombre in self.indices}
+        self.en_maximo = {nombre: np.full(self.shape, np.nan, dtype=np.float32) for nombre in self.indices}
+        self.pilas = {nombre: tempfile.TemporaryFile() for nombre in self.indices} if mediana else {}
+
+    def agregar(self, bandas):
+        """Incorpora una escena (NamedBands en la grilla del compuesto)"""
+        referencia = bandas[self.indice_maximo]
+        # Píxeles donde esta fecha supera el máximo previo del índice de referencia
+        nuevo_maximo = np.isfinite(referencia) & (referencia > self.maximo[self.indice_maximo])
+
+        for nombre in self.indices:
+            valores = bandas[nombre]
+            validos = np.isfinite(valores)
+            self.observaciones[nombre] += validos
+            np.add(self.suma[nombre], valores, out=self.suma[nombre], where=validos)
+            np.fmax(self.maximo[nombre], valores, out=self.maximo[nombre])
+            np.copyto(self.en_maximo[nombre], valores, where=nuevo_maximo)
+            if nombre in self.pilas:
+                np.ascontiguousarray(valores, dtype=np.float32).tofile(self.pilas[nombre])
+        self.n_escenas += 1
+
+    def _mediana(self, nombre, bytes_por_bloque=BYTES_POR_BLOQUE):
+        """Mediana exacta por píxel leyendo la pila (fechas x píxeles) del disco por bloques de píxeles"""
+        n_pixeles = self.shape[0] * self.shape[1]
+        self.pilas[nombre].flush()
+        pila = np.memmap(self.pilas[nombre], dtype=np.float32, mode='r', shape=(self.n_escenas, n_pixeles))
+        observaciones = self.observaciones[nombre].ravel()
+        mediana = np.full(n_pixeles, np.nan, dtype=np.float32)
+        paso = max(1, bytes_por_bloque // (4 * self.n_escenas))
+        for inicio in range(0, n_pixeles, paso):
+            # np.sort deja los NaN al final: las observaciones válidas de cada píxel quedan primero
+            bloque = np.sort(pila[:, inicio:inicio + paso], axis=0)
+            n = observaciones[inicio:inicio + paso].astype(np.int64)
+            pixeles = np.flatnonzero(n)
+            n = n[pixeles]
+            mediana[inicio + pixeles] = (bloque[(n - 1) // 2, pixeles] + bloque[n // 2, pixeles]) / 2
+        return mediana.reshape(self.shape)
+
+    def resultado(self):
+        """{'maximo', 'media', 'mediana' (si se pidió), 'en_maximo', 'observaciones'} como NamedBands"""
+        def apilar(arrays):
+            data = np.stack([arrays[nombre] for nombre in self.indices]).transpose(1, 2, 0)
+            return NamedBands(data, self.indices, transform=self.transform, crs=self.crs)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            media = {nombre: self.suma[nombre] / self.observaciones[nombre] for nombre in self.indices}
+        maximo = {nombre: np.where(np.isfinite(self.maximo[nombre]), self.maximo[nombre], np.nan)
+                  for nombre in self.indices}
+        resultado = {
+            'maximo': apilar(maximo),
+            'media': apilar(media),
+            'en_maximo': apilar(self.en_maximo),
+            'observaciones': apilar(self.observaciones)
+        }
+        if self.pilas:
+            resultado['mediana'] = apilar({nombre: self._mediana(nombre) for nombre in self.indices})
+        return resultado
+
+# ===== COMPOSICIÓN Y SERIES POR ZONA =====
+def componer_serie(escenas, indices, gdf_zonas=None, **kwargs):
+    """Consume un generador de (fecha, NamedBands) y devuelve compuestos y series temporales por zona
+
+    Cada escena se descarta después de actualizar el compuesto y las medias zonales. Devuelve
+    {'compuesto': dict de CompuestoTemporal.resultado(), 'series': {indice: DataFrame fechas x zonas},
+    'fraccion_valida': DataFrame fechas x zonas, 'fechas': [...]}.
+    """
+    indices = [indice.upper() for indice in indices]
+    compuesto = None
+    etiquetas = pixeles_zona = None
+    fechas = []
+    series = {nombre: [] for nombre in indices}
+    fraccion_valida = []
+
+    for fecha, bandas in escenas:
+        if compuesto is None:
+            compuesto = CompuestoTemporal(indices, bandas.shape, bandas.transform, bandas.crs, **kwargs)
+            if gdf_zonas is not None:
+                etiquetas = rasterizar_zonas(gdf_zonas, bandas.transform, bandas.shape, bandas.crs)
+                pixeles_zona = pixeles_por_zona(etiquetas, len(gdf_zonas), etiquetas.shape[0])
+        bandas = _alinear(bandas, compuesto.transform, compuesto.crs, compuesto.shape)
+        compuesto.agregar(bandas)
+        fechas.append(fecha)
+
+        if etiquetas is not None:
+            for nombre in indices:
+                media, _, fraccion = medias_zonales(bandas[nombre], etiquetas, len(gdf_zonas), pixeles_zona)
+                series[nombre].append(media)
+            fraccion_valida.append(fraccion)
+
+    if compuesto is None:
+        return None
+
+    columnas = gdf_zonas.index if gdf_zonas is not None else None
+    indice_fechas = pd.Index(fechas, name='fecha')
+    return {
+        'compuesto': compuesto.resultado(),
+        'series': {nombre: pd.DataFrame(np.array(filas).reshape(len(fechas), -1), index=indice_fechas,
+                                        columns=columnas) for nombre, filas in series.items()},
+        'fraccion_valida': pd.DataFrame(np.array(fraccion_valida).reshape(len(fechas), -1),
+                                        index=indice_fechas, columns=columnas),
+        'fechas': fechas
+    }
@@ -1,47 +1,41 @@
 import os
-import streamlit as st
-from datetime import datetime, timedelta
 
-def get_sentinelhub_config():
-    """Obtener configuración de Sentinel Hub desde secrets.toml"""
+from nucleo import REPORTE_NULO, credenciales_faltantes, credenciales_sentinel
+
+def get_sentinelhub_config(secretos=None, reporte=REPORTE_NULO):
+    """Obtener configuración de Sentinel Hub desde secrets.toml (st.secrets) o variables de entorno
+
+    No se lee nada al importar el módulo: la interfaz pasa st.secrets y los procesos sin interfaz usan
+    el entorno.
+    """
     try:
-        # Intentar obtener desde secrets.toml
-        secrets = st.secrets
-        
-        config = {
-            'instance_id': secrets.get('SENTINELHUB_INSTANCE_ID', ''),
-            'client_id': secrets.get('SENTINELHUB_CLIENT_ID', ''),
-            'client_secret': secrets.get('SENTINELHUB_CLIENT_SECRET', '')
-        }
-        
-        # Verificar que todas las credenciales estén presentes
-        missing_creds = []
-        if not config['instance_id']:
-            missing_creds.append('SENTINELHUB_INSTANCE_ID')
-        if not config['client_id']:
-            missing_creds.append('SENTINELHUB_CLIENT_ID') 
-        if not config['client_secret']:
-            missing_creds.append('SENTINELHUB_CLIENT_SECRET')
-            
-        if missing_creds:
-            st.warning(f"⚠️ Credenciales faltantes en secrets.toml: {', '.join(missing_creds)}")
+        faltantes = credenciales_faltantes(secretos)
+        if faltantes:
+            reporte.advertencia(f"⚠️ Credenciales faltantes en secrets.toml: {', '.join(faltantes)}")
             return None
             
-        st.success("✅ Credenciales de Sentinel Hub cargadas correctamente")
-        return config
+        reporte.exito("✅ Credenciales de Sentinel Hub cargadas correctamente")
+        return credenciales_sentinel(secretos)
         
     except Exception as e:
-        st.error(f"❌ Error cargando configuración: {str(e)}")
+        reporte.error(f"❌ Error cargando configuración: {str(e)}")
         return None
 
-# Configuración de Sentinel Hub
-SENTINELHUB_CONFIG = get_sentinelhub_config()
+def get_usgs_config(secretos=None):
+    """Configuración USGS EarthExplorer (Landsat) - Opcional"""
+    secretos = os.environ if secretos is None else secretos
+    return {
+        'username': secretos.get('USGS_USERNAME', ''),
+        'password': secretos.get('USGS_PASSWORD', '')
+    }
 
-# Configuración USGS EarthExplorer (Landsat) - Opcional
-USGS_CONFIG = {
-    'username': st.secrets.get('USGS_USERNAME', ''),
-    'password': st.secrets.get('USGS_PASSWORD', '')
-}
+def __getattr__(nombre):
+    """SENTINELHUB_CONFIG y USGS_CONFIG se resuelven al usarlos (desde el entorno), no al importar"""
+    if nombre == 'SENTINELHUB_CONFIG':
+        return get_sentinelhub_config()
+    if nombre == 'USGS_CONFIG':
+        return get_usgs_config()
+    raise AttributeError(f"module {__name__!r} has no attribute {nombre!r}")
 
 # Parámetros de imágenes por cultivo (mantener igual)
 IMAGE_PARAMETERS = {
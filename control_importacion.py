@@ -0,0 +1,82 @@
+import os
+import re
+import sys
+import argparse
+import subprocess
+
+# Dependencias pesadas que no deben cargarse al arrancar: cada una solo en el camino que la usa
+MODULOS_DIFERIDOS = {
+    'sentinelhub': "solo al descargar desde Sentinel Hub",
+    'matplotlib': "solo al dibujar un mapa",
+    'rasterio': "solo al leer o procesar un ráster",
+    'geopandas': "solo al leer la primera parcela",
+    'requests': "solo en las descargas"
+}
+# Módulos de entrada que se controlan y dependencias que cada uno no puede cargar al importarse
+ENTRADAS = {
+    'app': tuple(MODULOS_DIFERIDOS),
+    'procesamiento_lotes': tuple(MODULOS_DIFERIDOS) + ('streamlit',)
+}
+# Tiempo de importación acumulado máximo de app (s), con margen sobre streamlit + pandas
+PRESUPUESTO_S = 2.0
+
+PATRON_IMPORTTIME = re.compile(r'^import time:\s*(\d+)\s*\|\s*(\d+)\s*\|(\s*)(\S+)\s*$')
+
+def medir_importacion(modulo, directorio=None):
+    """{módulo: (propio_s, acumulado_s, nivel)} de `python -X importtime -c 'import modulo'` en un proceso nuevo"""
+    directorio = directorio or os.path.dirname(os.path.abspath(__file__))
+    entorno = {**os.environ, 'PYTHONPATH': directorio}
+    proceso = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {modulo}'], cwd=directorio,
+                             env=entorno, capture_output=True, text=True)
+    if proceso.returncode != 0:
+        raise RuntimeError(f"No se pudo importar {modulo}:\n{proceso.stderr[-2000:]}")
+    tiempos = {}
+    for linea in proceso.stderr.splitlines():
+        coincidencia = PATRON_IMPORTTIME.match(linea)
+        if coincidencia:
+            propio, acumulado, sangria, nombre = coincidencia.groups()
+            tiempos[nombre] = (int(propio) / 1e6, int(acumulado) / 1e6, len(sangria) // 2)
+    return tiempos
+
+def controlar_entrada(modulo, prohibidos, presupuesto_s=None, directorio=None):
+    """(tiempos, problemas): dependencias prohibidas cargadas al importar el módulo y exceso de tiempo"""
+    tiempos = medir_importacion(modulo, directorio)
+    problemas = [f"{modulo} carga {nombre} al importarse ({MODULOS_DIFERIDOS.get(nombre, 'no debería')})"
+                 for nombre in prohibidos if nombre in tiempos]
+    total = tiempos.get(modulo, (0, 0, 0))[1]
+    if presupuesto_s is not None and total > presupuesto_s:
+        problemas.append(f"{modulo} tarda {total:.2f} s en importarse (presupuesto {presupuesto_s:.2f} s)")
+    return tiempos, problemas
+
+def informe(modulo, tiempos, n=15):
+    """Texto con el tiempo total y las dependencias directas más lentas"""
+    total = tiempos.get(modulo, (0, 0, 0))[1]
+    directas = sorted(((acumulado, nombre) for nombre, (_, acumulado, nivel) in tiempos.items() if nivel == 1),
+                      reverse=True)
+    lineas = [f"{modulo}: {total:.3f} s acumulados, {len(tiempos)} módulos"]
+    lineas += [f"  {acumulado:7.3f} s  {nombre}" for acumulado, nombre in directas[:n]]
+    return '\n'.join(lineas)
+
+# ===== LÍNEA DE COMANDOS =====
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Controla las dependencias y el tiempo de importación al arrancar (python -X importtime)"
+    )
+    parser.add_argument('--presupuesto', type=float, default=PRESUPUESTO_S,
+                        help="Tiempo máximo de importación de app en segundos (0 desactiva el control)")
+    parser.add_argument('-n', type=int, default=15, help="Dependencias directas a listar por módulo")
+    args = parser.parse_args(argv)
+
+    problemas = []
+    for modulo, prohibidos in ENTRADAS.items():
+        presupuesto = args.presupuesto if modulo == 'app' and args.presupuesto > 0 else None
+        tiempos, encontrados = controlar_entrada(modulo, prohibidos, presupuesto)
+        print(informe(modulo, tiempos, args.n))
+        problemas += encontrados
+
+    for problema in problemas:
+        print(f"ERROR {problema}", file=sys.stderr)
+    return 1 if problemas else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
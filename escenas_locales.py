@@ -0,0 +1,227 @@
+import os
+import re
+import math
+from datetime import date, datetime
+import numpy as np
+import rasterio
+from rasterio.enums import Resampling
+from rasterio import windows
+from rasterio.warp import transform_bounds
+
+from evalscripts import INDEX_FORMULAS, NamedBands
+from mascara_nubes import BANDA_CALIDAD, mascara_calidad
+from indices_espectrales import (
+    BANDAS_LANDSAT, ESCALA_LANDSAT_C2_L2, ESCALA_SENTINEL2_L2A, bandas_requeridas, calcular_indices
+)
+
+EXTENSIONES_RASTER = ('.tif', '.tiff', '.jp2')
+
+# Nombre de archivo -> escena y banda (Sentinel-2 L2A en SAFE o GeoTIFF, Landsat Collection 2 L2)
+PATRON_SENTINEL2 = re.compile(
+    r'^(?P<escena>.+?)_(?P<banda>B(?:0[1-9]|1[0-2]|8A)|SCL)(?:_(?P<resolucion>\d+)m)?\.', re.I
+)
+PATRON_LANDSAT = re.compile(r'^(?P<escena>L[COTEM]0\d_.+?)_(?P<banda>SR_B\d|QA_PIXEL)\.', re.I)
+PATRON_FECHA = re.compile(r'(?<!\d)(\d{8})(?:T\d{6})?(?!\d)')
+
+# Sensor -> (escala a reflectancia, nodata)
+SENSORES = {
+    'SENTINEL-2': (ESCALA_SENTINEL2_L2A, 0),
+    'LANDSAT-8': (ESCALA_LANDSAT_C2_L2, 0)
+}
+
+_CANONICAS_LANDSAT = {landsat: canonica for canonica, landsat in BANDAS_LANDSAT.items()}
+
+# ===== CATÁLOGO DE ESCENAS =====
+def _fecha_escena(escena):
+    """Primera fecha AAAAMMDD del identificador de escena (la de adquisición)"""
+    for coincidencia in PATRON_FECHA.finditer(escena):
+        try:
+            return datetime.strptime(coincidencia.group(1), '%Y%m%d').date()
+        except ValueError:
+            continue
+    return None
+
+def _clasificar_archivo(nombre):
+    """(sensor, escena, banda canónica, resolución nativa en m o None) o None si no es una banda conocida"""
+    landsat = PATRON_LANDSAT.match(nombre)
+    if landsat:
+        banda = landsat.group('banda').upper()
+        banda = banda if banda == 'QA_PIXEL' else _CANONICAS_LANDSAT.get(banda)
+        return ('LANDSAT-8', landsat.group('escena'), banda, 30) if banda else None
+    sentinel = PATRON_SENTINEL2.match(nombre)
+    if sentinel:
+        resolucion = sentinel.group('resolucion')
+        return ('SENTINEL-2', sentinel.group('escena'), sentinel.group('banda').upper(),
+                int(resolucion) if resolucion else None)
+    return None
+
+def buscar_escenas(directorio):
+    """Recorre un directorio (SAFE, GeoTIFF sueltos o un espejo con muchas escenas) y agrupa las bandas
+
+    Devuelve {escena: {'sensor', 'fecha', 'bandas': {banda: [(resolución, ruta), ...]}}}.
+    """
+    escenas = {}
+    for raiz, _, archivos in os.walk(directorio):
+        for nombre in archivos:
+            if not nombre.lower().endswith(EXTENSIONES_RASTER):
+                continue
+            clasificado = _clasificar_archivo(nombre)
+            if clasificado is None:
+                continue
+            sensor, escena, banda, resolucion = clasificado
+            entrada = escenas.setdefault(escena, {'sensor': sensor, 'fecha': _fecha_escena(escena), 'bandas': {}})
+            entrada['bandas'].setdefault(banda, []).append((resolucion, os.path.join(raiz, nombre)))
+    return escenas
+
+def _ruta_banda(opciones, resolucion):
+    """Elige el archivo de la banda: el más grueso que no supere la resolución pedida, si no el más fino"""
+    opciones = sorted(opciones, key=lambda opcion: opcion[0] or 0)
+    if resolucion is not None:
+        aptas = [opcion for opcion in opciones if (opcion[0] or 0) <= resolucion]
+        if aptas:
+            return aptas[-1][1]
+    return opciones[0][1]
+
+def como_fecha(valor):
+    """date desde date, datetime o texto AAAA-MM-DD (None se conserva)"""
+    if valor is None or isinstance(valor, date) and not isinstance(valor, datetime):
+        return valor
+    if isinstance(valor, datetime):
+        return valor.date()
+    return datetime.strptime(str(valor)[:10], '%Y-%m-%d').date()
+
+def seleccionar_escenas(escenas, bandas=(), fecha_inicio=None, fecha_fin=None, sensor=None):
+    """Escenas con todas las bandas pedidas dentro del intervalo, ordenadas por fecha"""
+    fecha_inicio, fecha_fin = como_fecha(fecha_inicio), como_fecha(fecha_fin)
+    seleccion = []
+    for escena, entrada in escenas.items():
+        if sensor is not None and entrada['sensor'] != sensor:
+            continue
+        fecha = entrada['fecha']
+        if fecha is not None and ((fecha_inicio and fecha < fecha_inicio) or (fecha_fin and fecha > fecha_fin)):
+            continue
+        if all(banda in entrada['bandas'] for banda in bandas):
+            seleccion.append(escena)
+    return sorted(seleccion, key=lambda escena: (escenas[escena]['fecha'] or date.min, escena))
+
+# ===== LECTURA POR VENTANA =====
+def ventana_entera(ventana, tolerancia=1e-6):
+    """Menor ventana de píxeles enteros que contiene la ventana fraccionaria
+
+    El fin se redondea hacia arriba desde col_off + width: redondear offset y largo por separado
+    pierde el último píxel cuando el offset tiene parte fraccionaria (20.5 + 26.8 termina en 47.3).
+    """
+    col0 = math.floor(ventana.col_off + tolerancia)
+    fila0 = math.floor(ventana.row_off + tolerancia)
+    col1 = math.ceil(ventana.col_off + ventana.width - tolerancia)
+    fila1 = math.ceil(ventana.row_off + ventana.height - tolerancia)
+    return windows.Window(col0, fila0, max(col1 - col0, 1), max(fila1 - fila0, 1))
+
+def _ventana_parcela(ds, limites, crs_limites):
+    """Ventana entera de píxeles del dataset que cubre los límites, recortada a la escena"""
+    if crs_limites is not None and ds.crs is not None and ds.crs != crs_limites:
+        limites = transform_bounds(crs_limites, ds.crs, *limites, densify_pts=21)
+    ventana = ventana_entera(windows.from_bounds(*limites, transform=ds.transform))
+    try:
+        return ventana.intersection(windows.Window(0, 0, ds.width, ds.height))
+    except windows.WindowError:
+        raise ValueError("La parcela no intersecta la escena")
+
+def leer_escena(directorio, gdf, bandas=None, resolucion=None, escena=None, margen=0.0,
+                fecha_inicio=None, fecha_fin=None, sensor=None, opcionales=(), catalogo=None):
+    """Lee de cada banda solo la ventana de la parcela, en una grilla común
+
+    Con resolucion (m) más gruesa que la nativa se pide la ventana decimada y GDAL usa los overviews
+    del archivo si existen. Sin escena se usa la más reciente del intervalo; las bandas opcionales
+    se leen solo si la escena las tiene. Devuelve {'bandas': NamedBands, 'sensor', 'escena', 'fecha', 'escala',
+    'nodata', 'bytes_leidos', 'bytes_escena'}.
+    """
+    # catalogo: resultado de buscar_escenas reutilizado entre lecturas del mismo directorio
+    escenas = catalogo if catalogo is not None else buscar_escenas(directorio)
+    if escena is None:
+        candidatas = seleccionar_escenas(escenas, bandas or (), fecha_inicio, fecha_fin, sensor)
+        if not candidatas:
+            raise ValueError(f"No hay escenas con las bandas {', '.join(bandas or [])} en {directorio}")
+        escena = candidatas[-1]
+    entrada = escenas[escena]
+    bandas = [banda.upper() for banda in (bandas or sorted(entrada['bandas']))]
+    bandas += [banda for banda in opcionales if banda in entrada['bandas'] and banda not in bandas]
+    faltantes = [banda for banda in bandas if banda not in entrada['bandas']]
+    if faltantes:
+        raise ValueError(f"La escena {escena} no tiene las bandas {', '.join(faltantes)}")
+
+    minx, miny, maxx, maxy = gdf.total_bounds
+    limites = (minx - margen, miny - margen, maxx + margen, maxy + margen)
+    rutas = {banda: _ruta_banda(entrada['bandas'][banda], resolucion) for banda in bandas}
+
+    # Grilla de referencia: la banda de mayor resolución nativa
+    datasets = {banda: rasterio.open(ruta) for banda, ruta in rutas.items()}
+    try:
+        referencia = min(bandas, key=lambda banda: abs(datasets[banda].res[0]))
+        ds_ref = datasets[referencia]
+        ventana = _ventana_parcela(ds_ref, limites, gdf.crs)
+
+        alto, ancho = int(ventana.height), int(ventana.width)
+        tamano_pixel = abs(ds_ref.res[0])
+        if resolucion is not None and resolucion > tamano_pixel:
+            factor = resolucion / tamano_pixel
+            alto, ancho = max(1, math.ceil(alto / factor)), max(1, math.ceil(ancho / factor))
+            # Ventana múltiplo del factor: píxeles de salida de exactamente la resolución pedida
+            ventana = windows.Window(ventana.col_off, ventana.row_off, round(ancho * factor), round(alto * factor))
+            ventana = ventana.intersection(windows.Window(0, 0, ds_ref.width, ds_ref.height))
+        limites_ventana = windows.bounds(ventana, ds_ref.transform)
+        transform = ds_ref.window_transform(ventana) * rasterio.Affine.scale(
+            ventana.width / ancho, ventana.height / alto
+        )
+
+        # Una banda contigua por índice de la pila, leída directamente en su lugar
+        data = np.empty((len(bandas), alto, ancho), dtype=ds_ref.dtypes[0]).transpose(1, 2, 0)
+        bytes_escena = 0
+        for i, banda in enumerate(bandas):
+            ds = datasets[banda]
+            ventana_banda = ventana if ds is ds_ref else windows.from_bounds(*limites_ventana, transform=ds.transform)
+            ds.read(1, window=ventana_banda, out=data[..., i], resampling=Resampling.nearest,
+                    boundless=ds is not ds_ref, fill_value=0)
+            bytes_escena += ds.width * ds.height * np.dtype(ds.dtypes[0]).itemsize
+        crs = ds_ref.crs
+    finally:
+        for ds in datasets.values():
+            ds.close()
+
+    escala, nodata = SENSORES[entrada['sensor']]
+    return {
+        'bandas': NamedBands(data, bandas, transform=transform, crs=crs),
+        'sensor': entrada['sensor'],
+        'escena': escena,
+        'fecha': entrada['fecha'],
+        'escala': escala,
+        'nodata': nodata,
+        'bytes_leidos': data.nbytes,
+        'bytes_escena': bytes_escena
+    }
+
+def indices_disponibles(directorio):
+    """Índices calculables con las bandas de alguna escena del directorio"""
+    bandas = set()
+    for entrada in buscar_escenas(directorio).values():
+        bandas |= set(entrada['bandas'])
+    return [nombre for nombre, (requeridas, _) in INDEX_FORMULAS.items() if set(requeridas) <= bandas]
+
+def indices_escena(directorio, gdf, indices, resolucion=None, escena=None, mascara_nubes=True, **kwargs):
+    """Lee por ventana las bandas necesarias y calcula los índices; devuelve (NamedBands, metadatos)
+
+    Con mascara_nubes, los píxeles marcados por SCL (Sentinel-2) o QA_PIXEL (Landsat) quedan en NaN.
+    """
+    opcionales = tuple(BANDA_CALIDAD.values()) if mascara_nubes else ()
+    lectura = leer_escena(directorio, gdf, bandas_requeridas(indices), resolucion=resolucion, escena=escena,
+                          opcionales=opcionales, **kwargs)
+    bandas = lectura.pop('bandas')
+
+    mascara = None
+    banda_calidad = BANDA_CALIDAD[lectura['sensor']]
+    if mascara_nubes and banda_calidad in bandas:
+        mascara = mascara_calidad(lectura['sensor'], bandas[banda_calidad])
+        lectura['fraccion_valida'] = float(mascara.mean())
+    resultado = calcular_indices(indices, bandas, escala=lectura['escala'], nodata=lectura['nodata'],
+                                 mascara=mascara, transform=bandas.transform, crs=bandas.crs)
+    return resultado, lectura
@@ -0,0 +1,159 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from rasterio.features import rasterize
+
+from cache_resultados import clave_contenido
+
+PERCENTILES = (10, 25, 50, 75, 90)
+# Resolución de los histogramas por zona usados para mediana y percentiles
+N_BINS = 1024
+# Píxeles procesados por bloque: acota la memoria temporal en rásters grandes
+PIXELES_POR_BLOQUE = 16 * 1024 * 1024
+# Presupuesto del caché de rásters de etiquetas
+MAX_BYTES_ETIQUETAS = 1024 * 1024 * 1024
+
+_cache_etiquetas = OrderedDict()
+_lock_etiquetas = threading.Lock()
+
+# ===== RASTERIZACIÓN DE ZONAS (CACHEADA) =====
+def rasterizar_zonas(gdf_zonas, transform, shape, crs=None):
+    """Raster de etiquetas int32 (zona i -> i + 1, 0 fuera de las zonas), cacheado por geometrías y grilla"""
+    if crs is not None and gdf_zonas.crs is not None and gdf_zonas.crs != crs:
+        gdf_zonas = gdf_zonas.to_crs(crs)
+    geometrias = gdf_zonas.geometry.values
+    clave = clave_contenido(geometrias, tipo='etiquetas', transform=tuple(transform)[:6], shape=tuple(shape))
+
+    with _lock_etiquetas:
+        etiquetas = _cache_etiquetas.get(clave)
+        if etiquetas is not None:
+            _cache_etiquetas.move_to_end(clave)
+            return etiquetas
+
+    etiquetas = rasterize(
+        zip(geometrias, range(1, len(geometrias) + 1)),
+        out_shape=tuple(shape), transform=transform, fill=0, dtype='int32'
+    )
+    etiquetas.setflags(write=False)
+
+    with _lock_etiquetas:
+        _cache_etiquetas[clave] = etiquetas
+        total = sum(e.nbytes for e in _cache_etiquetas.values())
+        while total > MAX_BYTES_ETIQUETAS and len(_cache_etiquetas) > 1:
+            _, expulsado = _cache_etiquetas.popitem(last=False)
+            total -= expulsado.nbytes
+    return etiquetas
+
+# ===== ESTADÍSTICAS POR ZONA =====
+def _bandas(bandas):
+    """Normaliza NamedBands, dict o array 2D a pares (nombre, array 2D)"""
+    if isinstance(bandas, np.ndarray):
+        return [('valor', bandas)]
+    return list(bandas.items())
+
+def _rango_valido(banda, etiquetas, filas):
+    """Mínimo y máximo de los píxeles válidos dentro de alguna zona"""
+    v_min, v_max = np.inf, -np.inf
+    for inicio in range(0, banda.shape[0], filas):
+        bloque = banda[inicio:inicio + filas]
+        dentro = (etiquetas[inicio:inicio + filas] > 0) & np.isfinite(bloque)
+        if dentro.any():
+            valores = bloque[dentro]
+            v_min = min(v_min, float(valores.min()))
+            v_max = max(v_max, float(valores.max()))
+    return v_min, v_max
+
+def pixeles_por_zona(etiquetas, n_zonas, filas_por_bloque):
+    """Cantidad total de píxeles de cada zona en el raster de etiquetas"""
+    total = np.zeros(n_zonas + 1, dtype=np.int64)
+    for inicio in range(0, etiquetas.shape[0], filas_por_bloque):
+        total += np.bincount(etiquetas[inicio:inicio + filas_por_bloque].ravel(), minlength=n_zonas + 1)
+    return total[1:]
+
+def percentiles_histograma(histogramas, conteo, v_min, v_max, ancho_bin, percentiles):
+    """Percentiles por fila (zona o píxel) interpolando dentro del bin del histograma acumulado"""
+    acumulado = np.cumsum(histogramas, axis=1)
+    resultado = np.full((len(conteo), len(percentiles)), np.nan)
+    con_datos = conteo > 0
+    filas = np.nonzero(con_datos)[0]
+    for j, p in enumerate(percentiles):
+        # Rango (base 0) del percentil con interpolación lineal, como np.percentile
+        rango = p / 100 * (conteo[filas] - 1)
+        bin_p = np.argmax(acumulado[filas] > rango[:, None], axis=1)
+        previo = np.where(bin_p > 0, acumulado[filas, bin_p - 1], 0)
+        en_bin = histogramas[filas, bin_p]
+        fraccion = (rango - previo + 0.5) / en_bin
+        resultado[filas, j] = v_min + (bin_p + fraccion) * ancho_bin
+    # La interpolación no puede salir del rango observado (p. ej. bandas constantes)
+    return np.clip(resultado, v_min, v_max)
+
+def estadisticas_zonales(bandas, etiquetas, n_zonas, index=None, percentiles=PERCENTILES,
+                         n_bins=N_BINS, pixeles_por_bloque=PIXELES_POR_BLOQUE):
+    """Media, mediana, desvío, percentiles, píxeles válidos y fracción válida por zona para todas las bandas"""
+    n_etiquetas = n_zonas + 1
+    filas_por_bloque = max(1, pixeles_por_bloque // max(etiquetas.shape[1], 1))
+    pixeles_zona = pixeles_por_zona(etiquetas, n_zonas, filas_por_bloque)
+    resultados = {}
+
+    for nombre, banda in _bandas(bandas):
+        v_min, v_max = _rango_valido(banda, etiquetas, filas_por_bloque)
+        if not np.isfinite(v_min):
+            v_min, v_max = 0.0, 1.0
+        ancho_bin = (v_max - v_min) / n_bins or 1.0
+
+        suma = np.zeros(n_etiquetas)
+        suma_cuadrados = np.zeros(n_etiquetas)
+        histogramas = np.zeros(n_etiquetas * n_bins)
+
+        for inicio in range(0, banda.shape[0], filas_por_bloque):
+            bloque = np.asarray(banda[inicio:inicio + filas_por_bloque], dtype=np.float64).ravel()
+            etiqueta = etiquetas[inicio:inicio + filas_por_bloque].ravel()
+            validos = (etiqueta > 0) & np.isfinite(bloque)
+            valores = bloque[validos]
+            etiqueta = etiqueta[validos]
+
+            suma += np.bincount(etiqueta, weights=valores, minlength=n_etiquetas)
+            suma_cuadrados += np.bincount(etiqueta, weights=valores * valores, minlength=n_etiquetas)
+            bins = np.minimum(((valores - v_min) / ancho_bin).astype(np.int64), n_bins - 1)
+            histogramas += np.bincount(etiqueta * n_bins + bins, minlength=n_etiquetas * n_bins)
+
+        # La etiqueta 0 (fuera de las zonas) no se reporta
+        histogramas = histogramas.reshape(n_etiquetas, n_bins)[1:]
+        conteo = histogramas.sum(axis=1)
+        suma, suma_cuadrados = suma[1:], suma_cuadrados[1:]
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            media = suma / conteo
+            desvio = np.sqrt(np.maximum(suma_cuadrados / conteo - media * media, 0))
+        valores_p = percentiles_histograma(histogramas, conteo, v_min, v_max, ancho_bin, percentiles)
+
+        columnas = {'media': media, 'desvio': desvio}
+        for j, p in enumerate(percentiles):
+            columnas[f'p{p}'] = valores_p[:, j]
+        if 50 in percentiles:
+            columnas['mediana'] = columnas['p50']
+        columnas['pixeles_validos'] = conteo.astype(np.int64)
+        # Fracción de la zona con píxeles válidos (sin nubes, sombras ni nodata)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            columnas['fraccion_valida'] = conteo / pixeles_zona
+        resultados[nombre] = pd.DataFrame(columnas, index=index)
+
+    return resultados
+
+def medias_zonales(banda, etiquetas, n_zonas, pixeles_zona=None, pixeles_por_bloque=PIXELES_POR_BLOQUE):
+    """Solo media, píxeles válidos y fracción válida por zona (una pasada de bincount, para series temporales)"""
+    n_etiquetas = n_zonas + 1
+    filas_por_bloque = max(1, pixeles_por_bloque // max(etiquetas.shape[1], 1))
+    if pixeles_zona is None:
+        pixeles_zona = pixeles_por_zona(etiquetas, n_zonas, filas_por_bloque)
+    suma = np.zeros(n_etiquetas)
+    conteo = np.zeros(n_etiquetas)
+    for inicio in range(0, banda.shape[0], filas_por_bloque):
+        bloque = banda[inicio:inicio + filas_por_bloque].ravel()
+        etiqueta = etiquetas[inicio:inicio + filas_por_bloque].ravel()
+        validos = (etiqueta > 0) & np.isfinite(bloque)
+        suma += np.bincount(etiqueta[validos], weights=bloque[validos], minlength=n_etiquetas)
+        conteo += np.bincount(etiqueta[validos], minlength=n_etiquetas)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return suma[1:] / conteo[1:], conteo[1:].astype(np.int64), conteo[1:] / pixeles_zona
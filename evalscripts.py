@@ -0,0 +1,203 @@
+import numpy as np
+
+from mascara_nubes import CLASES_SCL_INVALIDAS
+
+# Fórmulas de índices sobre bandas Sentinel-2 L2A (reflectancia): bandas requeridas y expresión JS
+INDEX_FORMULAS = {
+    'NDVI': (('B04', 'B08'), 'ratio(s.B08 - s.B04, s.B08 + s.B04)'),
+    'NDRE': (('B05', 'B08'), 'ratio(s.B08 - s.B05, s.B08 + s.B05)'),
+    'GNDVI': (('B03', 'B08'), 'ratio(s.B08 - s.B03, s.B08 + s.B03)'),
+    'OSAVI': (('B04', 'B08'), '1.16 * ratio(s.B08 - s.B04, s.B08 + s.B04 + 0.16)'),
+    'MCARI': (('B03', 'B04', 'B05'), '((s.B05 - s.B04) - 0.2 * (s.B05 - s.B03)) * ratio(s.B05, s.B04)'),
+    'NDWI': (('B03', 'B08'), 'ratio(s.B03 - s.B08, s.B03 + s.B08)'),
+    'EVI': (('B02', 'B04', 'B08'), '2.5 * ratio(s.B08 - s.B04, s.B08 + 6 * s.B04 - 7.5 * s.B02 + 1)'),
+    'SAVI': (('B04', 'B08'), '1.5 * ratio(s.B08 - s.B04, s.B08 + s.B04 + 0.5)'),
+    'MSAVI': (('B04', 'B08'), '(2 * s.B08 + 1 - Math.sqrt(Math.pow(2 * s.B08 + 1, 2) - 8 * (s.B08 - s.B04))) / 2')
+}
+
+# Rango físico por índice para el transporte cuantizado (precisión = rango / niveles)
+INDEX_RANGES = {
+    'NDVI': (-1.0, 1.0),
+    'NDRE': (-1.0, 1.0),
+    'GNDVI': (-1.0, 1.0),
+    'OSAVI': (-1.2, 1.2),
+    'MCARI': (-0.5, 2.0),
+    'NDWI': (-1.0, 1.0),
+    'EVI': (-1.0, 2.0),
+    'SAVI': (-1.5, 1.5),
+    'MSAVI': (-1.0, 1.0)
+}
+
+# Tipo de muestra -> (valor mínimo, valor máximo, nodata)
+QUANTIZED_SAMPLE_TYPES = {
+    'UINT8': (0, 254, 255),
+    'INT16': (-32767, 32767, -32768)
+}
+
+EVALSCRIPT_TEMPLATE = """//VERSION=3
+function setup() {{
+    return {{
+        input: [{{
+            bands: [{bands}]
+        }}],
+        output: {{
+            id: "default",
+            bands: {n_bands},
+            sampleType: "{sample_type}"
+        }}
+    }};
+}}
+
+function ratio(a, b) {{
+    return b === 0 ? NaN : a / b;
+}}
+
+function quantize(v, lo, scale, qmin, qmax, nodata) {{
+    if (!isFinite(v)) {{
+        return nodata;
+    }}
+    return Math.max(qmin, Math.min(qmax, Math.round((v - lo) / scale) + qmin));
+}}
+
+function evaluatePixel(s) {{
+    if ({invalid}) {{
+        return [{nodata}];
+    }}
+    return [
+        {expressions}
+    ];
+}}
+"""
+
+BANDS_EVALSCRIPT_TEMPLATE = """//VERSION=3
+function setup() {{
+    return {{
+        input: [{{
+            bands: [{bands}],
+            units: "DN"
+        }}],
+        output: {{
+            id: "default",
+            bands: {n_bands},
+            sampleType: "UINT16"
+        }}
+    }};
+}}
+
+function evaluatePixel(s) {{
+    if (s.dataMask === 0) {{
+        return [{nodata}];
+    }}
+    return [{values}];
+}}
+"""
+
+def normalize_indices(indices):
+    """Normalizar nombres de índices (mayúsculas, sin duplicados, orden estable)"""
+    names = []
+    for index in indices:
+        name = index.upper()
+        if name not in INDEX_FORMULAS:
+            raise ValueError(f"Índice no soportado: {index}")
+        if name not in names:
+            names.append(name)
+    return names
+
+def quantization_params(names, sample_type, ranges=None):
+    """Parámetros (lo, escala, qmin, qmax, nodata) por índice; ranges permite ajustar la precisión de cada uno"""
+    qmin, qmax, nodata = QUANTIZED_SAMPLE_TYPES[sample_type]
+    ranges = {name.upper(): rango for name, rango in (ranges or {}).items()}
+    params = []
+    for name in names:
+        lo, hi = ranges.get(name, INDEX_RANGES[name])
+        params.append((lo, (hi - lo) / (qmax - qmin), qmin, qmax, nodata))
+    return params
+
+def build_evalscript(indices, sample_type='FLOAT32', ranges=None, cloud_mask=False):
+    """Componer un evalscript que devuelve todos los índices pedidos en un solo request multibanda
+
+    cloud_mask=True descarta en el servidor los píxeles con clase SCL de nube, sombra o nieve.
+    """
+    names = normalize_indices(indices)
+    bands = sorted({band for name in names for band in INDEX_FORMULAS[name][0]})
+    expressions = [INDEX_FORMULAS[name][1] for name in names]
+    nodata = 'NaN'
+    invalid = 's.dataMask === 0'
+    if cloud_mask:
+        bands.append('SCL')
+        invalid += ''.join(f' || s.SCL === {clase}' for clase in CLASES_SCL_INVALIDAS if clase != 0)
+
+    # Transporte cuantizado: el servidor escala cada índice a enteros con un valor nodata
+    if sample_type != 'FLOAT32':
+        params = quantization_params(names, sample_type, ranges)
+        expressions = [
+            f'quantize({expression}, {lo!r}, {scale!r}, {qmin}, {qmax}, {nodata_q})'
+            for expression, (lo, scale, qmin, qmax, nodata_q) in zip(expressions, params)
+        ]
+        nodata = str(QUANTIZED_SAMPLE_TYPES[sample_type][2])
+
+    return EVALSCRIPT_TEMPLATE.format(
+        bands=', '.join(f'"{band}"' for band in bands + ['dataMask']),
+        n_bands=len(names),
+        sample_type=sample_type,
+        invalid=invalid,
+        nodata=', '.join([nodata] * len(names)),
+        expressions=',\n        '.join(expressions)
+    )
+
+def build_bands_evalscript(bands):
+    """Evalscript que devuelve bandas crudas como números digitales UINT16 (0 = sin datos)"""
+    bands = [band.upper() for band in bands]
+    return BANDS_EVALSCRIPT_TEMPLATE.format(
+        bands=', '.join(f'"{band}"' for band in bands + ['dataMask']),
+        n_bands=len(bands),
+        nodata=', '.join(['0'] * len(bands)),
+        values=', '.join(f's.{band}' for band in bands)
+    )
+
+class NamedBands:
+    """Array (alto, ancho, bandas) con acceso por nombre: vistas sin copia, o float32 decuantizado"""
+
+    def __init__(self, data, names, transform=None, crs=None, quantization=None):
+        data = np.asarray(data)
+        if data.ndim == 2:
+            data = data[..., np.newaxis]
+        if data.shape[-1] != len(names):
+            raise ValueError(f"{data.shape[-1]} bandas para {len(names)} nombres")
+        self.data = data
+        self.names = list(names)
+        self.transform = transform
+        self.crs = crs
+        # Bandas cuantizadas: se guardan enteras y cada una se decuantiza una vez, en el primer acceso
+        self.quantization = quantization
+        self._dequantized = {}
+
+    def __getitem__(self, name):
+        i = self.names.index(name.upper())
+        band = self.data[..., i]
+        if self.quantization is None:
+            return band
+        if i not in self._dequantized:
+            lo, scale, qmin, _, nodata = self.quantization[i]
+            out = np.empty(band.shape, dtype=np.float32)
+            np.multiply(band, np.float32(scale), out=out)
+            out += np.float32(lo - qmin * scale)
+            out[band == nodata] = np.nan
+            self._dequantized[i] = out
+        return self._dequantized[i]
+
+    def __contains__(self, name):
+        return name.upper() in self.names
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+    @property
+    def shape(self):
+        return self.data.shape[:2]
+
+    def items(self):
+        return ((name, self[name]) for name in self.names)
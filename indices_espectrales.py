@@ -0,0 +1,183 @@
+import time
+import numpy as np
+
+from evalscripts import INDEX_FORMULAS, NamedBands, normalize_indices
+
+# Píxeles por bloque: los buffers temporales (float32) se reutilizan entre bloques
+PIXELES_POR_BLOQUE = 64 * 1024
+
+# Conversión de números digitales a reflectancia: (factor, desplazamiento)
+ESCALA_SENTINEL2_L2A = (0.0001, 0.0)
+ESCALA_LANDSAT_C2_L2 = (0.0000275, -0.2)
+
+# Nombres canónicos (Sentinel-2) de las bandas Landsat 8/9 Collection 2 equivalentes
+BANDAS_LANDSAT = {'B02': 'SR_B2', 'B03': 'SR_B3', 'B04': 'SR_B4', 'B08': 'SR_B5'}
+
+# ===== OPERACIONES SOBRE BUFFERS =====
+def _cociente(numerador, denominador, out, invalido):
+    """out = numerador / denominador con NaN donde el denominador es cero"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        np.divide(numerador, denominador, out=out)
+    np.isinf(out, out=invalido)
+    np.putmask(out, invalido, np.nan)
+
+def _diferencia_normalizada(a, b, out, tmp, invalido, suma=0.0, factor=1.0):
+    """out = factor * (a - b) / (a + b + suma)"""
+    np.subtract(a, b, out=out)
+    np.add(a, b, out=tmp[0])
+    if suma:
+        tmp[0] += np.float32(suma)
+    _cociente(out, tmp[0], out, invalido)
+    if factor != 1.0:
+        out *= np.float32(factor)
+
+def _evi(b, out, tmp, invalido):
+    """2.5 * (B08 - B04) / (B08 + 6 B04 - 7.5 B02 + 1)"""
+    np.subtract(b['B08'], b['B04'], out=out)
+    np.multiply(b['B04'], np.float32(6), out=tmp[0])
+    tmp[0] += b['B08']
+    np.multiply(b['B02'], np.float32(7.5), out=tmp[1])
+    tmp[0] -= tmp[1]
+    tmp[0] += np.float32(1)
+    _cociente(out, tmp[0], out, invalido)
+    out *= np.float32(2.5)
+
+def _mcari(b, out, tmp, invalido):
+    """((B05 - B04) - 0.2 (B05 - B03)) * B05 / B04"""
+    np.subtract(b['B05'], b['B04'], out=tmp[0])
+    np.subtract(b['B05'], b['B03'], out=tmp[1])
+    tmp[1] *= np.float32(0.2)
+    tmp[0] -= tmp[1]
+    _cociente(b['B05'], b['B04'], out, invalido)
+    out *= tmp[0]
+
+def _msavi(b, out, tmp, invalido):
+    """(2 B08 + 1 - sqrt((2 B08 + 1)^2 - 8 (B08 - B04))) / 2"""
+    np.multiply(b['B08'], np.float32(2), out=tmp[0])
+    tmp[0] += np.float32(1)
+    np.subtract(b['B08'], b['B04'], out=out)
+    out *= np.float32(8)
+    np.multiply(tmp[0], tmp[0], out=tmp[1])
+    tmp[1] -= out
+    with np.errstate(invalid='ignore'):
+        np.sqrt(tmp[1], out=tmp[1])
+    np.subtract(tmp[0], tmp[1], out=out)
+    out *= np.float32(0.5)
+
+# Índice -> (buffers temporales, función que escribe en out). Los índices válidos y sus bandas están en
+# evalscripts.INDEX_FORMULAS, el mismo registro que arma los evalscripts de Sentinel Hub
+CALCULO_LOCAL = {
+    'NDVI': (1, lambda b, out, tmp, inv: _diferencia_normalizada(b['B08'], b['B04'], out, tmp, inv)),
+    'NDRE': (1, lambda b, out, tmp, inv: _diferencia_normalizada(b['B08'], b['B05'], out, tmp, inv)),
+    'GNDVI': (1, lambda b, out, tmp, inv: _diferencia_normalizada(b['B08'], b['B03'], out, tmp, inv)),
+    'NDWI': (1, lambda b, out, tmp, inv: _diferencia_normalizada(b['B03'], b['B08'], out, tmp, inv)),
+    'OSAVI': (1, lambda b, out, tmp, inv: _diferencia_normalizada(b['B08'], b['B04'], out, tmp, inv,
+                                                                  suma=0.16, factor=1.16)),
+    'SAVI': (1, lambda b, out, tmp, inv: _diferencia_normalizada(b['B08'], b['B04'], out, tmp, inv,
+                                                                 suma=0.5, factor=1.5)),
+    'EVI': (2, _evi),
+    'MCARI': (2, _mcari),
+    'MSAVI': (2, _msavi)
+}
+
+def bandas_requeridas(indices):
+    """Bandas canónicas necesarias para calcular todos los índices pedidos"""
+    return sorted({banda for nombre in normalize_indices(indices) for banda in INDEX_FORMULAS[nombre][0]})
+
+def indices_a_descargar(satelite, indice):
+    """NDVI y NDRE para las estadísticas por zona más el índice elegido, si se puede calcular"""
+    indices = ['NDVI', 'NDRE'] + ([indice.upper()] if indice.upper() in INDEX_FORMULAS else [])
+    if satelite == "LANDSAT-8":
+        # Landsat no tiene banda de borde rojo
+        indices = [nombre for nombre in indices if 'B05' not in INDEX_FORMULAS[nombre][0]]
+    return list(dict.fromkeys(indices))
+
+# ===== CÁLCULO POR BLOQUES =====
+def calcular_indices(indices, bandas, escala=None, nodata=None, mascara=None, transform=None, crs=None,
+                     out=None, pixeles_por_bloque=PIXELES_POR_BLOQUE):
+    """Calcula índices a partir de bandas 2D (dict o NamedBands) en bloques de filas sobre buffers float32
+
+    escala=(factor, desplazamiento) convierte números digitales a reflectancia; los píxeles iguales a
+    nodata o False en mascara quedan en NaN. Devuelve NamedBands con una banda contigua por índice.
+    """
+    nombres = normalize_indices(indices)
+    requeridas = bandas_requeridas(nombres)
+    faltantes = [banda for banda in requeridas if banda not in bandas]
+    if faltantes:
+        raise ValueError(f"Faltan bandas para {', '.join(nombres)}: {', '.join(faltantes)}")
+
+    fuentes = {banda: bandas[banda] for banda in requeridas}
+    alto, ancho = fuentes[requeridas[0]].shape
+    if out is None:
+        # Almacenamiento por banda: cada índice es un array 2D contiguo
+        out = np.empty((len(nombres), alto, ancho), dtype=np.float32).transpose(1, 2, 0)
+    filas = max(1, min(alto, pixeles_por_bloque // max(ancho, 1)))
+
+    # Las bandas float32 sin escala ni nodata se usan directamente, sin copiar
+    convertir = {banda: escala is not None or nodata is not None or fuente.dtype != np.float32
+                 for banda, fuente in fuentes.items()}
+    buffers = {banda: np.empty((filas, ancho), dtype=np.float32) for banda in requeridas if convertir[banda]}
+    n_tmp = max(CALCULO_LOCAL[nombre][0] for nombre in nombres)
+    tmp_completo = [np.empty((filas, ancho), dtype=np.float32) for _ in range(n_tmp)]
+    invalido_completo = np.empty((filas, ancho), dtype=bool)
+
+    for inicio in range(0, alto, filas):
+        fin = min(inicio + filas, alto)
+        n = fin - inicio
+        invalido = invalido_completo[:n]
+        tmp = [t[:n] for t in tmp_completo]
+
+        bloque = {}
+        for banda, fuente in fuentes.items():
+            if not convertir[banda]:
+                bloque[banda] = fuente[inicio:fin]
+                continue
+            origen = fuente[inicio:fin]
+            destino = buffers[banda][:n]
+            np.copyto(destino, origen, casting='unsafe')
+            if escala is not None:
+                destino *= np.float32(escala[0])
+                if escala[1]:
+                    destino += np.float32(escala[1])
+            if nodata is not None:
+                np.equal(origen, nodata, out=invalido)
+                np.putmask(destino, invalido, np.nan)
+            bloque[banda] = destino
+
+        for i, nombre in enumerate(nombres):
+            destino = out[inicio:fin, :, i]
+            CALCULO_LOCAL[nombre][1](bloque, destino, tmp, invalido)
+            if mascara is not None:
+                np.logical_not(mascara[inicio:fin], out=invalido)
+                np.putmask(destino, invalido, np.nan)
+
+    return NamedBands(out, nombres, transform=transform, crs=crs)
+
+def calcular_indice(indice, bandas, **kwargs):
+    """Un solo índice como array 2D float32"""
+    return calcular_indices([indice], bandas, **kwargs)[indice]
+
+# ===== BENCHMARK =====
+def medir_rendimiento(alto=4096, ancho=4096, indices=tuple(INDEX_FORMULAS), repeticiones=3,
+                      pixeles_por_bloque=PIXELES_POR_BLOQUE):
+    """Megapíxeles por segundo por índice sobre bandas uint16 sintéticas (mejor de varias repeticiones)"""
+    rng = np.random.default_rng(0)
+    bandas = {banda: rng.integers(1, 10000, (alto, ancho), dtype=np.uint16)
+              for banda in bandas_requeridas(indices)}
+    out = np.empty((1, alto, ancho), dtype=np.float32).transpose(1, 2, 0)
+    megapixeles = alto * ancho / 1e6
+
+    resultados = {}
+    for nombre in normalize_indices(indices):
+        mejor = np.inf
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            calcular_indices([nombre], bandas, escala=ESCALA_SENTINEL2_L2A, nodata=0, out=out,
+                             pixeles_por_bloque=pixeles_por_bloque)
+            mejor = min(mejor, time.perf_counter() - inicio)
+        resultados[nombre] = megapixeles / mejor
+    return resultados
+
+if __name__ == '__main__':
+    for nombre, mp_s in medir_rendimiento().items():
+        print(f"{nombre:6s} {mp_s:8.1f} MP/s")
@@ -0,0 +1,82 @@
+import io
+import hashlib
+import posixpath
+import threading
+import warnings
+import zipfile
+from collections import OrderedDict
+
+EXTENSIONES_DIRECTAS = ('.gpkg', '.geojson', '.json')
+# Parcelas parseadas que se conservan entre reruns de Streamlit
+MAX_PARCELAS_CACHE = 16
+
+_cache_parcelas = OrderedDict()
+_lock_cache = threading.Lock()
+
+def hash_archivo(datos):
+    """Hash del contenido subido (identifica la parcela entre reruns)"""
+    return hashlib.blake2b(datos, digest_size=20).hexdigest()
+
+def _leer_vector(datos):
+    """Lee un dataset vectorial desde bytes en memoria (GDAL /vsimem/, sin disco)"""
+    # geopandas (y GDAL) se cargan con la primera parcela, no al arrancar la app
+    import geopandas as gpd
+    with warnings.catch_warnings():
+        # GeoPackage en memoria: GDAL advierte por la extensión del archivo virtual
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return gpd.read_file(datos)
+
+def _miembros_validos(zf):
+    """Archivos del ZIP, sin carpetas ni metadatos de macOS"""
+    return [n for n in zf.namelist()
+            if not n.endswith('/') and '__MACOSX' not in n
+            and not posixpath.basename(n).startswith('.')]
+
+def _leer_zip(datos):
+    """Lee el primer shapefile (o GeoPackage/GeoJSON) de un ZIP sin extraerlo"""
+    with zipfile.ZipFile(io.BytesIO(datos)) as zf:
+        miembros = _miembros_validos(zf)
+
+        # Primero el shapefile menos anidado, como al listar la raíz del ZIP
+        shp_files = sorted((n for n in miembros if n.lower().endswith('.shp')),
+                           key=lambda n: (n.count('/'), n))
+        if shp_files:
+            base = posixpath.splitext(shp_files[0])[0].lower()
+            # Reempaquetar solo sus componentes en la raíz de un ZIP sin compresión
+            buf = io.BytesIO()
+            with zipfile.ZipFile(buf, 'w', zipfile.ZIP_STORED) as destino:
+                for nombre in miembros:
+                    if posixpath.splitext(nombre)[0].lower() == base:
+                        destino.writestr(posixpath.basename(nombre), zf.read(nombre))
+            return _leer_vector(buf.getvalue())
+
+        otros = sorted((n for n in miembros if n.lower().endswith(EXTENSIONES_DIRECTAS)),
+                       key=lambda n: (n.count('/'), n))
+        if otros:
+            return _leer_vector(zf.read(otros[0]))
+
+    raise ValueError("El ZIP no contiene un shapefile, GeoPackage ni GeoJSON")
+
+def leer_parcela(nombre, datos):
+    """Parsea un ZIP con shapefile, un GeoPackage o un GeoJSON desde bytes"""
+    if nombre.lower().endswith('.zip') or datos[:4] == b'PK\x03\x04':
+        return _leer_zip(datos)
+    if nombre.lower().endswith(EXTENSIONES_DIRECTAS):
+        return _leer_vector(datos)
+    raise ValueError(f"Formato no soportado: {nombre}")
+
+def cargar_parcela(nombre, datos):
+    """Devuelve (GeoDataFrame, hash) reutilizando la parcela ya parseada si el contenido no cambió"""
+    clave = hash_archivo(datos)
+    with _lock_cache:
+        gdf = _cache_parcelas.get(clave)
+        if gdf is not None:
+            _cache_parcelas.move_to_end(clave)
+            return gdf, clave
+
+    gdf = leer_parcela(nombre, datos)
+    with _lock_cache:
+        _cache_parcelas[clave] = gdf
+        while len(_cache_parcelas) > MAX_PARCELAS_CACHE:
+            _cache_parcelas.popitem(last=False)
+    return gdf, clave
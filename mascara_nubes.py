@@ -0,0 +1,47 @@
+import numpy as np
+
+# Clases SCL de Sentinel-2 L2A descartadas: sin datos, saturado, sombra de nube, nube media/alta,
+# cirro y nieve. Se conservan vegetación (4), suelo (5), agua (6), sin clasificar (7) y áreas oscuras (2).
+CLASES_SCL_INVALIDAS = (0, 1, 3, 8, 9, 10, 11)
+
+# Bits de QA_PIXEL de Landsat Collection 2 descartados: relleno, nube dilatada, cirro, nube,
+# sombra de nube y nieve
+BITS_QA_INVALIDOS = (0, 1, 2, 3, 4, 5)
+
+# Fracción válida por zona bajo la cual la media zonal se considera poco confiable
+FRACCION_VALIDA_MINIMA = 0.5
+
+# Banda de calidad por sensor: nombre canónico en escenas locales
+BANDA_CALIDAD = {
+    'SENTINEL-2': 'SCL',
+    'LANDSAT-8': 'QA_PIXEL'
+}
+
+def _tabla_scl(clases_invalidas):
+    """Tabla de búsqueda clase -> válido para los 256 valores posibles"""
+    tabla = np.ones(256, dtype=bool)
+    tabla[list(clases_invalidas)] = False
+    return tabla
+
+_TABLA_SCL = _tabla_scl(CLASES_SCL_INVALIDAS)
+
+def mascara_scl(scl, clases_invalidas=CLASES_SCL_INVALIDAS):
+    """Máscara booleana (True = píxel válido) desde la banda SCL con una tabla de búsqueda"""
+    tabla = _TABLA_SCL if tuple(clases_invalidas) == CLASES_SCL_INVALIDAS else _tabla_scl(clases_invalidas)
+    scl = np.asarray(scl)
+    if scl.dtype != np.uint8:
+        # Valores fuera de 0..255 no son clases SCL: se marcan como clase 0 (sin datos)
+        scl = np.where((scl >= 0) & (scl < 256), scl, 0).astype(np.uint8)
+    return tabla[scl]
+
+def mascara_qa_pixel(qa, bits_invalidos=BITS_QA_INVALIDOS):
+    """Máscara booleana (True = píxel válido) desde QA_PIXEL de Landsat con una prueba de bits"""
+    qa = np.asarray(qa)
+    bits = qa.dtype.type(sum(1 << bit for bit in bits_invalidos))
+    return (qa & bits) == 0
+
+def mascara_calidad(sensor, banda):
+    """Máscara de píxeles válidos para la banda de calidad del sensor"""
+    if sensor == 'LANDSAT-8':
+        return mascara_qa_pixel(banda)
+    return mascara_scl(banda)
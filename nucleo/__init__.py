@@ -0,0 +1,8 @@
+"""Núcleo de cálculo sin Streamlit: etapas memoizadas del análisis por parcela y reporte de progreso"""
+from nucleo.progreso import REPORTE_NULO, Reporte, ReporteRegistro
+from nucleo.etapas import Etapa, FlujoEtapas, MemoriaEtapas
+from nucleo.analisis import (
+    CLAVES_SENTINELHUB, ETAPAS_ANALISIS, FLUJO_ANALISIS, MEMORIA_ETAPAS, OPCIONES_POR_DEFECTO, analizar_parcela,
+    credenciales_faltantes, credenciales_sentinel, crear_processor_sentinel, ejecutar_analisis, mapa_parcela, obtener_datos_satelitales,
+    seleccionar_combinacion, zonificar
+)
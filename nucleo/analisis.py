@@ -0,0 +1,428 @@
+import os
+from datetime import datetime
+import numpy as np
+
+from analisis_gee import (
+    PARAMETROS_CULTIVOS, TensorResultados, calcular_indices_cultivos, calcular_recomendaciones_cultivos
+)
+from cache_resultados import CACHE_RESULTADOS, clave_contenido
+from indices_espectrales import indices_a_descargar
+from ingesta import cargar_parcela, hash_archivo
+from mascara_nubes import FRACCION_VALIDA_MINIMA
+from renderizado import DPI_MAPA, escala_mapa, renderizar_mapa_zonas
+from superficie import calcular_superficie
+from zonificacion import VARIANZA_MAXIMA, dividir_parcela_en_zonas, dividir_parcela_quadtree
+from nucleo.etapas import Etapa, FlujoEtapas, MemoriaEtapas
+from nucleo.progreso import REPORTE_NULO
+
+# Los módulos que leen o procesan rásteres (rasterio) se importan dentro de las funciones que los usan:
+# con datos simulados y grilla regular el análisis no carga rasterio ni sentinelhub
+
+# Opciones del análisis (mismos nombres que los parámetros de analisis_gee_completo)
+OPCIONES_POR_DEFECTO = {
+    'cultivo': 'TRIGO',
+    'nutriente': 'NITRÓGENO',
+    'analisis_tipo': 'FERTILIDAD ACTUAL',
+    'satelite': 'DATOS_SIMULADOS',
+    'indice': 'NDVI',
+    'fecha_inicio': None,
+    'fecha_fin': None,
+    'n_divisiones': 32,
+    'tamano_zona_m': None,
+    'n_clases_kmeans': None,
+    'ancho_aplicacion_m': None,
+    'varianza_maxima': VARIANZA_MAXIMA,
+    'directorio_escenas': None,
+    'estadistico_serie': None,
+    'tipo_muestra': 'FLOAT32',
+    'dpi_mapa': DPI_MAPA
+}
+
+# Credenciales de Sentinel Hub requeridas (mismos nombres en secrets.toml y en variables de entorno)
+CLAVES_SENTINELHUB = ('SENTINELHUB_INSTANCE_ID', 'SENTINELHUB_CLIENT_ID', 'SENTINELHUB_CLIENT_SECRET')
+
+def credenciales_faltantes(fuente=None):
+    """Claves de CLAVES_SENTINELHUB ausentes o vacías en un mapeo (st.secrets) o en el entorno"""
+    fuente = os.environ if fuente is None else fuente
+    return [clave for clave in CLAVES_SENTINELHUB if not fuente.get(clave)]
+
+def credenciales_sentinel(fuente=None):
+    """Config de SatelliteProcessor desde un mapeo (st.secrets) o desde el entorno; None si faltan claves"""
+    fuente = os.environ if fuente is None else fuente
+    if credenciales_faltantes(fuente):
+        return None
+    return {
+        'instance_id': fuente.get('SENTINELHUB_INSTANCE_ID'),
+        'client_id': fuente.get('SENTINELHUB_CLIENT_ID'),
+        'client_secret': fuente.get('SENTINELHUB_CLIENT_SECRET'),
+        'cache_dir': fuente.get('SENTINELHUB_CACHE_DIR', '')
+    }
+
+def crear_processor_sentinel(credenciales, reporte=REPORTE_NULO):
+    """SatelliteProcessor con las credenciales dadas (sentinelhub se importa solo aquí)"""
+    from satellite_processor import SatelliteProcessor
+    return SatelliteProcessor(credenciales, reporte=reporte)
+
+# ===== DATOS SATELITALES =====
+def _datos_raster(bandas, indice, fuente, **extra):
+    """Datos satelitales con el ráster de índices y el NDVI medio de la parcela"""
+    ndvi = bandas['NDVI']
+    return {
+        'indice': indice,
+        'valor_promedio': float(np.nanmean(ndvi)) if np.isfinite(ndvi).any() else 0.6,
+        'fuente': fuente,
+        'resolucion': f"{abs(bandas.transform.a):.0f}m",
+        'raster': bandas,
+        **extra
+    }
+
+def leer_datos_escena_local(gdf, directorio, satelite, fecha_inicio, fecha_fin, indice='NDVI', reporte=REPORTE_NULO):
+    """Calcular índices desde una escena local leyendo solo la ventana de la parcela"""
+    from escenas_locales import indices_escena
+    reporte.info(f"📂 Buscando escenas {satelite} en {directorio}...")
+    bandas, lectura = indices_escena(directorio, gdf, indices_a_descargar(satelite, indice),
+                                     fecha_inicio=fecha_inicio, fecha_fin=fecha_fin, sensor=satelite)
+    reporte.exito(f"✅ Escena local {lectura['escena']}: {lectura['bytes_leidos'] / 1e6:.1f} MB leídos "
+                  f"de {lectura['bytes_escena'] / 1e6:.0f} MB")
+    if 'fraccion_valida' in lectura:
+        reporte.info(f"☁️ Píxeles descartados por nubes/sombras: {(1 - lectura['fraccion_valida']) * 100:.1f}%")
+    return _datos_raster(bandas, indice, f"{satelite} (local)", id_escena=lectura['escena'],
+                         fecha=lectura['fecha'].strftime('%Y-%m-%d') if lectura['fecha'] else '')
+
+def descargar_datos_sentinel_hub(gdf, fecha_inicio, fecha_fin, indice, credenciales, reporte=REPORTE_NULO,
+                                 tipo_muestra='FLOAT32'):
+    """Ráster de índices Sentinel-2 (con máscara de nubes) desde Sentinel Hub, o None
+
+    tipo_muestra 'INT16' o 'UINT8' descarga los índices cuantizados (2x o 4x menos bytes).
+    """
+    reporte.info("🔍 Descargando índices Sentinel-2 desde Sentinel Hub...")
+    processor = crear_processor_sentinel(credenciales, reporte)
+    bandas = processor.download_sentinel2_indices(gdf, fecha_inicio, fecha_fin,
+                                                  indices=indices_a_descargar("SENTINEL-2", indice), cloud_mask=True,
+                                                  sample_type=tipo_muestra)
+    if bandas is None:
+        return None
+    ndvi = bandas['NDVI']
+    reporte.exito(f"✅ Ráster Sentinel-2 descargado: {ndvi.shape[1]}x{ndvi.shape[0]} píxeles")
+    return _datos_raster(bandas, indice, 'Sentinel-2', fecha=datetime.now().strftime('%Y-%m-%d'))
+
+def obtener_serie_temporal(gdf, gdf_zonas, satelite, fecha_inicio, fecha_fin, indice='NDVI',
+                           directorio_escenas=None, estadistico='maximo', credenciales=None, reporte=REPORTE_NULO,
+                           tipo_muestra='FLOAT32'):
+    """Compuesto temporal y series por zona recorriendo las escenas del período de a una"""
+    from composicion_temporal import componer_serie, escenas_locales_por_fecha, escenas_sentinel_hub_por_fecha
+    indices = indices_a_descargar(satelite, indice)
+    if directorio_escenas:
+        escenas = escenas_locales_por_fecha(directorio_escenas, gdf, indices, fecha_inicio, fecha_fin)
+    elif satelite == "SENTINEL-2" and credenciales:
+        escenas = escenas_sentinel_hub_por_fecha(crear_processor_sentinel(credenciales, reporte), gdf, indices,
+                                                 fecha_inicio, fecha_fin, sample_type=tipo_muestra)
+    else:
+        return None
+
+    with reporte.etapa("⏳ Componiendo la serie temporal escena por escena..."):
+        serie = componer_serie(escenas, indices, gdf_zonas, mediana=estadistico == 'mediana')
+    if serie is None:
+        reporte.advertencia("⚠️ No hay escenas en el período seleccionado")
+        return None
+
+    compuesto = serie['compuesto'][estadistico]
+    reporte.exito(f"✅ Compuesto '{estadistico}' de {len(serie['fechas'])} fechas")
+    return _datos_raster(compuesto, indice, f"{satelite} (serie temporal)",
+                         fecha=f"{serie['fechas'][0]} a {serie['fechas'][-1]}", series=serie['series'],
+                         fraccion_valida_series=serie['fraccion_valida'])
+
+def generar_datos_simulados(satelite, indice='NDVI', semilla=None, reporte=REPORTE_NULO):
+    """Datos simulados para demostración (semilla=None: distintos en cada corrida)
+
+    Sin satélite la imagen no depende del cultivo: guarda solo el desvío del NDVI y cada cultivo lo suma
+    a su NDVI óptimo al calcular los índices, así la misma imagen sirve para todos los cultivos del tensor.
+    """
+    rng = np.random.default_rng(semilla)
+    fecha = datetime.now().strftime('%Y-%m-%d')
+    if satelite == "SENTINEL-2":
+        datos = {'valor_promedio': 0.72 + rng.normal(0, 0.08), 'fuente': 'Sentinel-2',
+                 'id_escena': f"S2A_{rng.integers(1000000, 9999999)}",
+                 'cobertura_nubes': f"{rng.integers(0, 10)}%", 'resolucion': '10m'}
+    elif satelite == "LANDSAT-8":
+        datos = {'valor_promedio': 0.65 + rng.normal(0, 0.1), 'fuente': 'Landsat-8',
+                 'id_escena': f"LC08_{rng.integers(1000000, 9999999)}",
+                 'cobertura_nubes': f"{rng.integers(0, 15)}%", 'resolucion': '30m'}
+    else:
+        reporte.info("🔬 Generando datos simulados...")
+        datos = {'desvio_ndvi': rng.normal(0, 0.1), 'fuente': 'Simulación', 'resolucion': '10m'}
+        reporte.exito("✅ Datos simulados generados")
+        return {'indice': indice, 'fecha': fecha, **datos}
+
+    reporte.info(f"🔍 Buscando escenas {satelite}...")
+    reporte.exito(f"✅ Escena {datos['fuente']} encontrada: {datos['id_escena']}")
+    reporte.info(f"☁️ Cobertura de nubes: {datos['cobertura_nubes']}")
+    return {'indice': indice, 'fecha': fecha, **datos}
+
+def obtener_datos_satelitales(gdf, gdf_zonas, opciones, credenciales=None, semilla=None, reporte=REPORTE_NULO):
+    """Serie temporal, escena local o Sentinel Hub según las opciones; si fallan, datos simulados"""
+    satelite, indice = opciones['satelite'], opciones['indice']
+    fecha_inicio, fecha_fin = opciones['fecha_inicio'], opciones['fecha_fin']
+    directorio = opciones['directorio_escenas'] if satelite in ("SENTINEL-2", "LANDSAT-8") else None
+
+    if opciones['estadistico_serie'] and satelite in ("SENTINEL-2", "LANDSAT-8"):
+        datos = obtener_serie_temporal(gdf, gdf_zonas, satelite, fecha_inicio, fecha_fin, indice, directorio,
+                                       opciones['estadistico_serie'], credenciales, reporte, opciones['tipo_muestra'])
+        if datos is not None:
+            return datos
+
+    # Sin serie temporal (o sin escenas): una sola imagen del período
+    if directorio:
+        try:
+            return leer_datos_escena_local(gdf, directorio, satelite, fecha_inicio, fecha_fin, indice, reporte)
+        except Exception as e:
+            reporte.advertencia(f"⚠️ No se pudo leer la escena local, usando otra fuente: {str(e)}")
+    if satelite == "SENTINEL-2" and credenciales:
+        try:
+            datos = descargar_datos_sentinel_hub(gdf, fecha_inicio, fecha_fin, indice, credenciales, reporte,
+                                                 opciones['tipo_muestra'])
+            if datos is not None:
+                return datos
+        except Exception as e:
+            reporte.advertencia(f"⚠️ No se pudo descargar el ráster Sentinel-2, usando simulación: {str(e)}")
+    return generar_datos_simulados(satelite, indice, semilla, reporte)
+
+# ===== PIPELINE COMPLETO =====
+def zonificar(gdf, opciones, raster=None, reporte=REPORTE_NULO):
+    """Zonas de manejo: grilla, o k-means / quadtree sobre el ráster con la grilla como respaldo"""
+    if opciones['n_clases_kmeans'] or opciones['ancho_aplicacion_m']:
+        if raster is not None:
+            try:
+                if opciones['n_clases_kmeans']:
+                    from zonas_kmeans import zonificar_kmeans
+                    with reporte.etapa("Agrupando píxeles y poligonizando zonas..."):
+                        zonas = zonificar_kmeans(gdf, raster, opciones['n_clases_kmeans'])
+                    reporte.exito(f"✅ {len(zonas)} zonas de manejo en {opciones['n_clases_kmeans']} clases")
+                else:
+                    with reporte.etapa("Subdividiendo las celdas heterogéneas (quadtree)..."):
+                        zonas = dividir_parcela_quadtree(gdf, raster, 'NDVI', opciones['varianza_maxima'],
+                                                         opciones['ancho_aplicacion_m'])
+                    reporte.exito(f"✅ Parcela dividida en {len(zonas)} zonas adaptativas")
+                return zonas
+            except ValueError as e:
+                reporte.advertencia(f"⚠️ No se pudo zonificar sobre el ráster, usando la grilla: {str(e)}")
+        else:
+            reporte.advertencia("⚠️ Sin ráster de índices para zonificar: se usa la grilla")
+        tamano_zona_m = None
+    else:
+        tamano_zona_m = opciones['tamano_zona_m']
+
+    with reporte.etapa("Dividiendo parcela..."):
+        zonas = dividir_parcela_en_zonas(gdf, opciones['n_divisiones'], tamano_zona_m)
+    reporte.exito(f"✅ Parcela dividida en {len(zonas)} zonas")
+    return zonas
+
+# ===== ETAPAS DEL ANÁLISIS =====
+# Cada etapa declara las etapas previas y las opciones que usa; su resultado se memoiza bajo el hash de
+# esas entradas. Opciones de la corrida además de OPCIONES_POR_DEFECTO: 'gdf' o 'nombre_parcela' y
+# 'datos_parcela', 'credenciales', 'semilla', 'todas_las_combinaciones' y 'titulo_mapa'.
+def _zonas_desde_raster(opciones):
+    return bool(opciones['n_clases_kmeans'] or opciones['ancho_aplicacion_m'])
+
+def _cultivos(opciones):
+    """Cultivos del tensor: todos para la comparación instantánea, si no solo el elegido"""
+    return tuple(PARAMETROS_CULTIVOS) if opciones.get('todas_las_combinaciones') else (opciones['cultivo'],)
+
+def _parametros_ingesta(opciones):
+    """Hash del contenido de la parcela: bytes del archivo subido o geometrías ya leídas"""
+    if opciones.get('datos_parcela') is not None:
+        return {'contenido': hash_archivo(opciones['datos_parcela'])}
+    gdf = opciones['gdf']
+    return {'contenido': clave_contenido(gdf.geometry.values, crs=gdf.crs)}
+
+def _ingesta(entradas, opciones, reporte):
+    if opciones.get('datos_parcela') is not None:
+        return cargar_parcela(opciones['nombre_parcela'], opciones['datos_parcela'])[0]
+    return opciones['gdf']
+
+def _dependencias_subdivision(opciones):
+    return ('ingesta', 'imagen') if _zonas_desde_raster(opciones) else ('ingesta',)
+
+def _parametros_subdivision(opciones):
+    if _zonas_desde_raster(opciones):
+        # La grilla de respaldo (sin ráster) usa n_divisiones
+        return {nombre: opciones[nombre] for nombre in ('n_clases_kmeans', 'ancho_aplicacion_m', 'varianza_maxima',
+                                                        'n_divisiones')}
+    return {nombre: opciones[nombre] for nombre in ('n_divisiones', 'tamano_zona_m')}
+
+def _subdivision(entradas, opciones, reporte):
+    if _zonas_desde_raster(opciones):
+        reporte.seccion("📐 ZONIFICANDO SEGÚN LA VARIABILIDAD DEL ÍNDICE")
+        return zonificar(entradas['ingesta'], opciones, entradas['imagen'].get('raster'), reporte)
+    reporte.seccion("📐 DIVIDIENDO PARCELA EN ZONAS DE MANEJO")
+    return zonificar(entradas['ingesta'], opciones, reporte=reporte)
+
+def _superficie(entradas, opciones, reporte):
+    return calcular_superficie(entradas['subdivision'])
+
+def _serie_por_zonas(opciones):
+    """La serie temporal con grilla se compone por zona: la imagen depende de la subdivisión"""
+    return bool(opciones['estadistico_serie'] and opciones['satelite'] in ("SENTINEL-2", "LANDSAT-8")
+                and not _zonas_desde_raster(opciones))
+
+def _dependencias_imagen(opciones):
+    return ('ingesta', 'subdivision') if _serie_por_zonas(opciones) else ('ingesta',)
+
+def _parametros_imagen(opciones):
+    parametros = {nombre: opciones.get(nombre) for nombre in ('satelite', 'indice', 'fecha_inicio', 'fecha_fin',
+                                                              'directorio_escenas', 'estadistico_serie', 'semilla',
+                                                              'tipo_muestra')}
+    parametros['sentinel_hub'] = bool(opciones.get('credenciales'))
+    return parametros
+
+def _imagen(entradas, opciones, reporte):
+    reporte.seccion("🛰️ OBTENIENDO DATOS SATELITALES")
+    return obtener_datos_satelitales(entradas['ingesta'], entradas.get('subdivision'), opciones,
+                                     opciones.get('credenciales'), opciones.get('semilla'), reporte)
+
+def _indices(entradas, opciones, reporte):
+    gdf_dividido, raster = entradas['subdivision'], entradas['imagen'].get('raster')
+
+    # Estadísticas por zona sobre los píxeles del ráster (si se descargó)
+    estadisticas = None
+    fraccion_valida = None
+    if raster is not None:
+        from estadisticas_zonales import estadisticas_zonales, rasterizar_zonas
+        with reporte.etapa("Calculando estadísticas zonales sobre el ráster..."):
+            etiquetas = rasterizar_zonas(gdf_dividido, raster.transform, raster.shape, raster.crs)
+            estadisticas = estadisticas_zonales(raster, etiquetas, len(gdf_dividido), index=gdf_dividido.index)
+        # Fracción de cada zona libre de nubes, sombras y nodata
+        fraccion_valida = next(iter(estadisticas.values()))['fraccion_valida'].fillna(0)
+        zonas_nubladas = int((fraccion_valida < FRACCION_VALIDA_MINIMA).sum())
+        if zonas_nubladas:
+            reporte.advertencia(f"☁️ {zonas_nubladas} zonas con menos de {FRACCION_VALIDA_MINIMA:.0%} de píxeles "
+                                f"válidos: sus índices usan la estimación en lugar de la media del ráster")
+
+    # PASO 3: ÍNDICES GEE DE LOS CULTIVOS DEL TENSOR
+    reporte.seccion("🔬 CALCULANDO ÍNDICES SATELITALES GEE")
+    cultivos = _cultivos(opciones)
+    descripcion = f"{len(cultivos)} cultivos" if len(cultivos) > 1 else cultivos[0]
+    with reporte.etapa(f"Ejecutando algoritmos GEE para {descripcion}..."):
+        indices = calcular_indices_cultivos(gdf_dividido, cultivos, entradas['imagen'], estadisticas=estadisticas)
+    return {'cultivos': cultivos, 'indices': indices, 'fraccion_valida': fraccion_valida}
+
+def _recomendaciones(entradas, opciones, reporte):
+    # PASO 4: DOSIS DE N, P y K DE TODOS LOS CULTIVOS EN UNA SOLA PASADA
+    indices = entradas['indices']
+    with reporte.etapa("Calculando recomendaciones NPK..."):
+        return calcular_recomendaciones_cultivos(indices['indices'], indices['cultivos'])
+
+def _categorizacion(entradas, opciones, reporte):
+    # PASO 5: CATEGORÍAS DE TODAS LAS COMBINACIONES Y SELECCIÓN DE LA ELEGIDA
+    gdf_dividido, areas_ha, indices = entradas['subdivision'], entradas['superficie'], entradas['indices']
+    tensor = TensorResultados(gdf_dividido.index, indices['cultivos'], indices['indices'],
+                              entradas['recomendaciones'], areas_ha, indices['fraccion_valida'])
+    resultado = {
+        'gdf_zonas': gdf_dividido,
+        'tensor': tensor,
+        'datos_satelitales': entradas['imagen'],
+        'area_total': float(areas_ha.sum())
+    }
+    return seleccionar_combinacion(resultado, opciones['cultivo'], opciones['nutriente'], opciones['analisis_tipo'])
+
+def _mapa(entradas, opciones, reporte):
+    return mapa_parcela(entradas['categorizacion']['gdf'], opciones, opciones.get('titulo_mapa', ''))
+
+def _clave_mapa(entradas, opciones):
+    """Clave del PNG por contenido: geometrías y valores categorizados, no solo las opciones"""
+    resultado = entradas['categorizacion']
+    gdf = resultado['gdf']
+    return clave_contenido(
+        gdf.geometry.values, gdf[resultado['columna_valor']].to_numpy(), gdf['id_zona'].to_numpy(), tipo='mapa',
+        columna=resultado['columna_valor'], cultivo=opciones['cultivo'], nutriente=opciones['nutriente'],
+        analisis_tipo=opciones['analisis_tipo'], dpi=opciones['dpi_mapa'], titulo=opciones.get('titulo_mapa', ''),
+        crs=gdf.crs
+    )
+
+def _exportacion(entradas, opciones, reporte):
+    return entradas['categorizacion']['gdf'].to_csv(index=False).encode('utf-8')
+
+def _clave_exportacion(entradas, opciones):
+    """Clave del CSV por contenido: geometrías, todas las columnas de la tabla y las categorías"""
+    resultado = entradas['categorizacion']
+    gdf = resultado['gdf']
+    return clave_contenido(
+        gdf.geometry.values, gdf['id_zona'].to_numpy(), *resultado['tabla_zonas'].columnas.values(),
+        resultado['categorias'].codes, tipo='csv', columnas=','.join(gdf.columns)
+    )
+
+ETAPAS_ANALISIS = (
+    Etapa('ingesta', _ingesta, parametros=_parametros_ingesta),
+    Etapa('subdivision', _subdivision, _dependencias_subdivision, _parametros_subdivision),
+    Etapa('superficie', _superficie, ('subdivision',)),
+    Etapa('imagen', _imagen, _dependencias_imagen, _parametros_imagen),
+    Etapa('indices', _indices, ('subdivision', 'imagen'), lambda opciones: {'cultivos': _cultivos(opciones)}),
+    Etapa('recomendaciones', _recomendaciones, ('indices',)),
+    Etapa('categorizacion', _categorizacion, ('subdivision', 'superficie', 'imagen', 'indices', 'recomendaciones'),
+          ('cultivo', 'nutriente', 'analisis_tipo')),
+    # PNG y CSV van a la caché de bytes compartida (con nivel en disco si está configurado), con clave por
+    # contenido: la imagen simulada sin semilla no es determinista y otro proceso puede haber guardado
+    # el resultado de otra imagen con las mismas opciones
+    Etapa('mapa', _mapa, ('categorizacion',), ('cultivo', 'nutriente', 'analisis_tipo', 'dpi_mapa', 'titulo_mapa'),
+          almacen=CACHE_RESULTADOS, clave_contenido=_clave_mapa),
+    Etapa('exportacion', _exportacion, ('categorizacion',), almacen=CACHE_RESULTADOS,
+          clave_contenido=_clave_exportacion)
+)
+FLUJO_ANALISIS = FlujoEtapas(ETAPAS_ANALISIS)
+# Memoria de etapas del proceso: la interfaz la comparte entre reruns y sesiones
+MEMORIA_ETAPAS = MemoriaEtapas()
+
+def ejecutar_analisis(opciones, objetivos=('categorizacion',), memoria=None, reporte=REPORTE_NULO, previos=None):
+    """Ejecuta las etapas necesarias para los objetivos; devuelve ({objetivo: resultado}, registro)
+
+    opciones completa OPCIONES_POR_DEFECTO y debe incluir la parcela ('gdf', o 'nombre_parcela' y
+    'datos_parcela'). El registro [(etapa, acierto, segundos)] indica qué etapas se reutilizaron.
+    previos {etapa: resultado} evita recalcular etapas que quien llama ya tiene (p. ej. la categorización
+    elegida con seleccionar_combinacion).
+    """
+    return FLUJO_ANALISIS.ejecutar(objetivos, {**OPCIONES_POR_DEFECTO, **opciones}, memoria, reporte, previos)
+
+def analizar_parcela(gdf, opciones=None, credenciales=None, semilla=None, reporte=REPORTE_NULO,
+                     todas_las_combinaciones=False, memoria=None):
+    """PASO 1-5 del análisis (zonas, datos satelitales, índices, recomendaciones y categorías) sin interfaz
+
+    opciones completa OPCIONES_POR_DEFECTO. Devuelve un dict con 'gdf' (zonas analizadas), 'tabla_zonas',
+    'categorias', 'resumen_categorias', 'columna_valor', 'datos_satelitales' y 'area_total', más el
+    'tensor' de resultados, las zonas sin analizar ('gdf_zonas') y el registro de 'etapas'. Con
+    todas_las_combinaciones el tensor cubre todos los cultivos y seleccionar_combinacion cambia de
+    cultivo, nutriente o análisis sin recalcular (la imagen, o la simulación del cultivo elegido, se
+    obtiene una sola vez). Con memoria (p. ej. MEMORIA_ETAPAS) se reutilizan las etapas ya calculadas.
+    """
+    corrida = {**(opciones or {}), 'gdf': gdf, 'credenciales': credenciales, 'semilla': semilla,
+               'todas_las_combinaciones': todas_las_combinaciones}
+    resultados, registro = ejecutar_analisis(corrida, memoria=memoria, reporte=reporte)
+    return {**resultados['categorizacion'], 'etapas': registro}
+
+def seleccionar_combinacion(resultado, cultivo, nutriente, analisis_tipo):
+    """Resultado de analizar_parcela para otra combinación del tensor: vistas e indexación, sin recalcular"""
+    tensor = resultado['tensor']
+    tabla_zonas, columna_valor = tensor.tabla(cultivo, nutriente, analisis_tipo)
+    categorias, resumen_categorias = tensor.categorizar(cultivo, nutriente, analisis_tipo)
+
+    # Adjuntar todas las columnas al GeoDataFrame en bloque
+    gdf_analizado = tabla_zonas.adjuntar(resultado['gdf_zonas'])
+    gdf_analizado['categoria'] = categorias
+    return {
+        **resultado,
+        'gdf': gdf_analizado,
+        'tabla_zonas': tabla_zonas,
+        'categorias': categorias,
+        'resumen_categorias': resumen_categorias,
+        'columna_valor': columna_valor
+    }
+
+def mapa_parcela(gdf_analizado, opciones, titulo):
+    """PNG del mapa de zonas con la paleta y el rango del análisis"""
+    opciones = {**OPCIONES_POR_DEFECTO, **opciones}
+    cmap, vmin, vmax, columna, etiqueta = escala_mapa(opciones['analisis_tipo'], opciones['nutriente'],
+                                                      opciones['cultivo'])
+    return renderizar_mapa_zonas(
+        gdf_analizado.geometry.values, gdf_analizado[columna].to_numpy(), gdf_analizado['id_zona'].to_numpy(),
+        cmap, vmin, vmax, f"{titulo}\n{etiqueta}", etiqueta,
+        geografico=bool(gdf_analizado.crs and gdf_analizado.crs.is_geographic), dpi=opciones['dpi_mapa']
+    ).getvalue()
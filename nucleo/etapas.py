@@ -0,0 +1,144 @@
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+from nucleo.progreso import REPORTE_NULO
+
+# Resultados de etapas conservados en memoria por proceso (LRU, compartidos entre sesiones)
+MAX_RESULTADOS_ETAPAS = 36
+
+class Etapa:
+    """Paso del análisis con sus entradas declaradas: etapas previas y opciones que usa
+
+    dependencias es una tupla de nombres de etapas y parametros una tupla de nombres de opciones; ambos
+    pueden ser funciones de las opciones cuando dependen del modo (p. ej. zonas por grilla o por ráster).
+    funcion(entradas, opciones, reporte) recibe {etapa previa: resultado} y no debe devolver None.
+    almacen reemplaza la memoria del flujo para esta etapa (p. ej. CACHE_RESULTADOS para bytes).
+    clave_contenido(entradas, opciones), si se da, reemplaza la clave por parámetros en el almacén: se
+    evalúan antes las dependencias y la clave sale de su contenido. Así un almacén compartido entre
+    procesos no devuelve un resultado de otra corrida cuyas etapas previas dieron algo distinto.
+    """
+
+    def __init__(self, nombre, funcion, dependencias=(), parametros=(), almacen=None, clave_contenido=None):
+        self.nombre = nombre
+        self.funcion = funcion
+        self.dependencias = dependencias
+        self.parametros = parametros
+        self.almacen = almacen
+        self.clave_contenido = clave_contenido
+
+    def entradas(self, opciones):
+        """(dependencias, {parámetro: valor}) de la etapa para estas opciones"""
+        dependencias = self.dependencias(opciones) if callable(self.dependencias) else self.dependencias
+        parametros = self.parametros(opciones) if callable(self.parametros) else self.parametros
+        if not isinstance(parametros, dict):
+            parametros = {nombre: opciones.get(nombre) for nombre in parametros}
+        return tuple(dependencias), parametros
+
+class MemoriaEtapas:
+    """Resultados de etapas por clave, LRU acotada en cantidad de entradas"""
+
+    def __init__(self, max_entradas=MAX_RESULTADOS_ETAPAS):
+        self.max_entradas = max_entradas
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entradas)
+
+    def obtener(self, clave):
+        """Resultado guardado o None"""
+        with self._lock:
+            valor = self._entradas.get(clave)
+            if valor is not None:
+                self._entradas.move_to_end(clave)
+            return valor
+
+    def guardar(self, clave, valor):
+        with self._lock:
+            self._entradas[clave] = valor
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+    def limpiar(self):
+        with self._lock:
+            self._entradas.clear()
+
+class FlujoEtapas:
+    """Grafo de etapas con resultados memoizados bajo el hash de sus entradas
+
+    La clave de una etapa combina su nombre, sus parámetros y las claves de sus dependencias, así que se
+    conoce sin ejecutar nada: una etapa con acierto no necesita las previas, y cambiar una opción invalida
+    solo las etapas que la declaran y las que dependen de ellas.
+    """
+
+    def __init__(self, etapas):
+        self.etapas = {etapa.nombre: etapa for etapa in etapas}
+
+    def claves(self, objetivos, opciones):
+        """{etapa: clave} de los objetivos y todas sus dependencias"""
+        claves = {}
+
+        def visitar(nombre, camino):
+            if nombre in claves:
+                return claves[nombre]
+            if nombre in camino:
+                raise ValueError(f"Ciclo de etapas: {' -> '.join(camino + (nombre,))}")
+            if nombre not in self.etapas:
+                raise KeyError(f"Etapa desconocida: {nombre}")
+            dependencias, parametros = self.etapas[nombre].entradas(opciones)
+            h = hashlib.blake2b(nombre.encode(), digest_size=20)
+            for parametro in sorted(parametros):
+                h.update(f"|{parametro}={parametros[parametro]!r}".encode())
+            for dependencia in dependencias:
+                h.update(f"|{dependencia}:{visitar(dependencia, camino + (nombre,))}".encode())
+            claves[nombre] = h.hexdigest()
+            return claves[nombre]
+
+        for objetivo in objetivos:
+            visitar(objetivo, ())
+        return claves
+
+    def ejecutar(self, objetivos, opciones, memoria=None, reporte=REPORTE_NULO, previos=None):
+        """Resultados {objetivo: valor} y el registro [(etapa, acierto, segundos)] en orden de ejecución
+
+        Sin memoria cada etapa necesaria se ejecuta una vez en esta corrida. Con memoria, una etapa
+        cuya clave ya está guardada se reutiliza (acierto) y sus dependencias no se evalúan (salvo las
+        etapas con clave_contenido, que necesitan las entradas para calcular su clave). previos
+        {etapa: valor} son resultados ya obtenidos por quien llama: se usan tal cual, sin memoria ni registro.
+        """
+        claves = self.claves(objetivos, opciones)
+        valores, registro = dict(previos or {}), []
+
+        def evaluar(nombre):
+            if nombre in valores:
+                return valores[nombre]
+            etapa = self.etapas[nombre]
+            # almacen puede definir __len__ (CacheBytes): una caché vacía no debe confundirse con None
+            almacen = None if memoria is None else etapa.almacen if etapa.almacen is not None else memoria
+            clave, entradas = claves[nombre], None
+            if almacen is not None and etapa.clave_contenido is not None:
+                entradas = {dependencia: evaluar(dependencia) for dependencia in etapa.entradas(opciones)[0]}
+                clave = etapa.clave_contenido(entradas, opciones)
+            inicio = time.perf_counter()
+            valor = almacen.obtener(clave) if almacen is not None else None
+            if valor is not None:
+                segundos = time.perf_counter() - inicio
+                registro.append((nombre, True, segundos))
+                reporte.memoizacion(nombre, True, segundos)
+            else:
+                if entradas is None:
+                    entradas = {dependencia: evaluar(dependencia) for dependencia in etapa.entradas(opciones)[0]}
+                inicio = time.perf_counter()
+                valor = etapa.funcion(entradas, opciones, reporte)
+                segundos = time.perf_counter() - inicio
+                if almacen is not None:
+                    almacen.guardar(clave, valor)
+                registro.append((nombre, False, segundos))
+                reporte.memoizacion(nombre, False, segundos)
+            valores[nombre] = valor
+            return valor
+
+        return {objetivo: evaluar(objetivo) for objetivo in objetivos}, registro
@@ -0,0 +1,63 @@
+import logging
+from contextlib import contextmanager
+
+class Reporte:
+    """Interfaz de progreso del núcleo de cálculo; la implementación base no hace nada
+
+    La interfaz de Streamlit, el procesamiento por lotes y las pruebas pasan su propia subclase.
+    """
+
+    def seccion(self, titulo):
+        """Inicio de un paso del análisis"""
+
+    def info(self, mensaje):
+        """Mensaje informativo"""
+
+    def exito(self, mensaje):
+        """Paso completado"""
+
+    def advertencia(self, mensaje):
+        """Problema recuperable (p. ej. se usa una fuente de respaldo)"""
+
+    def error(self, mensaje):
+        """Error que interrumpe un paso"""
+
+    @contextmanager
+    def etapa(self, mensaje):
+        """Bloque de trabajo largo (un spinner en la interfaz)"""
+        yield
+
+    def memoizacion(self, nombre, acierto, segundos):
+        """Etapa del flujo reutilizada de la memoria (acierto) o ejecutada (fallo)"""
+
+# Reporte por defecto: sin costo para workers y pruebas
+REPORTE_NULO = Reporte()
+
+class ReporteRegistro(Reporte):
+    """Reporte hacia logging que además conserva las advertencias y errores emitidos"""
+
+    def __init__(self, nombre='analizador', contexto=''):
+        self.logger = logging.getLogger(nombre)
+        self.contexto = f"{contexto}: " if contexto else ''
+        self.advertencias = []
+
+    def seccion(self, titulo):
+        self.logger.debug("%s%s", self.contexto, titulo)
+
+    def info(self, mensaje):
+        self.logger.debug("%s%s", self.contexto, mensaje)
+
+    def exito(self, mensaje):
+        self.logger.info("%s%s", self.contexto, mensaje)
+
+    def advertencia(self, mensaje):
+        self.advertencias.append(mensaje)
+        self.logger.warning("%s%s", self.contexto, mensaje)
+
+    def error(self, mensaje):
+        self.advertencias.append(mensaje)
+        self.logger.error("%s%s", self.contexto, mensaje)
+
+    def memoizacion(self, nombre, acierto, segundos):
+        self.logger.debug("%setapa %s: %s (%.3f s)", self.contexto, nombre, 'acierto' if acierto else 'fallo',
+                          segundos)
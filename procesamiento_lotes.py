@@ -0,0 +1,289 @@
+import os
+import sys
+import time
+import argparse
+import logging
+import importlib.util
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+
+from analisis_gee import NUTRIENTES, PARAMETROS_CULTIVOS
+from ingesta import EXTENSIONES_DIRECTAS, hash_archivo, leer_parcela
+from renderizado import DPI_MAPA
+from zonificacion import VARIANZA_MAXIMA
+from nucleo import OPCIONES_POR_DEFECTO as OPCIONES_ANALISIS
+from nucleo import ReporteRegistro, analizar_parcela, credenciales_sentinel, mapa_parcela
+
+EXTENSIONES_PARCELA = ('.zip',) + EXTENSIONES_DIRECTAS
+# Al recorrer un directorio solo cuentan ZIP, GeoPackage y GeoJSON: un .json suelto puede ser cualquier
+# cosa (metadatos, manifiestos); desde un manifiesto se aceptan todas las EXTENSIONES_PARCELA
+EXTENSIONES_DIRECTORIO = ('.zip', '.gpkg', '.geojson')
+FORMATOS_SALIDA = ('gpkg', 'parquet')
+
+# Opciones del análisis más el formato de salida del lote
+OPCIONES_POR_DEFECTO = {**OPCIONES_ANALISIS, 'formato': 'gpkg'}
+OPCIONES_ENTERAS = ('n_divisiones', 'n_clases_kmeans', 'dpi_mapa')
+OPCIONES_REALES = ('tamano_zona_m', 'ancho_aplicacion_m', 'varianza_maxima')
+
+# ===== ENTRADA: DIRECTORIO O MANIFIESTO =====
+def nombre_salida(archivo, base):
+    """Nombre de los resultados de una parcela: ruta relativa a base sin extensión, con '__' como separador
+
+    Dos parcelas en subdirectorios distintos con el mismo nombre de archivo no se pisan en la salida.
+    """
+    relativa = os.path.splitext(os.path.relpath(archivo, base))[0]
+    return '__'.join(parte for parte in relativa.replace('\\', '/').split('/') if parte)
+
+def _convertir_opcion(nombre, valor):
+    """Convierte un valor de texto del manifiesto al tipo de la opción"""
+    if nombre in OPCIONES_ENTERAS:
+        return int(float(valor))
+    if nombre in OPCIONES_REALES:
+        return float(valor)
+    return str(valor)
+
+def listar_parcelas(entrada, excluir=()):
+    """Tareas [{'archivo', opciones...}] desde un directorio de parcelas o un manifiesto CSV
+
+    En un directorio se toman los archivos EXTENSIONES_DIRECTORIO de todos los subdirectorios salvo los
+    de excluir (p. ej. el directorio de salida, para que una segunda corrida no lea sus propios
+    resultados). El manifiesto tiene una columna 'archivo' (relativa al manifiesto) y, opcionalmente,
+    columnas con nombres de OPCIONES_POR_DEFECTO que reemplazan las opciones generales para esa parcela.
+    """
+    if os.path.isdir(entrada):
+        excluidos = {os.path.realpath(directorio) for directorio in excluir}
+        if os.path.realpath(entrada) in excluidos:
+            raise ValueError(f"El directorio de entrada {entrada} no puede ser el de salida")
+        archivos = []
+        for raiz, directorios, nombres in os.walk(entrada):
+            directorios[:] = sorted(directorio for directorio in directorios
+                                    if os.path.realpath(os.path.join(raiz, directorio)) not in excluidos)
+            archivos += [os.path.join(raiz, nombre) for nombre in sorted(nombres)
+                         if nombre.lower().endswith(EXTENSIONES_DIRECTORIO)]
+        return [{'archivo': archivo, 'nombre': nombre_salida(archivo, entrada)} for archivo in archivos]
+
+    manifiesto = pd.read_csv(entrada, dtype=str, keep_default_na=False)
+    if 'archivo' not in manifiesto:
+        raise ValueError(f"El manifiesto {entrada} no tiene la columna 'archivo'")
+    base = os.path.dirname(os.path.abspath(entrada))
+    tareas = []
+    for fila in manifiesto.to_dict('records'):
+        archivo = os.path.join(base, fila.pop('archivo'))
+        tarea = {'archivo': archivo, 'nombre': nombre_salida(archivo, base)}
+        tarea.update({nombre: _convertir_opcion(nombre, valor) for nombre, valor in fila.items()
+                      if nombre in OPCIONES_POR_DEFECTO and valor != ''})
+        tareas.append(tarea)
+    return tareas
+
+# ===== TAREA POR PARCELA (PROCESO DEL POOL) =====
+def _opciones_tarea(tarea, opciones_generales):
+    """Opciones generales con las de la tarea (columnas del manifiesto) encima"""
+    opciones = dict(opciones_generales)
+    opciones.update({nombre: valor for nombre, valor in tarea.items() if nombre not in ('archivo', 'nombre')})
+    return opciones
+
+def clave_tarea(datos, opciones):
+    """Identifica una corrida: contenido del archivo más todas las opciones con que se analizó"""
+    return hash_archivo(repr((hash_archivo(datos), sorted(opciones.items()))).encode())
+
+def procesar_parcela(tarea, directorio_salida, opciones_generales):
+    """Analiza una parcela y escribe sus resultados; devuelve la fila del resumen (sin lanzar excepciones)"""
+    opciones = _opciones_tarea(tarea, opciones_generales)
+    archivo = tarea['archivo']
+    nombre = tarea.get('nombre') or os.path.splitext(os.path.basename(archivo))[0]
+    fila = {'parcela': nombre, 'archivo': archivo, 'cultivo': opciones['cultivo'],
+            'nutriente': opciones['nutriente'], 'analisis_tipo': opciones['analisis_tipo']}
+    inicio = time.perf_counter()
+    try:
+        with open(archivo, 'rb') as f:
+            datos = f.read()
+        gdf = leer_parcela(archivo, datos)
+        # Semilla derivada del contenido: el mismo archivo da los mismos resultados en cada corrida
+        semilla = int(hash_archivo(datos)[:8], 16)
+        reporte = ReporteRegistro(contexto=nombre)
+        resultado = analizar_parcela(gdf, opciones, credenciales=credenciales_sentinel(), semilla=semilla,
+                                     reporte=reporte)
+        gdf_analizado, columna_valor = resultado['gdf'], resultado['columna_valor']
+
+        ruta_datos = os.path.join(directorio_salida, f"{nombre}.{opciones['formato']}")
+        salida = gdf_analizado.assign(categoria=gdf_analizado['categoria'].astype(str))
+        if opciones['formato'] == 'parquet':
+            salida.to_parquet(ruta_datos, index=False)
+        else:
+            salida.to_file(ruta_datos, driver='GPKG', layer='zonas')
+        ruta_mapa = os.path.join(directorio_salida, f"{nombre}.png")
+        titulo = f"{nombre} - {opciones['cultivo']}\n{opciones['satelite']} - {opciones['analisis_tipo']}"
+        with open(ruta_mapa, 'wb') as f:
+            f.write(mapa_parcela(gdf_analizado, opciones, titulo))
+
+        valores = gdf_analizado[columna_valor]
+        fila.update({
+            'estado': 'ok',
+            'zonas': len(gdf_analizado),
+            'area_ha': float(gdf_analizado['area_ha'].sum()),
+            'valor_promedio': float(valores.mean()),
+            'coef_variacion': float(valores.std() / valores.mean() * 100) if valores.mean() else np.nan,
+            'categoria_principal': resultado['resumen_categorias']['area_ha'].idxmax(),
+            'fuente': resultado['datos_satelitales']['fuente'],
+            'advertencias': ' | '.join(reporte.advertencias),
+            'salida': ruta_datos,
+            'mapa': ruta_mapa,
+            'clave': clave_tarea(datos, opciones)
+        })
+    except Exception as e:
+        fila.update({'estado': 'error', 'error': f"{type(e).__name__}: {e}",
+                     'detalle': traceback.format_exc(limit=3)})
+    fila['segundos'] = round(time.perf_counter() - inicio, 3)
+    return fila
+
+def _duplicadas(tareas, opciones):
+    """{índice: fila de error} de las parcelas cuyo nombre de salida se repite (ninguna de ellas se procesa)"""
+    nombres = pd.Series([tarea.get('nombre') or os.path.splitext(os.path.basename(tarea['archivo']))[0]
+                         for tarea in tareas], dtype=object)
+    filas = {}
+    for i in nombres.index[nombres.duplicated(keep=False)]:
+        tarea = {**opciones, **tareas[i]}
+        archivos = ', '.join(tareas[j]['archivo'] for j in nombres.index[nombres == nombres[i]])
+        filas[i] = {'parcela': nombres[i], 'archivo': tarea['archivo'], 'cultivo': tarea['cultivo'],
+                    'nutriente': tarea['nutriente'], 'analisis_tipo': tarea['analisis_tipo'], 'estado': 'error',
+                    'error': f"Nombre de salida repetido: {nombres[i]} ({archivos})", 'segundos': 0.0}
+    return filas
+
+def _terminadas(tareas, directorio_salida, opciones):
+    """{índice: fila} de las tareas ya analizadas con éxito en un resumen.csv anterior
+
+    Cuentan solo las filas 'ok' con la misma clave (mismo archivo y mismas opciones) cuyos resultados
+    siguen en disco; cualquier otro cambio vuelve a procesar la parcela.
+    """
+    ruta = os.path.join(directorio_salida, 'resumen.csv')
+    if not os.path.exists(ruta):
+        return {}
+    try:
+        anterior = pd.read_csv(ruta)
+    except pd.errors.EmptyDataError:
+        return {}
+    if not {'estado', 'clave', 'salida', 'mapa'} <= set(anterior.columns):
+        return {}
+    previas = {fila['clave']: fila for fila in anterior[anterior['estado'] == 'ok'].to_dict('records')
+               if os.path.exists(fila['salida']) and os.path.exists(fila['mapa'])}
+    terminadas = {}
+    for i, tarea in enumerate(tareas):
+        try:
+            with open(tarea['archivo'], 'rb') as f:
+                clave = clave_tarea(f.read(), _opciones_tarea(tarea, opciones))
+        except OSError:
+            continue
+        if clave in previas:
+            terminadas[i] = {**previas[clave], 'archivo': tarea['archivo']}
+    return terminadas
+
+def procesar_lote(tareas, directorio_salida, opciones=None, procesos=None, progreso=None, reanudar=False):
+    """Reparte las parcelas en un pool de procesos y escribe resumen.csv; devuelve el resumen
+
+    procesos=1 procesa en el proceso actual (útil para depurar). progreso(fila, hechas, total) se llama
+    al terminar cada parcela. Las parcelas que escribirían en el mismo nombre de salida se informan como
+    error en lugar de sobrescribirse entre sí. Con reanudar=True las parcelas ya analizadas con las
+    mismas opciones según el resumen.csv anterior no se vuelven a procesar y conservan su fila.
+    """
+    opciones = {**OPCIONES_POR_DEFECTO, **(opciones or {})}
+    if opciones['formato'] not in FORMATOS_SALIDA:
+        raise ValueError(f"Formato no soportado: {opciones['formato']}")
+    if opciones['formato'] == 'parquet' and importlib.util.find_spec('pyarrow') is None:
+        raise ValueError("El formato parquet requiere pyarrow (pip install pyarrow); use --formato gpkg")
+    os.makedirs(directorio_salida, exist_ok=True)
+    procesos = procesos or os.cpu_count() or 1
+
+    filas = []
+    duplicadas = _duplicadas(tareas, opciones)
+    omitidas = _terminadas(tareas, directorio_salida, opciones) if reanudar else {}
+    for fila in list(duplicadas.values()) + [fila for i, fila in omitidas.items() if i not in duplicadas]:
+        filas.append(fila)
+        if progreso:
+            progreso(fila, len(filas), len(tareas))
+    pendientes = [tarea for i, tarea in enumerate(tareas) if i not in duplicadas and i not in omitidas]
+    if procesos == 1 or len(pendientes) <= 1:
+        for tarea in pendientes:
+            filas.append(procesar_parcela(tarea, directorio_salida, opciones))
+            if progreso:
+                progreso(filas[-1], len(filas), len(tareas))
+    elif pendientes:
+        with ProcessPoolExecutor(max_workers=min(procesos, len(pendientes))) as pool:
+            futuros = [pool.submit(procesar_parcela, tarea, directorio_salida, opciones) for tarea in pendientes]
+            for futuro in as_completed(futuros):
+                filas.append(futuro.result())
+                if progreso:
+                    progreso(filas[-1], len(filas), len(tareas))
+
+    resumen = pd.DataFrame(filas)
+    if len(resumen):
+        # Mismo orden que la entrada, sin importar qué proceso terminó primero
+        orden = {tarea['archivo']: i for i, tarea in enumerate(tareas)}
+        resumen = resumen.sort_values('archivo', key=lambda s: s.map(orden), kind='stable').reset_index(drop=True)
+    resumen.to_csv(os.path.join(directorio_salida, 'resumen.csv'), index=False)
+    return resumen
+
+# ===== LÍNEA DE COMANDOS =====
+def _argumentos(argv=None):
+    hoy = datetime.now().date()
+    parser = argparse.ArgumentParser(
+        description="Analiza en lote un directorio (o manifiesto CSV) de parcelas sin la interfaz de Streamlit"
+    )
+    parser.add_argument('entrada', help="Directorio con ZIP/GeoPackage/GeoJSON o manifiesto CSV con columna 'archivo'")
+    parser.add_argument('-o', '--salida', required=True, help="Directorio de resultados")
+    parser.add_argument('--cultivo', choices=list(PARAMETROS_CULTIVOS), default=OPCIONES_POR_DEFECTO['cultivo'])
+    parser.add_argument('--nutriente', choices=list(NUTRIENTES), default=OPCIONES_POR_DEFECTO['nutriente'])
+    parser.add_argument('--analisis', dest='analisis_tipo', choices=["FERTILIDAD ACTUAL", "RECOMENDACIONES NPK"],
+                        default=OPCIONES_POR_DEFECTO['analisis_tipo'])
+    parser.add_argument('--satelite', choices=["SENTINEL-2", "LANDSAT-8", "DATOS_SIMULADOS"],
+                        default=OPCIONES_POR_DEFECTO['satelite'])
+    parser.add_argument('--indice', default=OPCIONES_POR_DEFECTO['indice'])
+    parser.add_argument('--desde', dest='fecha_inicio', default=str(hoy - timedelta(days=30)))
+    parser.add_argument('--hasta', dest='fecha_fin', default=str(hoy))
+    parser.add_argument('--escenas', dest='directorio_escenas', default=os.environ.get('ANALIZADOR_ESCENAS_DIR'),
+                        help="Directorio de escenas locales Sentinel-2/Landsat")
+    parser.add_argument('--serie', dest='estadistico_serie', choices=['maximo', 'media', 'mediana'],
+                        help="Compuesto temporal de todas las escenas locales del período")
+    parser.add_argument('--tipo-muestra', dest='tipo_muestra', choices=['FLOAT32', 'INT16', 'UINT8'],
+                        default=OPCIONES_POR_DEFECTO['tipo_muestra'],
+                        help="Índices de Sentinel Hub cuantizados en el servidor (INT16/UINT8: menos bytes)")
+    division = parser.add_mutually_exclusive_group()
+    division.add_argument('--zonas', dest='n_divisiones', type=int, default=OPCIONES_POR_DEFECTO['n_divisiones'])
+    division.add_argument('--tamano-zona', dest='tamano_zona_m', type=float, help="Lado de la zona en metros")
+    division.add_argument('--kmeans', dest='n_clases_kmeans', type=int, help="Clases de k-means sobre el ráster")
+    division.add_argument('--quadtree', dest='ancho_aplicacion_m', type=float,
+                          help="Quadtree sobre el ráster con este ancho de aplicación (m)")
+    parser.add_argument('--varianza-maxima', dest='varianza_maxima', type=float, default=VARIANZA_MAXIMA)
+    parser.add_argument('--formato', choices=FORMATOS_SALIDA, default=OPCIONES_POR_DEFECTO['formato'])
+    parser.add_argument('--dpi', dest='dpi_mapa', type=int, default=DPI_MAPA)
+    parser.add_argument('-j', '--procesos', type=int, default=None, help="Procesos del pool (por defecto, CPUs)")
+    parser.add_argument('--reanudar', action='store_true',
+                        help="No vuelve a procesar las parcelas ya analizadas con las mismas opciones")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = vars(_argumentos(argv))
+    entrada, salida, procesos = args.pop('entrada'), args.pop('salida'), args.pop('procesos')
+    reanudar = args.pop('reanudar')
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s %(message)s')
+
+    tareas = listar_parcelas(entrada, excluir=[salida])
+    if not tareas:
+        print(f"No se encontraron parcelas en {entrada}", file=sys.stderr)
+        return 1
+
+    def progreso(fila, hechas, total):
+        estado = f"{fila['zonas']:.0f} zonas" if fila['estado'] == 'ok' else fila['error']
+        print(f"[{hechas}/{total}] {fila['parcela']}: {estado} ({fila['segundos']:.1f} s)", flush=True)
+
+    inicio = time.perf_counter()
+    resumen = procesar_lote(tareas, salida, args, procesos, progreso, reanudar)
+    errores = int((resumen['estado'] != 'ok').sum())
+    print(f"{len(resumen) - errores} parcelas analizadas, {errores} con error, "
+          f"en {time.perf_counter() - inicio:.1f} s; resumen en {os.path.join(salida, 'resumen.csv')}")
+    return 1 if errores else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,136 @@
+import io
+import math
+import numpy as np
+import shapely
+
+# matplotlib se importa dentro de cada función: solo se carga al dibujar un mapa
+from analisis_gee import NUTRIENTES, PARAMETROS_CULTIVOS
+
+# Hasta este número de zonas se dibujan etiquetas completas (con recuadro)
+UMBRAL_ETIQUETAS = 100
+# Por encima del umbral se usa texto simple, diezmado a este máximo de etiquetas
+MAX_ETIQUETAS = 300
+DPI_MAPA = 150
+
+# PALETAS GEE MEJORADAS
+PALETAS_GEE = {
+    'FERTILIDAD': ['#d73027', '#f46d43', '#fdae61', '#fee08b', '#d9ef8b', '#a6d96a', '#66bd63', '#1a9850', '#006837'],
+    'NITROGENO': ['#00ff00', '#80ff00', '#ffff00', '#ff8000', '#ff0000'],
+    'FOSFORO': ['#0000ff', '#4040ff', '#8080ff', '#c0c0ff', '#ffffff'],
+    'POTASIO': ['#4B0082', '#6A0DAD', '#8A2BE2', '#9370DB', '#D8BFD8']
+}
+
+def escala_mapa(analisis_tipo, nutriente, cultivo):
+    """(cmap, vmin, vmax, columna, etiqueta) del mapa según el análisis, el nutriente y el cultivo"""
+    from matplotlib.colors import LinearSegmentedColormap
+    if analisis_tipo == "FERTILIDAD ACTUAL":
+        cmap = LinearSegmentedColormap.from_list('fertilidad_gee', PALETAS_GEE['FERTILIDAD'])
+        return cmap, 0, 1, 'npk_actual', 'Índice NPK Actual (0-1)'
+    clave = NUTRIENTES[nutriente][0]
+    rango = PARAMETROS_CULTIVOS[cultivo][clave]
+    cmap = LinearSegmentedColormap.from_list(f'{clave.lower()}_gee', PALETAS_GEE[clave])
+    return cmap, rango['min'] * 0.8, rango['max'] * 1.2, 'valor_recomendado', f'Recomendación {nutriente} (kg/ha)'
+
+# ===== CONVERSIÓN VECTORIZADA DE GEOMETRÍAS =====
+def geometrias_a_paths(geometrias):
+    """Convierte polígonos/multipolígonos en un Path de matplotlib por zona (con huecos)"""
+    from matplotlib.path import Path
+    geometrias = np.asarray(geometrias, dtype=object)
+    partes, zona_parte = shapely.get_parts(geometrias, return_index=True)
+    es_poligono = shapely.get_type_id(partes) == 3
+    partes, zona_parte = partes[es_poligono], zona_parte[es_poligono]
+
+    anillos, parte_anillo = shapely.get_rings(partes, return_index=True)
+    vertices, anillo_vertice = shapely.get_coordinates(anillos, return_index=True)
+    n_por_anillo = np.bincount(anillo_vertice, minlength=len(anillos))
+    fin = np.cumsum(n_por_anillo)
+
+    # matplotlib rellena con la regla del número de vueltas: los huecos deben ir en sentido contrario al
+    # exterior. Exteriores antihorarios e interiores horarios, invirtiendo los anillos que haga falta
+    exterior = np.r_[True, parte_anillo[1:] != parte_anillo[:-1]] if len(anillos) else np.zeros(0, dtype=bool)
+    invertir = shapely.is_ccw(anillos) != exterior
+    if invertir.any():
+        orden = np.arange(len(vertices))
+        inicio = (fin - n_por_anillo)[anillo_vertice]
+        orden = np.where(invertir[anillo_vertice], 2 * inicio + n_por_anillo[anillo_vertice] - 1 - orden, orden)
+        vertices = vertices[orden]
+
+    # Códigos de trazo: MOVETO al inicio de cada anillo y CLOSEPOLY al final
+    codigos = np.full(len(vertices), Path.LINETO, dtype=Path.code_type)
+    codigos[fin - n_por_anillo] = Path.MOVETO
+    codigos[fin - 1] = Path.CLOSEPOLY
+
+    zona_vertice = zona_parte[parte_anillo[anillo_vertice]]
+    cortes = np.cumsum(np.bincount(zona_vertice, minlength=len(geometrias)))[:-1]
+    return [Path(v, c) for v, c in zip(np.split(vertices, cortes), np.split(codigos, cortes))]
+
+# ===== RENDER EN UNA SOLA COLECCIÓN =====
+def _dibujar_etiquetas(ax, geometrias, valores, ids, umbral_etiquetas, max_etiquetas):
+    """Etiquetas completas para pocas zonas; texto simple y diezmado para muchas"""
+    centros = shapely.get_coordinates(shapely.centroid(geometrias))
+    n_zonas = len(centros)
+
+    if n_zonas <= umbral_etiquetas:
+        for (x, y), id_zona, valor in zip(centros, ids, valores):
+            ax.annotate(f"Z{id_zona}\n{valor:.1f}", (x, y),
+                        xytext=(5, 5), textcoords="offset points",
+                        fontsize=8, color='black', weight='bold',
+                        bbox=dict(boxstyle="round,pad=0.3", facecolor='white', alpha=0.9))
+        return
+
+    paso = max(1, math.ceil(n_zonas / max_etiquetas))
+    for (x, y), valor in zip(centros[::paso], valores[::paso]):
+        ax.text(x, y, f"{valor:.1f}", fontsize=5, color='black', ha='center', va='center')
+
+def renderizar_mapa_zonas(geometrias, valores, ids, cmap, vmin, vmax, titulo, etiqueta_barra,
+                          geografico=False, dpi=DPI_MAPA, umbral_etiquetas=UMBRAL_ETIQUETAS,
+                          max_etiquetas=MAX_ETIQUETAS):
+    """Dibuja todas las zonas como una colección con colores vectorizados y devuelve el PNG"""
+    from matplotlib.figure import Figure
+    from matplotlib.patches import PathPatch
+    from matplotlib.collections import PatchCollection
+    from matplotlib.colors import Normalize
+    from matplotlib.cm import ScalarMappable
+
+    geometrias = np.asarray(geometrias, dtype=object)
+    valores = np.asarray(valores, dtype=float)
+
+    fig = Figure(figsize=(14, 10))
+    ax = fig.add_subplot(1, 1, 1)
+
+    norma = Normalize(vmin=vmin, vmax=vmax, clip=True)
+    colores = cmap(norma(valores))
+    coleccion = PatchCollection(
+        [PathPatch(path) for path in geometrias_a_paths(geometrias)],
+        facecolors=colores, edgecolors='black', linewidths=1.5 if len(geometrias) <= umbral_etiquetas else 0.3
+    )
+    ax.add_collection(coleccion)
+    ax.autoscale_view()
+
+    # Misma relación de aspecto que GeoDataFrame.plot
+    if geografico:
+        y_medio = np.mean(ax.get_ylim())
+        ax.set_aspect(1 / math.cos(math.radians(y_medio)))
+    else:
+        ax.set_aspect('equal')
+
+    _dibujar_etiquetas(ax, geometrias, valores, ids, umbral_etiquetas, max_etiquetas)
+
+    ax.set_title(titulo, fontsize=16, fontweight='bold', pad=20)
+    ax.set_xlabel('Longitud')
+    ax.set_ylabel('Latitud')
+    ax.grid(True, alpha=0.3)
+
+    # Barra de colores
+    sm = ScalarMappable(cmap=cmap, norm=Normalize(vmin=vmin, vmax=vmax))
+    sm.set_array([])
+    cbar = fig.colorbar(sm, ax=ax, shrink=0.8)
+    cbar.set_label(etiqueta_barra, fontsize=12, fontweight='bold')
+
+    fig.tight_layout()
+
+    # Convertir a imagen
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png', dpi=dpi, bbox_inches='tight')
+    buf.seek(0)
+    return buf
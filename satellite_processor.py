@@ -1,5 +1,4 @@
 import numpy as np
-import rasterio
 from sentinelhub import (
     SHConfig, 
     BBox, 
@@ -10,14 +9,52 @@ from sentinelhub import (
     SentinelHubRequest, 
     bbox_to_dimensions
 )
-from datetime import datetime, timedelta
-import logging
-import streamlit as st
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from rasterio.transform import from_bounds
+import math
+import time
+import hashlib
+from cache_raster import CacheRaster, MAX_BYTES_RASTER, clave_raster
+from evalscripts import (
+    NamedBands, QUANTIZED_SAMPLE_TYPES, build_bands_evalscript, build_evalscript, normalize_indices,
+    quantization_params
+)
+from indices_espectrales import ESCALA_SENTINEL2_L2A, bandas_requeridas, calcular_indices
+from mascara_nubes import mascara_scl
+from nucleo.progreso import REPORTE_NULO
+
+# Límite de píxeles por lado de la Process API de Sentinel Hub
+MAX_TILE_SIZE = 2500
+# Descarga por teselas: hilos concurrentes, intentos y espera base del backoff exponencial
+MAX_WORKERS = 4
+MAX_ATTEMPTS = 3
+BACKOFF_SECONDS = 1.0
+
+NDVI_EVALSCRIPT = build_evalscript(['NDVI'])
+
+def split_dimensions(width, height, max_tile_size=MAX_TILE_SIZE):
+    """Dividir una grilla de píxeles en ventanas (fila0, fila1, col0, col1) de como máximo max_tile_size"""
+    n_cols = max(1, math.ceil(width / max_tile_size))
+    n_rows = max(1, math.ceil(height / max_tile_size))
+    col_edges = np.linspace(0, width, n_cols + 1).round().astype(int)
+    row_edges = np.linspace(0, height, n_rows + 1).round().astype(int)
+    return [
+        (int(row_edges[i]), int(row_edges[i + 1]), int(col_edges[j]), int(col_edges[j + 1]))
+        for i in range(n_rows) for j in range(n_cols)
+    ]
 
 class SatelliteProcessor:
-    def __init__(self, config):
+    def __init__(self, config, cache=None, reporte=None):
         self.config = config
+        # Mensajes de progreso: la interfaz pasa su adaptador; por defecto no se reporta nada
+        self.reporte = reporte or REPORTE_NULO
         self.sh_config = SHConfig()
+        self.data_collection = DataCollection.SENTINEL2_L2A
+        self.mosaicking_order = MosaickingOrder.LEAST_CC
+        # Caché local de rásters (opcional): evita repetir requests idénticos
+        if cache is None and config and config.get('cache_dir'):
+            cache = CacheRaster(config['cache_dir'], config.get('cache_max_bytes', MAX_BYTES_RASTER))
+        self.cache = cache
         self._setup_sentinelhub_config()
     
     def _setup_sentinelhub_config(self):
@@ -27,22 +64,32 @@ class SatelliteProcessor:
                 self.sh_config.instance_id = self.config['instance_id']
                 self.sh_config.sh_client_id = self.config['client_id']
                 self.sh_config.sh_client_secret = self.config['client_secret']
+                # URLs alternativas (p. ej. un mock local de la Process API para pruebas)
+                if self.config.get('base_url'):
+                    self.sh_config.sh_base_url = self.config['base_url']
+                    # Un nombre de colección por URL: sentinelhub no permite redefinir un nombre con otra URL
+                    sufijo = hashlib.blake2b(self.config['base_url'].encode(), digest_size=4).hexdigest().upper()
+                    self.data_collection = DataCollection.SENTINEL2_L2A.define_from(
+                        f'SENTINEL2_L2A_URL_{sufijo}', service_url=self.config['base_url']
+                    )
+                if self.config.get('token_url'):
+                    self.sh_config.sh_token_url = self.config['token_url']
                 
                 # Verificar que la configuración sea válida
                 if (self.sh_config.instance_id and 
                     self.sh_config.sh_client_id and 
                     self.sh_config.sh_client_secret):
-                    st.success("🔑 Configuración de Sentinel Hub inicializada")
+                    self.reporte.exito("🔑 Configuración de Sentinel Hub inicializada")
                     return True
                 else:
-                    st.error("❌ Configuración de Sentinel Hub incompleta")
+                    self.reporte.error("❌ Configuración de Sentinel Hub incompleta")
                     return False
             else:
-                st.error("❌ No se encontró configuración de Sentinel Hub")
+                self.reporte.error("❌ No se encontró configuración de Sentinel Hub")
                 return False
                 
         except Exception as e:
-            st.error(f"❌ Error configurando Sentinel Hub: {str(e)}")
+            self.reporte.error(f"❌ Error configurando Sentinel Hub: {str(e)}")
             return False
     
     def check_credentials(self):
@@ -58,21 +105,183 @@ class SatelliteProcessor:
         """Obtener bounding box de la parcela"""
         try:
             # Asegurarse de que esté en WGS84
-            if gdf.crs != CRS.WGS84:
-                gdf = gdf.to_crs(CRS.WGS84)
+            if gdf.crs is not None and gdf.crs.to_epsg() != 4326:
+                gdf = gdf.to_crs(epsg=4326)
                 
             bounds = gdf.total_bounds
-            return BBox(bbox=bounds, crs=CRS.WGS84)
+            return BBox(bbox=tuple(float(b) for b in bounds), crs=CRS.WGS84)
         except Exception as e:
-            st.error(f"❌ Error obteniendo BBox: {str(e)}")
+            self.reporte.error(f"❌ Error obteniendo BBox: {str(e)}")
+            return None
+    
+    def _build_request(self, evalscript, bbox, size, start_date, end_date, response_id='default'):
+        """Crear el request de la Process API para un bbox y tamaño"""
+        return SentinelHubRequest(
+            evalscript=evalscript,
+            input_data=[
+                SentinelHubRequest.input_data(
+                    data_collection=self.data_collection,
+                    time_interval=(start_date, end_date),
+                    mosaicking_order=self.mosaicking_order
+                )
+            ],
+            responses=[SentinelHubRequest.output_response(response_id, MimeType.TIFF)],
+            bbox=bbox,
+            size=size,
+            config=self.sh_config
+        )
+    
+    def _fetch_tile(self, evalscript, bbox, size, start_date, end_date):
+        """Descargar una tesela (float32, o entera si el transporte es cuantizado)"""
+        data = self._build_request(evalscript, bbox, size, start_date, end_date).get_data()
+        if not data:
+            raise RuntimeError("Respuesta vacía de Sentinel Hub")
+        tile = np.asarray(data[0])
+        # Las teselas cuantizadas (enteras) se conservan tal cual
+        return tile.astype(np.float32, copy=False) if tile.dtype.kind == 'f' else tile
+    
+    def _fetch_tile_with_retry(self, evalscript, bbox, size, start_date, end_date,
+                               max_attempts=MAX_ATTEMPTS, backoff_seconds=BACKOFF_SECONDS):
+        """Descargar una tesela con reintentos y backoff exponencial"""
+        for attempt in range(1, max_attempts + 1):
+            try:
+                return self._fetch_tile(evalscript, bbox, size, start_date, end_date), attempt
+            except Exception:
+                if attempt == max_attempts:
+                    raise
+                time.sleep(backoff_seconds * 2 ** (attempt - 1))
+    
+    def download_sentinel2_tiled(self, gdf, start_date, end_date, evalscript=NDVI_EVALSCRIPT,
+                                 resolution=10, max_tile_size=MAX_TILE_SIZE, max_workers=MAX_WORKERS,
+                                 nodata=np.nan):
+        """Descargar por teselas concurrentes y unirlas en un único array float32 georreferenciado"""
+        bbox = self.get_field_bbox(gdf)
+        if bbox is None:
             return None
+        
+        width, height = bbox_to_dimensions(bbox, resolution=resolution)
+        width, height = max(width, 1), max(height, 1)
+        minx, miny = bbox.lower_left
+        maxx, maxy = bbox.upper_right
+        dx = (maxx - minx) / width
+        dy = (maxy - miny) / height
+        
+        # Caché local: mismo bbox, resolución, fechas, colección, mosaico y evalscript
+        cache_key = None
+        if self.cache is not None:
+            cache_key = clave_raster(
+                (minx, miny, maxx, maxy), bbox.crs.epsg, resolution, (start_date, end_date),
+                self.data_collection.name, self.mosaicking_order.value, evalscript
+            )
+            cached = self.cache.obtener(cache_key)
+            if cached is not None:
+                self.reporte.info(f"💾 Ráster recuperado del caché local ({cached['data'].nbytes / 1e6:.1f} MB)")
+                cached['transform'] = from_bounds(minx, miny, maxx, maxy, width, height)
+                cached['bbox'] = bbox
+                cached['cached'] = True
+                return cached
+        
+        windows = split_dimensions(width, height, max_tile_size)
+        self.reporte.info(f"🧩 Descargando {width}x{height} píxeles en {len(windows)} teselas")
+        
+        mosaic = None
+        tile_times = []
+        inicio = time.perf_counter()
+        
+        def fetch(window):
+            row0, row1, col0, col1 = window
+            # Fila 0 es el borde norte del bbox
+            tile_bbox = BBox(bbox=[minx + col0 * dx, maxy - row1 * dy,
+                                   minx + col1 * dx, maxy - row0 * dy], crs=bbox.crs)
+            t0 = time.perf_counter()
+            tile, attempts = self._fetch_tile_with_retry(
+                evalscript, tile_bbox, (col1 - col0, row1 - row0), start_date, end_date
+            )
+            return window, tile, attempts, time.perf_counter() - t0
+        
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(fetch, window) for window in windows]
+            for future in as_completed(futures):
+                (row0, row1, col0, col1), tile, attempts, seconds = future.result()
+                if mosaic is None:
+                    mosaic = np.full((height, width) + tile.shape[2:], nodata, dtype=tile.dtype)
+                mosaic[row0:row1, col0:col1] = tile
+                tile_times.append({
+                    'window': (row0, row1, col0, col1),
+                    'pixels': tile.shape[0] * tile.shape[1],
+                    'seconds': seconds,
+                    'attempts': attempts
+                })
+        
+        total = time.perf_counter() - inicio
+        self.reporte.exito(f"✅ {len(windows)} teselas descargadas en {total:.1f} s")
+        
+        result = {
+            'data': mosaic,
+            'crs': bbox.crs.epsg,
+            'tile_times': sorted(tile_times, key=lambda t: t['window']),
+            'seconds': total
+        }
+        if cache_key is not None:
+            self.cache.guardar(cache_key, mosaic, result | {'data': None})
+        
+        result['transform'] = from_bounds(minx, miny, maxx, maxy, width, height)
+        result['bbox'] = bbox
+        return result
+    
+    def download_sentinel2_bands(self, gdf, start_date, end_date, bands=('B04', 'B08'), resolution=10, **kwargs):
+        """Descargar bandas crudas (números digitales UINT16, 0 = sin datos) y devolverlas por nombre"""
+        names = [band.upper() for band in bands]
+        result = self.download_sentinel2_tiled(
+            gdf, start_date, end_date, evalscript=build_bands_evalscript(names),
+            resolution=resolution, nodata=0, **kwargs
+        )
+        if result is None or result['data'] is None:
+            return None
+        return NamedBands(result['data'], names, transform=result['transform'], crs=result['crs'])
+    
+    def download_sentinel2_indices(self, gdf, start_date, end_date, indices=('NDVI',), resolution=10,
+                                   sample_type='FLOAT32', ranges=None, local=False, cloud_mask=False, **kwargs):
+        """Descargar varios índices en un solo request multibanda y devolverlos por nombre
+        
+        sample_type='INT16' o 'UINT8' pide al servidor índices escalados (2x o 4x menos bytes);
+        ranges ajusta por índice el rango (lo, hi) y con él la precisión.
+        local=True descarga las bandas crudas una vez y calcula los índices localmente.
+        cloud_mask=True deja sin datos los píxeles de nube, sombra o nieve según la banda SCL.
+        """
+        if local:
+            band_names = bandas_requeridas(indices) + (['SCL'] if cloud_mask else [])
+            bands = self.download_sentinel2_bands(
+                gdf, start_date, end_date, band_names, resolution=resolution, **kwargs
+            )
+            if bands is None:
+                return None
+            mask = mascara_scl(bands['SCL']) if cloud_mask else None
+            return calcular_indices(indices, bands, escala=ESCALA_SENTINEL2_L2A, nodata=0, mascara=mask,
+                                    transform=bands.transform, crs=bands.crs)
+        
+        names = normalize_indices(indices)
+        quantization = None
+        nodata = np.nan
+        if sample_type != 'FLOAT32':
+            quantization = quantization_params(names, sample_type, ranges)
+            nodata = QUANTIZED_SAMPLE_TYPES[sample_type][2]
+        
+        result = self.download_sentinel2_tiled(
+            gdf, start_date, end_date, evalscript=build_evalscript(names, sample_type, ranges, cloud_mask),
+            resolution=resolution, nodata=nodata, **kwargs
+        )
+        if result is None or result['data'] is None:
+            return None
+        return NamedBands(result['data'], names, transform=result['transform'], crs=result['crs'],
+                          quantization=quantization)
     
     def download_sentinel2_data(self, gdf, start_date, end_date, indices=['ndvi']):
         """Descargar datos de Sentinel-2 para la parcela"""
         try:
             # Verificar credenciales primero
             if not self.check_credentials():
-                st.error("🔑 Credenciales de Sentinel Hub no configuradas")
+                self.reporte.error("🔑 Credenciales de Sentinel Hub no configuradas")
                 return None
             
             # Obtener bounding box
@@ -84,58 +293,20 @@ class SatelliteProcessor:
             resolution = 10  # metros
             size = bbox_to_dimensions(bbox, resolution=resolution)
             
-            st.info(f"📍 Área de descarga: {size} píxeles")
-            
-            # Evalscript simplificado para NDVI
-            evalscript = """
-            //VERSION=3
-            function setup() {
-                return {
-                    input: [{
-                        bands: ["B04", "B08"],
-                        units: "REFLECTANCE"
-                    }],
-                    output: {
-                        id: "ndvi",
-                        bands: 1,
-                        sampleType: "FLOAT32"
-                    }
-                };
-            }
-            
-            function evaluatePixel(sample) {
-                let ndvi = (sample.B08 - sample.B04) / (sample.B08 + sample.B04);
-                return [ndvi];
-            }
-            """
-            
-            # Crear request
-            request = SentinelHubRequest(
-                evalscript=evalscript,
-                input_data=[
-                    SentinelHubRequest.input_data(
-                        data_collection=DataCollection.SENTINEL2_L2A,
-                        time_interval=(start_date, end_date),
-                        mosaicking_order=MosaickingOrder.LEAST_CC
-                    )
-                ],
-                responses=[SentinelHubRequest.output_response('ndvi', MimeType.TIFF)],
-                bbox=bbox,
-                size=size,
-                config=self.sh_config
-            )
+            self.reporte.info(f"📍 Área de descarga: {size} píxeles")
             
-            # Descargar datos
-            with st.spinner("📡 Descargando datos de Sentinel-2..."):
-                data = request.get_data()
+            # Campos grandes se dividen en teselas; uno chico es un único request.
+            # Ambos casos comparten reintentos y caché local; todos los índices van en el mismo request.
+            with self.reporte.etapa("📡 Descargando datos de Sentinel-2..."):
+                bands = self.download_sentinel2_indices(gdf, start_date, end_date, indices, resolution=resolution)
                 
-            if data and len(data) > 0:
-                st.success(f"✅ Datos descargados: {data[0].shape if hasattr(data[0], 'shape') else 'N/A'}")
-                return data[0]
+            if bands is not None:
+                self.reporte.exito(f"✅ Datos descargados: {bands.data.shape} ({', '.join(bands.names)})")
+                return bands.data[..., 0] if len(bands) == 1 else bands.data
             else:
-                st.error("❌ No se recibieron datos de Sentinel Hub")
+                self.reporte.error("❌ No se recibieron datos de Sentinel Hub")
                 return None
                 
         except Exception as e:
-            st.error(f"❌ Error descargando datos Sentinel-2: {str(e)}")
+            self.reporte.error(f"❌ Error descargando datos Sentinel-2: {str(e)}")
             return None
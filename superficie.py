@@ -0,0 +1,56 @@
+import functools
+import numpy as np
+import pandas as pd
+import shapely
+from pyproj import CRS, Transformer
+
+CRS_WGS84 = CRS.from_epsg(4326)
+
+@functools.lru_cache(maxsize=64)
+def _transformador(crs_origen, crs_destino):
+    """Transformer de pyproj cacheado por par de CRS"""
+    return Transformer.from_crs(crs_origen, crs_destino, always_xy=True)
+
+def _reproyectar(geometrias, crs_origen, crs_destino):
+    """Reproyecta todas las geometrías en una sola llamada vectorizada"""
+    if crs_origen == crs_destino:
+        return geometrias
+    transformador = _transformador(crs_origen, crs_destino)
+    return shapely.transform(
+        geometrias, lambda xy: np.column_stack(transformador.transform(xy[:, 0], xy[:, 1]))
+    )
+
+def crs_area_igual(geometrias, crs):
+    """CRS Lambert acimutal de área igual centrado en el centroide de las geometrías"""
+    minx, miny, maxx, maxy = shapely.total_bounds(geometrias)
+    lon, lat = _transformador(crs, CRS_WGS84).transform((minx + maxx) / 2, (miny + maxy) / 2)
+    # Redondeo del centro: parcelas vecinas comparten CRS y transformer cacheado
+    return _crs_laea(round(lat, 2), round(lon, 2))
+
+@functools.lru_cache(maxsize=256)
+def _crs_laea(lat, lon):
+    """CRS LAEA cacheado por centro"""
+    return CRS.from_proj4(f"+proj=laea +lat_0={lat} +lon_0={lon} +datum=WGS84 +units=m +no_defs")
+
+def superficies_ha(*grupos, crs=None):
+    """Hectáreas de varios grupos de geometrías (p. ej. parcela y zonas) con una sola reproyección"""
+    grupos = [np.asarray(g, dtype=object) for g in grupos]
+    todas = np.concatenate(grupos) if len(grupos) > 1 else grupos[0]
+
+    if crs is None:
+        # Sin CRS se asume que las coordenadas ya están en metros
+        areas_m2 = shapely.area(todas)
+    else:
+        crs = CRS.from_user_input(crs)
+        destino = crs_area_igual(todas, crs)
+        areas_m2 = shapely.area(_reproyectar(todas, crs, destino))
+
+    cortes = np.cumsum([len(g) for g in grupos])[:-1]
+    return [a / 10000 for a in np.split(areas_m2, cortes)]
+
+def calcular_superficie(gdf):
+    """Superficie de cada geometría en hectáreas (cálculo en CRS métrico de área igual)"""
+    if len(gdf) == 0:
+        return pd.Series(np.empty(0), index=gdf.index)
+    areas_ha, = superficies_ha(gdf.geometry.values, crs=gdf.crs)
+    return pd.Series(areas_ha, index=gdf.index)
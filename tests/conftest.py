@@ -0,0 +1,15 @@
+import os
+import sys
+
+import pytest
+
+# Los módulos del analizador están en la raíz del repositorio, sin paquete instalable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def parcela():
+    """Lote irregular de ~80 ha en coordenadas geográficas"""
+    import geopandas as gpd
+    from shapely.geometry import Polygon
+    return gpd.GeoDataFrame(geometry=[Polygon([(-60.0, -34.0), (-59.99, -34.0), (-59.988, -34.008),
+                                               (-59.997, -34.009), (-60.001, -34.005)])], crs='EPSG:4326')
@@ -0,0 +1,29 @@
+import itertools
+
+import pandas as pd
+import pytest
+
+from analisis_gee import NUTRIENTES, PARAMETROS_CULTIVOS, TIPOS_ANALISIS
+from nucleo import MemoriaEtapas, analizar_parcela, ejecutar_analisis, seleccionar_combinacion
+
+def tabla(resultado):
+    gdf = resultado['gdf']
+    return gdf.drop(columns=gdf.geometry.name).assign(categoria=gdf['categoria'].astype(str))
+
+@pytest.mark.parametrize('satelite', ['DATOS_SIMULADOS', 'SENTINEL-2'])
+def test_comparacion_igual_a_corrida_individual(parcela, satelite):
+    # La comparación se calcula con otro cultivo elegido: el tensor no depende del primer cultivo
+    opciones = {'gdf': parcela, 'semilla': 7, 'n_divisiones': 16, 'satelite': satelite,
+                'todas_las_combinaciones': True}
+    memoria = MemoriaEtapas()
+    ejecutar_analisis({**opciones, 'cultivo': 'MAÍZ'}, memoria=memoria)
+    resultados, registro = ejecutar_analisis({**opciones, 'cultivo': 'SOJA'}, memoria=memoria)
+    assert ('imagen', True) in [(etapa, acierto) for etapa, acierto, _ in registro]
+
+    for cultivo, nutriente, tipo in itertools.product(PARAMETROS_CULTIVOS, NUTRIENTES, TIPOS_ANALISIS):
+        seleccion = seleccionar_combinacion(resultados['categorizacion'], cultivo, nutriente, tipo)
+        individual = analizar_parcela(parcela, {'cultivo': cultivo, 'nutriente': nutriente, 'analisis_tipo': tipo,
+                                                  'n_divisiones': 16, 'satelite': satelite}, semilla=7)
+        pd.testing.assert_frame_equal(tabla(seleccion), tabla(individual))
+        pd.testing.assert_frame_equal(seleccion['resumen_categorias'], individual['resumen_categorias'])
+        assert seleccion['columna_valor'] == individual['columna_valor']
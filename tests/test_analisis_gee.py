@@ -0,0 +1,74 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from analisis_gee import (
+    CATEGORIAS_ANALISIS, NUTRIENTES, PARAMETROS_CULTIVOS, TABLA_CORTES, TIPOS_ANALISIS, TensorResultados,
+    codigos_categorias
+)
+
+def categorizar_referencia(valor, nutriente, analisis_tipo, cultivo):
+    """Cadena if/elif original de app.py, valor por valor"""
+    if analisis_tipo == "FERTILIDAD ACTUAL":
+        if valor < 0.3: return "MUY BAJA"
+        elif valor < 0.5: return "BAJA"
+        elif valor < 0.6: return "MEDIA"
+        elif valor < 0.7: return "BUENA"
+        else: return "ÓPTIMA"
+    params = PARAMETROS_CULTIVOS[cultivo][NUTRIENTES[nutriente][0]]
+    rango = params['max'] - params['min']
+    if valor < params['min'] + 0.2 * rango: return "MUY BAJO"
+    elif valor < params['min'] + 0.4 * rango: return "BAJO"
+    elif valor < params['min'] + 0.6 * rango: return "MEDIO"
+    elif valor < params['min'] + 0.8 * rango: return "ALTO"
+    else: return "MUY ALTO"
+
+def valores_de_prueba(cortes):
+    """Cada corte exacto, justo debajo y encima (a la resolución de los resultados redondeados), y extremos"""
+    valores = [cortes[0] - 100, cortes[-1] + 100]
+    for corte in cortes:
+        valores += [corte, corte - 1e-3, corte + 1e-3]
+    return np.array(valores)
+
+def test_cortes_exactos_iguales_a_la_cadena_original():
+    for (cultivo, nutriente, tipo), (cortes, categorias) in TABLA_CORTES.items():
+        valores = valores_de_prueba(cortes)
+        esperado = [categorizar_referencia(valor, nutriente, tipo, cultivo) for valor in valores]
+        # En float64 y en la columna float32 de TablaZonas
+        for columna in (valores, valores.astype(np.float32)):
+            obtenido = [categorias[codigo] for codigo in codigos_categorias(columna, cortes)]
+            assert obtenido == esperado, (cultivo, nutriente, tipo, columna.dtype)
+
+def test_nan_es_sin_dato():
+    cortes = TABLA_CORTES[('TRIGO', 'NITRÓGENO', 'FERTILIDAD ACTUAL')][0]
+    valores = np.array([0.2, np.nan, 0.65, np.nan], dtype=np.float32)
+    assert codigos_categorias(valores, cortes).tolist() == [0, -1, 3, -1]
+
+def test_tensor_igual_a_la_cadena_original():
+    rng = np.random.default_rng(3)
+    n = 40
+    cultivos = list(PARAMETROS_CULTIVOS)
+    npk = np.round(rng.uniform(0.1, 0.9, (len(cultivos), n)), 3)
+    npk[:, :3] = [0.3, 0.7, np.nan]
+    indices = {'npk_actual': npk, 'ndvi': npk, 'ndre': npk, 'materia_organica': npk, 'humedad_suelo': npk}
+    recomendaciones = {columna: np.round(rng.uniform(20, 260, (len(cultivos), n)), 1)
+                       for _, columna in NUTRIENTES.values()}
+    recomendaciones['n_recomendado'][:, 0] = np.nan
+    areas = np.arange(1, n + 1, dtype=float)
+    tensor = TensorResultados(pd.RangeIndex(n), cultivos, indices, recomendaciones, areas)
+    for cultivo, nutriente, tipo in itertools.product(cultivos, NUTRIENTES, TIPOS_ANALISIS):
+        i, j, k = tensor.posicion(cultivo, nutriente, tipo)
+        valores = tensor.valores[i, j, k].astype(float)
+        etiquetas, resumen = tensor.categorizar(cultivo, nutriente, tipo)
+        assert list(etiquetas.categories) == CATEGORIAS_ANALISIS[tipo]
+
+        # Sin dato: sin categoría y fuera del resumen; el resto como la cadena if/elif
+        validos = ~np.isnan(valores)
+        assert etiquetas.isna().tolist() == (~validos).tolist()
+        esperadas = [categorizar_referencia(valor, nutriente, tipo, cultivo)
+                     for valor in np.round(valores[validos], 3)]
+        assert list(etiquetas[validos]) == esperadas
+        conteo = pd.Series(esperadas).value_counts().reindex(CATEGORIAS_ANALISIS[tipo], fill_value=0)
+        assert resumen['zonas'].tolist() == conteo.tolist()
+        assert resumen['area_ha'].sum() == areas[validos].sum()
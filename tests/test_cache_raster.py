@@ -0,0 +1,72 @@
+import os
+
+import numpy as np
+import pytest
+
+from cache_raster import CacheRaster, clave_raster
+
+EVALSCRIPT = """//VERSION=3
+function evaluatePixel(s) {
+    return [s.B04];
+}
+"""
+
+def clave(**cambios):
+    argumentos = dict(bbox=(-60.0, -34.01, -59.99, -34.0), crs='EPSG:4326', resolucion=10,
+                      intervalo=('2024-01-01', '2024-01-31'), coleccion='sentinel-2-l2a',
+                      orden_mosaico='leastCC', evalscript=EVALSCRIPT)
+    argumentos.update(cambios)
+    return clave_raster(**argumentos)
+
+def test_clave_del_request():
+    assert clave() == clave(evalscript='\n'.join('  ' + linea + '   ' for linea in EVALSCRIPT.splitlines()))
+    assert clave() == clave(bbox=(-60.0 + 1e-12, -34.01, -59.99, -34.0))
+    distintas = {clave(bbox=(-60.0, -34.02, -59.99, -34.0)), clave(resolucion=20),
+                 clave(intervalo=('2024-01-01', '2024-02-01')), clave(coleccion='landsat'),
+                 clave(orden_mosaico='mostRecent'), clave(evalscript=EVALSCRIPT.replace('B04', 'B08')),
+                 clave(tipo_muestra='INT16')}
+    assert len(distintas | {clave()}) == 8
+
+def test_ida_y_vuelta_como_memmap(tmp_path):
+    cache = CacheRaster(str(tmp_path))
+    data = np.arange(2 * 3 * 4, dtype=np.int16).reshape(2, 3, 4)
+    cache.guardar('k', data, {'transform': [10, 0, 5, 0, -10, 8], 'crs': 'EPSG:32720'})
+    leido = cache.obtener('k')
+    assert isinstance(leido['data'], np.memmap) and not leido['data'].flags.writeable
+    np.testing.assert_array_equal(leido['data'], data)
+    assert leido['data'].dtype == np.int16
+    assert leido['transform'] == [10, 0, 5, 0, -10, 8] and leido['crs'] == 'EPSG:32720'
+    assert cache.estadisticas()['bytes_ahorrados'] == data.nbytes
+    assert not [nombre for nombre in os.listdir(tmp_path) if nombre.endswith('.tmp')]
+
+def test_persistente_entre_instancias_y_fallos(tmp_path):
+    CacheRaster(str(tmp_path)).guardar('k', np.ones((4, 4), dtype=np.float32))
+    otra = CacheRaster(str(tmp_path))
+    assert otra.estadisticas()['entradas'] == 1
+    assert otra.obtener('k')['data'].sum() == 16
+    assert otra.obtener('falta') is None
+    # Metadatos corruptos: se informa como fallo y sale del índice
+    (tmp_path / 'k.json').write_text('{')
+    assert otra.obtener('k') is None
+    assert otra.estadisticas() == {'aciertos': 1, 'fallos': 2, 'bytes_ahorrados': 64, 'entradas': 0,
+                                   'bytes_disco': 0}
+
+def test_expulsion_lru_por_bytes(tmp_path):
+    datos = np.zeros(1000, dtype=np.uint8)
+    cache = CacheRaster(str(tmp_path))
+    for i, nombre in enumerate('abc'):
+        cache.guardar(nombre, datos)
+        os.utime(tmp_path / f'{nombre}.npy', (1000 + i, 1000 + i))
+    tamano = os.path.getsize(tmp_path / 'a.npy')
+    # Índice reconstruido desde disco con los últimos usos a < b < c; leer 'a' la vuelve la más reciente
+    cache = CacheRaster(str(tmp_path), max_bytes=3 * tamano)
+    assert cache.obtener('a') is not None
+    cache.guardar('d', datos)
+    assert sorted(os.listdir(tmp_path)) == ['a.json', 'a.npy', 'c.json', 'c.npy', 'd.json', 'd.npy']
+    assert cache.estadisticas()['bytes_disco'] == 3 * tamano
+
+@pytest.mark.parametrize('max_bytes', [0, 10])
+def test_entrada_mayor_que_el_presupuesto(tmp_path, max_bytes):
+    cache = CacheRaster(str(tmp_path), max_bytes=max_bytes)
+    cache.guardar('k', np.zeros(100))
+    assert cache.obtener('k') is None and os.listdir(tmp_path) == []
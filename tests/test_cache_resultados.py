@@ -0,0 +1,105 @@
+import os
+from collections import OrderedDict
+
+import numpy as np
+from shapely.geometry import box
+
+from cache_resultados import CACHE_RESULTADOS, CacheBytes, clave_contenido
+from nucleo import MemoriaEtapas, ejecutar_analisis
+
+class LRUReferencia:
+    """LRU en bytes escrita de la forma más directa, para comparar"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entradas = OrderedDict()
+
+    def obtener(self, clave):
+        if clave in self.entradas:
+            self.entradas.move_to_end(clave)
+            return self.entradas[clave]
+        return None
+
+    def guardar(self, clave, datos):
+        if len(datos) > self.max_bytes:
+            return
+        self.entradas.pop(clave, None)
+        self.entradas[clave] = datos
+        while sum(map(len, self.entradas.values())) > self.max_bytes:
+            self.entradas.popitem(last=False)
+
+def test_clave_por_contenido():
+    zonas = [box(0, 0, 1, 1), box(1, 0, 2, 1)]
+    valores = np.array([0.3, 0.7])
+    clave = clave_contenido(zonas, valores, tipo='mapa', dpi=150)
+    assert clave == clave_contenido(list(zonas), valores.copy(), dpi=150, tipo='mapa')
+    distintas = [
+        clave_contenido(zonas[::-1], valores, tipo='mapa', dpi=150),
+        clave_contenido([box(0, 0, 1, 1.01), zonas[1]], valores, tipo='mapa', dpi=150),
+        clave_contenido(zonas, np.array([0.3, 0.71]), tipo='mapa', dpi=150),
+        clave_contenido(zonas, valores.astype(np.float32), tipo='mapa', dpi=150),
+        clave_contenido(zonas, valores, tipo='mapa', dpi=300),
+        clave_contenido(zonas, valores, tipo='csv', dpi=150),
+    ]
+    assert len({clave, *distintas}) == len(distintas) + 1
+
+def test_lru_igual_a_la_referencia():
+    rng = np.random.default_rng(4)
+    cache, referencia = CacheBytes(max_bytes=100), LRUReferencia(100)
+    aciertos = fallos = 0
+    for _ in range(2000):
+        clave = f"k{rng.integers(12)}"
+        if rng.random() < 0.5:
+            datos = bytes(int(rng.integers(1, 40)))
+            cache.guardar(clave, datos)
+            referencia.guardar(clave, datos)
+        else:
+            esperado = referencia.obtener(clave)
+            assert cache.obtener(clave) == esperado
+            aciertos += esperado is not None
+            fallos += esperado is None
+    estadisticas = cache.estadisticas()
+    assert (estadisticas['aciertos'], estadisticas['fallos']) == (aciertos, fallos)
+    assert estadisticas['bytes_memoria'] == sum(map(len, referencia.entradas.values())) <= 100
+    assert list(cache._entradas) == list(referencia.entradas)
+
+def test_nivel_en_disco_compartido_y_podado(tmp_path):
+    primera = CacheBytes(max_bytes=10, directorio=str(tmp_path), max_bytes_disco=250)
+    for i in range(3):
+        primera.guardar(f"k{i}", bytes([i]) * 100)
+        os.utime(tmp_path / f"k{i}.bin", (1000 + i, 1000 + i))
+    # Lo que no entra en memoria se sirve desde disco; otro proceso ve las mismas entradas
+    segunda = CacheBytes(max_bytes=1000, directorio=str(tmp_path), max_bytes_disco=250)
+    assert segunda.obtener('k2') == bytes([2]) * 100
+    # El presupuesto en disco expulsó la entrada más vieja
+    assert segunda.obtener('k0') is None
+    assert sorted(os.listdir(tmp_path)) == ['k1.bin', 'k2.bin']
+    assert not any(nombre.endswith('.tmp') for nombre in os.listdir(tmp_path))
+
+def test_obtener_o_generar_genera_una_vez():
+    cache = CacheBytes()
+    llamadas = []
+    def generar():
+        llamadas.append(1)
+        return bytearray(b'png')
+    assert cache.obtener_o_generar('clave', generar) == b'png'
+    assert cache.obtener_o_generar('clave', generar) == b'png'
+    assert len(llamadas) == 1
+
+def test_mapa_y_csv_desde_la_cache(parcela):
+    opciones = {'gdf': parcela, 'semilla': 3, 'n_divisiones': 9, 'dpi_mapa': 30}
+    objetivos = ('mapa', 'exportacion')
+    primera, _ = ejecutar_analisis(opciones, objetivos, memoria=MemoriaEtapas())
+    antes = CACHE_RESULTADOS.estadisticas()['aciertos']
+    # Memoria de etapas nueva: la categorización se recalcula, pero mapa y CSV salen de la caché por contenido
+    segunda, registro = ejecutar_analisis(opciones, objetivos, memoria=MemoriaEtapas())
+    assert CACHE_RESULTADOS.estadisticas()['aciertos'] - antes == 2
+    assert {etapa: acierto for etapa, acierto, _ in registro if etapa in objetivos} == {'mapa': True,
+                                                                                        'exportacion': True}
+    assert segunda['mapa'] == primera['mapa'] and segunda['mapa'][:4] == b'\x89PNG'
+    assert segunda['exportacion'] == primera['exportacion']
+
+    # Otros valores (otra semilla) no reutilizan el mapa anterior
+    tercera, registro = ejecutar_analisis({**opciones, 'semilla': 4}, objetivos, memoria=MemoriaEtapas())
+    assert ('mapa', False) in [(etapa, acierto) for etapa, acierto, _ in registro]
+    assert tercera['mapa'] != primera['mapa']
@@ -0,0 +1,75 @@
+import tracemalloc
+
+import numpy as np
+import pytest
+from affine import Affine
+
+from composicion_temporal import CompuestoTemporal, componer_serie
+from evalscripts import NamedBands
+
+TRANSFORM = Affine(10, 0, 500000, 0, -10, 6200000)
+
+def pila_escenas(n_fechas=9, forma=(30, 40), semilla=2):
+    """Pila (fechas, alto, ancho, índices) con nubes al azar y un píxel sin ninguna observación"""
+    rng = np.random.default_rng(semilla)
+    pila = rng.uniform(-0.2, 0.9, size=(n_fechas,) + forma + (2,)).astype(np.float32)
+    pila[rng.random(pila.shape[:3]) < 0.3] = np.nan
+    pila[:, 0, 0] = np.nan
+    return pila
+
+def escenas(pila):
+    for i, data in enumerate(pila):
+        yield f'2024-01-{i + 1:02d}', NamedBands(data, ['NDVI', 'NDRE'], transform=TRANSFORM, crs='EPSG:32720')
+
+@pytest.mark.parametrize('bytes_por_bloque', [4 * 9 * 7, 64 * 1024 * 1024])
+def test_mediana_exacta_por_bloques(bytes_por_bloque):
+    pila = pila_escenas()
+    compuesto = CompuestoTemporal(['NDVI', 'NDRE'], pila.shape[1:3], TRANSFORM)
+    for _, bandas in escenas(pila):
+        compuesto.agregar(bandas)
+    for i, nombre in enumerate(['NDVI', 'NDRE']):
+        with np.errstate(all='ignore'), pytest.warns(RuntimeWarning):
+            esperada = np.nanmedian(pila[..., i], axis=0)
+        np.testing.assert_array_equal(compuesto._mediana(nombre, bytes_por_bloque), esperada)
+
+def test_compuesto_igual_a_la_pila():
+    pila = pila_escenas()
+    serie = componer_serie(escenas(pila), ['ndvi', 'ndre'])
+    compuesto = serie['compuesto']
+    with np.errstate(all='ignore'), pytest.warns(RuntimeWarning):
+        esperados = {'maximo': np.nanmax(pila, axis=0), 'media': np.nanmean(pila, axis=0),
+                     'mediana': np.nanmedian(pila, axis=0)}
+    for i, nombre in enumerate(['NDVI', 'NDRE']):
+        np.testing.assert_array_equal(compuesto['maximo'][nombre], esperados['maximo'][..., i])
+        np.testing.assert_allclose(compuesto['media'][nombre], esperados['media'][..., i], rtol=1e-6)
+        np.testing.assert_array_equal(compuesto['mediana'][nombre], esperados['mediana'][..., i])
+        np.testing.assert_array_equal(compuesto['observaciones'][nombre], np.isfinite(pila[..., i]).sum(axis=0))
+    # Valor de cada índice en la fecha de máximo NDVI
+    fecha_maximo = np.argmax(np.nan_to_num(pila[..., 0], nan=-np.inf), axis=0)
+    en_maximo = np.take_along_axis(pila[..., 1], fecha_maximo[np.newaxis], axis=0)[0]
+    np.testing.assert_array_equal(compuesto['en_maximo']['NDRE'][1:], en_maximo[1:])
+    assert np.isnan(compuesto['mediana']['NDVI'][0, 0]) and np.isnan(compuesto['en_maximo']['NDRE'][0, 0])
+    assert serie['fechas'] == [f'2024-01-{i:02d}' for i in range(1, 10)]
+
+def test_sin_mediana_no_escribe_la_pila():
+    pila = pila_escenas(n_fechas=3)
+    compuesto = componer_serie(escenas(pila), ['NDVI'], mediana=False)['compuesto']
+    assert 'mediana' not in compuesto and 'maximo' in compuesto
+
+def test_memoria_de_la_mediana_acotada_por_el_bloque():
+    # 200 000 píxeles x 20 fechas: la pila completa ocuparía 16 MB y el histograma anterior 6.4 MB
+    forma, n_fechas = (400, 500), 20
+    compuesto = CompuestoTemporal(['NDVI'], forma, TRANSFORM)
+    rng = np.random.default_rng(0)
+    for _ in range(n_fechas):
+        compuesto.agregar(NamedBands(rng.uniform(0, 1, forma).astype(np.float32), ['NDVI'], transform=TRANSFORM))
+
+    tracemalloc.start()
+    try:
+        mediana = compuesto._mediana('NDVI', bytes_por_bloque=1024 * 1024)
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert mediana.shape == forma and np.isfinite(mediana).all()
+    # Resultado (0.8 MB) más un bloque ordenado y sus índices
+    assert pico < mediana.nbytes + 4 * 1024 * 1024
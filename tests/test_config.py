@@ -0,0 +1,23 @@
+from config import get_sentinelhub_config
+from nucleo import ReporteRegistro, credenciales_faltantes, credenciales_sentinel
+
+SECRETOS = {'SENTINELHUB_INSTANCE_ID': 'instancia', 'SENTINELHUB_CLIENT_ID': 'cliente',
+            'SENTINELHUB_CLIENT_SECRET': 'secreto'}
+
+def test_credenciales_desde_mapeo_y_entorno(monkeypatch):
+    esperado = {'instance_id': 'instancia', 'client_id': 'cliente', 'client_secret': 'secreto', 'cache_dir': ''}
+    assert credenciales_sentinel(SECRETOS) == esperado
+    for clave, valor in SECRETOS.items():
+        monkeypatch.setenv(clave, valor)
+    monkeypatch.delenv('SENTINELHUB_CACHE_DIR', raising=False)
+    assert credenciales_sentinel() == esperado
+    assert get_sentinelhub_config() == esperado
+
+def test_claves_faltantes_o_vacias():
+    secretos = {**SECRETOS, 'SENTINELHUB_CLIENT_ID': ''}
+    del secretos['SENTINELHUB_CLIENT_SECRET']
+    assert credenciales_faltantes(secretos) == ['SENTINELHUB_CLIENT_ID', 'SENTINELHUB_CLIENT_SECRET']
+    assert credenciales_sentinel(secretos) is None
+    reporte = ReporteRegistro()
+    assert get_sentinelhub_config(secretos, reporte) is None
+    assert 'SENTINELHUB_CLIENT_ID, SENTINELHUB_CLIENT_SECRET' in reporte.advertencias[0]
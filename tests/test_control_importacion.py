@@ -0,0 +1,15 @@
+import pytest
+
+from control_importacion import ENTRADAS, PRESUPUESTO_S, controlar_entrada
+
+@pytest.mark.parametrize('modulo', list(ENTRADAS))
+def test_entrada_sin_dependencias_pesadas(modulo):
+    presupuesto = PRESUPUESTO_S if modulo == 'app' else None
+    tiempos, problemas = controlar_entrada(modulo, ENTRADAS[modulo], presupuesto)
+    assert modulo in tiempos
+    assert problemas == []
+
+def test_detecta_dependencia_prohibida():
+    # Importar el procesador carga sentinelhub: el control debe informarlo
+    _, problemas = controlar_entrada('satellite_processor', ('sentinelhub',))
+    assert len(problemas) == 1 and 'sentinelhub' in problemas[0]
@@ -0,0 +1,101 @@
+from datetime import date
+
+import geopandas as gpd
+import numpy as np
+import pytest
+import rasterio
+from affine import Affine
+from shapely.geometry import box
+
+from escenas_locales import buscar_escenas, leer_escena, seleccionar_escenas
+
+CRS = 'EPSG:32720'
+ORIGEN = (400000.0, 6240000.0)
+ALTO_10M, ANCHO_10M = 120, 100
+
+def escribir(ruta, data, resolucion):
+    perfil = {'driver': 'GTiff', 'height': data.shape[0], 'width': data.shape[1], 'count': 1,
+              'dtype': data.dtype, 'crs': CRS, 'transform': Affine(resolucion, 0, ORIGEN[0], 0, -resolucion, ORIGEN[1])}
+    with rasterio.open(ruta, 'w', **perfil) as ds:
+        ds.write(data, 1)
+
+def banda_sintetica(alto, ancho, desplazamiento):
+    filas, columnas = np.mgrid[0:alto, 0:ancho]
+    return (filas * 1000 + columnas + desplazamiento).astype(np.uint16)
+
+@pytest.fixture
+def directorio(tmp_path):
+    """Dos fechas de Sentinel-2 (bandas de 10 y 20 m) y una escena Landsat suelta"""
+    for fecha, desplazamiento in (('20240105', 0), ('20240125', 7)):
+        escena = tmp_path / f'S2B_MSIL2A_{fecha}T140049.SAFE'
+        escena.mkdir()
+        base = f'T20HNH_{fecha}T140049'
+        escribir(escena / f'{base}_B04_10m.tif', banda_sintetica(ALTO_10M, ANCHO_10M, desplazamiento), 10)
+        escribir(escena / f'{base}_B08_10m.tif', banda_sintetica(ALTO_10M, ANCHO_10M, desplazamiento + 1), 10)
+        escribir(escena / f'{base}_B05_20m.tif', banda_sintetica(ALTO_10M // 2, ANCHO_10M // 2, 500), 20)
+    escribir(tmp_path / 'LC08_L2SP_227084_20240110_20240120_02_T1_SR_B4.TIF',
+             banda_sintetica(40, 40, 0), 30)
+    (tmp_path / 'leeme.tif.aux.xml').write_text('<x/>')
+    return tmp_path
+
+def parcela_utm(c0, f0, c1, f1):
+    """Parcela sobre los píxeles de 10 m [f0, f1) x [c0, c1)"""
+    x0, y0 = ORIGEN
+    return gpd.GeoDataFrame(geometry=[box(x0 + c0 * 10, y0 - f1 * 10, x0 + c1 * 10, y0 - f0 * 10)], crs=CRS)
+
+def test_catalogo_y_seleccion(directorio):
+    catalogo = buscar_escenas(str(directorio))
+    assert sorted(catalogo) == ['LC08_L2SP_227084_20240110_20240120_02_T1', 'T20HNH_20240105T140049',
+                                'T20HNH_20240125T140049']
+    landsat = catalogo['LC08_L2SP_227084_20240110_20240120_02_T1']
+    assert landsat['sensor'] == 'LANDSAT-8' and landsat['fecha'] == date(2024, 1, 10)
+    assert set(landsat['bandas']) == {'B04'}
+    assert seleccionar_escenas(catalogo, ['B04', 'B08']) == ['T20HNH_20240105T140049', 'T20HNH_20240125T140049']
+    assert seleccionar_escenas(catalogo, ['B04'], fecha_fin='2024-01-20') == [
+        'T20HNH_20240105T140049', 'LC08_L2SP_227084_20240110_20240120_02_T1']
+    assert seleccionar_escenas(catalogo, ['B04'], '2024-01-06', '2024-01-31', sensor='SENTINEL-2') == [
+        'T20HNH_20240125T140049']
+
+def test_ventana_igual_al_recorte_de_la_escena_completa(directorio):
+    catalogo = buscar_escenas(str(directorio))
+    escena = 'T20HNH_20240125T140049'
+    # Límites que no caen en el borde de un píxel: la ventana se amplía al píxel entero
+    gdf = parcela_utm(20.5, 30.2, 47.3, 61.9)
+    lectura = leer_escena(str(directorio), gdf, ['B04', 'B08', 'B05'], catalogo=catalogo,
+                          sensor='SENTINEL-2')
+    assert lectura['escena'] == escena
+    bandas = lectura['bandas']
+    filas, columnas = slice(30, 62), slice(20, 48)
+    rutas = {banda: catalogo[escena]['bandas'][banda][0][1] for banda in ('B04', 'B08', 'B05')}
+    with rasterio.open(rutas['B04']) as ds:
+        np.testing.assert_array_equal(bandas['B04'], ds.read(1)[filas, columnas])
+    with rasterio.open(rutas['B08']) as ds:
+        np.testing.assert_array_equal(bandas['B08'], ds.read(1)[filas, columnas])
+    # La banda de 20 m, por vecino más cercano en la grilla de 10 m
+    with rasterio.open(rutas['B05']) as ds:
+        completa = np.repeat(np.repeat(ds.read(1), 2, axis=0), 2, axis=1)
+    np.testing.assert_array_equal(bandas['B05'], completa[filas, columnas])
+    assert bandas.transform == Affine(10, 0, ORIGEN[0] + 200, 0, -10, ORIGEN[1] - 300)
+    assert lectura['bytes_leidos'] == 3 * 32 * 28 * 2 < lectura['bytes_escena']
+
+def test_parcela_en_geograficas_y_resolucion_gruesa(directorio):
+    gdf = parcela_utm(20, 30, 60, 70).to_crs('EPSG:4326')
+    lectura = leer_escena(str(directorio), gdf, ['B05', 'B04'], resolucion=20, fecha_fin='2024-01-10')
+    assert lectura['escena'] == 'T20HNH_20240105T140049'
+    bandas = lectura['bandas']
+    assert bandas.transform.a == 20 and bandas.shape[0] * 20 >= 400 and bandas.shape[1] * 20 >= 400
+    # Cada píxel de salida toma el de B05 que contiene su centro (vecino más cercano)
+    with rasterio.open(buscar_escenas(str(directorio))['T20HNH_20240105T140049']['bandas']['B05'][0][1]) as ds:
+        completa = ds.read(1)
+        filas, columnas = np.mgrid[0:bandas.shape[0], 0:bandas.shape[1]]
+        xs, ys = bandas.transform * (columnas + 0.5, filas + 0.5)
+        cols, filas_b05 = ~ds.transform * (xs, ys)
+        esperada = completa[np.floor(filas_b05).astype(int), np.floor(cols).astype(int)]
+    np.testing.assert_array_equal(bandas['B05'], esperada)
+
+def test_errores(directorio):
+    fuera = gpd.GeoDataFrame(geometry=[box(0, 0, 10, 10)], crs=CRS)
+    with pytest.raises(ValueError, match='no intersecta'):
+        leer_escena(str(directorio), fuera, ['B04'], sensor='SENTINEL-2')
+    with pytest.raises(ValueError, match='No hay escenas'):
+        leer_escena(str(directorio), parcela_utm(0, 0, 5, 5), ['B11'])
@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+from estadisticas_zonales import PERCENTILES, estadisticas_zonales, medias_zonales
+
+N_ZONAS = 6
+
+@pytest.fixture
+def raster():
+    """Etiquetas 0..6 con la zona 3 sin píxeles y la zona 5 enteramente enmascarada (nubes)"""
+    rng = np.random.default_rng(11)
+    etiquetas = rng.integers(0, N_ZONAS + 1, size=(70, 45)).astype(np.int32)
+    etiquetas[etiquetas == 3] = 0
+    banda = rng.normal(0.5, 0.2, size=etiquetas.shape).astype(np.float32)
+    banda[rng.random(etiquetas.shape) < 0.15] = np.nan
+    banda[etiquetas == 5] = np.nan
+    banda[etiquetas == 0] = 99.0  # fuera de las zonas: no debe influir en el rango de los histogramas
+    return banda, etiquetas
+
+def referencia(banda, etiquetas, zona):
+    valores = banda[(etiquetas == zona) & np.isfinite(banda)].astype(np.float64)
+    return valores, (etiquetas == zona).sum()
+
+# Bloques de pocas filas: la acumulación por bloques debe dar lo mismo que una sola pasada
+@pytest.mark.parametrize('pixeles_por_bloque', [45 * 7, 10 ** 6])
+def test_bincount_igual_a_numpy_por_zona(raster, pixeles_por_bloque):
+    banda, etiquetas = raster
+    tabla = estadisticas_zonales({'NDVI': banda}, etiquetas, N_ZONAS, pixeles_por_bloque=pixeles_por_bloque)['NDVI']
+    validos = banda[(etiquetas > 0) & np.isfinite(banda)]
+    ancho_bin = (validos.max() - validos.min()) / 1024
+
+    assert len(tabla) == N_ZONAS
+    for zona in range(1, N_ZONAS + 1):
+        fila = tabla.iloc[zona - 1]
+        valores, total = referencia(banda, etiquetas, zona)
+        assert fila['pixeles_validos'] == len(valores)
+        if len(valores) == 0:
+            assert np.isnan(fila[['media', 'desvio', 'mediana'] + [f'p{p}' for p in PERCENTILES]]).all()
+            assert fila['fraccion_valida'] == 0 if total else np.isnan(fila['fraccion_valida'])
+            continue
+        assert fila['fraccion_valida'] == pytest.approx(len(valores) / total)
+        assert fila['media'] == pytest.approx(np.mean(valores), rel=1e-9)
+        assert fila['desvio'] == pytest.approx(np.std(valores), abs=1e-6)
+        # Percentiles por histograma: entre los dos valores ordenados que interpola np.percentile,
+        # con a lo sumo un bin de tolerancia; con muchos píxeles por bin, casi el exacto
+        ordenados = np.sort(valores)
+        for p in PERCENTILES:
+            rango = p / 100 * (len(valores) - 1)
+            abajo, arriba = ordenados[int(np.floor(rango))], ordenados[int(np.ceil(rango))]
+            assert abajo - ancho_bin <= fila[f'p{p}'] <= arriba + ancho_bin
+            assert abajo <= np.percentile(valores, p) <= arriba
+        assert fila['mediana'] == fila['p50']
+
+def test_zonas_vacias_y_enmascaradas(raster):
+    banda, etiquetas = raster
+    tabla = estadisticas_zonales(banda, etiquetas, N_ZONAS)['valor']
+    assert tabla.loc[2, 'pixeles_validos'] == 0 and np.isnan(tabla.loc[2, 'fraccion_valida'])
+    assert tabla.loc[4, 'pixeles_validos'] == 0 and tabla.loc[4, 'fraccion_valida'] == 0
+    assert tabla[['media', 'p50']].iloc[[2, 4]].isna().all().all()
+
+def test_banda_constante_y_sin_datos():
+    etiquetas = np.repeat(np.arange(1, 4, dtype=np.int32), 4).reshape(3, 4)
+    constante = np.full(etiquetas.shape, 0.7, dtype=np.float32)
+    tabla = estadisticas_zonales(constante, etiquetas, 3)['valor']
+    np.testing.assert_allclose(tabla[['media', 'mediana', 'p10', 'p90']].to_numpy(), 0.7, rtol=1e-6)
+    np.testing.assert_allclose(tabla['desvio'], 0, atol=1e-6)
+
+    vacia = estadisticas_zonales(np.full(etiquetas.shape, np.nan), etiquetas, 3)['valor']
+    assert vacia['media'].isna().all() and (vacia['pixeles_validos'] == 0).all()
+
+def test_medias_zonales_igual_a_estadisticas(raster):
+    banda, etiquetas = raster
+    media, validos, fraccion = medias_zonales(banda, etiquetas, N_ZONAS, pixeles_por_bloque=45 * 5)
+    tabla = estadisticas_zonales(banda, etiquetas, N_ZONAS)['valor']
+    np.testing.assert_allclose(media, tabla['media'], rtol=1e-9)
+    np.testing.assert_array_equal(validos, tabla['pixeles_validos'])
+    np.testing.assert_allclose(fraccion, tabla['fraccion_valida'])
+
+def test_percentiles_densos_a_un_bin_del_exacto():
+    rng = np.random.default_rng(5)
+    etiquetas = np.repeat(np.array([1, 2], dtype=np.int32), 150_000).reshape(300, 1000)
+    banda = np.where(etiquetas == 1, rng.normal(0.6, 0.1, etiquetas.shape), rng.uniform(-0.2, 0.3, etiquetas.shape))
+    tabla = estadisticas_zonales(banda, etiquetas, 2, pixeles_por_bloque=50_000)['valor']
+    ancho_bin = (banda.max() - banda.min()) / 1024
+    for zona in (1, 2):
+        valores = banda[etiquetas == zona]
+        esperado = np.percentile(valores, PERCENTILES)
+        np.testing.assert_allclose(tabla.loc[zona - 1, [f'p{p}' for p in PERCENTILES]], esperado, atol=ancho_bin)
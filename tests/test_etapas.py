@@ -0,0 +1,91 @@
+import pytest
+
+from nucleo import Etapa, FlujoEtapas, MemoriaEtapas, ejecutar_analisis
+
+def estados(registro):
+    return {etapa: acierto for etapa, acierto, _ in registro}
+
+# ===== MOTOR DE ETAPAS =====
+def flujo_de_prueba(llamadas):
+    def etapa(nombre, valor):
+        def funcion(entradas, opciones, reporte):
+            llamadas.append(nombre)
+            return valor(entradas, opciones)
+        return funcion
+
+    return FlujoEtapas([
+        Etapa('a', etapa('a', lambda e, o: o['x'] * 2), parametros=('x',)),
+        Etapa('b', etapa('b', lambda e, o: o['y'] + 1), parametros=('y',)),
+        Etapa('c', etapa('c', lambda e, o: e['a'] + e['b']), ('a', 'b'))
+    ])
+
+def test_solo_se_recalcula_lo_que_depende_de_la_opcion():
+    llamadas, memoria = [], MemoriaEtapas()
+    flujo = flujo_de_prueba(llamadas)
+    resultados, _ = flujo.ejecutar(('c',), {'x': 1, 'y': 1}, memoria)
+    assert resultados == {'c': 4} and sorted(llamadas) == ['a', 'b', 'c']
+
+    llamadas.clear()
+    resultados, registro = flujo.ejecutar(('c',), {'x': 1, 'y': 1}, memoria)
+    assert resultados == {'c': 4} and llamadas == [] and estados(registro) == {'c': True}
+
+    llamadas.clear()
+    resultados, registro = flujo.ejecutar(('c',), {'x': 1, 'y': 5}, memoria)
+    assert resultados == {'c': 8} and sorted(llamadas) == ['b', 'c']
+    assert estados(registro) == {'a': True, 'b': False, 'c': False}
+
+def test_sin_memoria_cada_etapa_una_vez():
+    llamadas = []
+    flujo_de_prueba(llamadas).ejecutar(('a', 'c'), {'x': 1, 'y': 1})
+    assert sorted(llamadas) == ['a', 'b', 'c']
+
+def test_ciclo_y_etapa_desconocida():
+    flujo = FlujoEtapas([Etapa('a', None, ('b',)), Etapa('b', None, ('a',))])
+    with pytest.raises(ValueError, match="Ciclo"):
+        flujo.claves(('a',), {})
+    with pytest.raises(KeyError):
+        flujo.claves(('z',), {})
+
+def test_clave_contenido_en_almacen_compartido():
+    # Otro proceso guardó un resultado con las mismas opciones pero otro contenido previo
+    almacen = MemoriaEtapas()
+    flujo = FlujoEtapas([
+        Etapa('a', lambda e, o, r: o['valor']),
+        Etapa('b', lambda e, o, r: e['a'] * 10, ('a',), almacen=almacen,
+              clave_contenido=lambda e, o: f"b:{e['a']}")
+    ])
+    flujo.ejecutar(('b',), {}, MemoriaEtapas(), previos={'a': 1})
+    resultados, registro = flujo.ejecutar(('b',), {}, MemoriaEtapas(), previos={'a': 2})
+    assert resultados == {'b': 20} and estados(registro) == {'b': False}
+    resultados, registro = flujo.ejecutar(('b',), {}, MemoriaEtapas(), previos={'a': 1})
+    assert resultados == {'b': 10} and estados(registro) == {'b': True}
+
+# ===== INVALIDACIÓN EN EL ANÁLISIS =====
+@pytest.fixture
+def memoria_inicial(parcela):
+    opciones = {'gdf': parcela, 'semilla': 7, 'n_divisiones': 16}
+    memoria = MemoriaEtapas()
+    _, registro = ejecutar_analisis(opciones, memoria=memoria)
+    assert not any(acierto for _, acierto, _ in registro)
+    return opciones, memoria
+
+def test_mismas_opciones_reutilizan_todo(memoria_inicial):
+    opciones, memoria = memoria_inicial
+    _, registro = ejecutar_analisis(opciones, memoria=memoria)
+    assert estados(registro) == {'categorizacion': True}
+
+def test_cambio_de_divisiones_recalcula_desde_la_subdivision(memoria_inicial):
+    opciones, memoria = memoria_inicial
+    _, registro = ejecutar_analisis({**opciones, 'n_divisiones': 25}, memoria=memoria)
+    assert estados(registro) == {
+        'ingesta': True, 'imagen': True, 'subdivision': False, 'superficie': False, 'indices': False,
+        'recomendaciones': False, 'categorizacion': False
+    }
+
+def test_cambio_de_nutriente_solo_recategoriza(memoria_inicial):
+    opciones, memoria = memoria_inicial
+    _, registro = ejecutar_analisis({**opciones, 'nutriente': 'POTASIO'}, memoria=memoria)
+    assert estados(registro) == {
+        'subdivision': True, 'superficie': True, 'imagen': True, 'indices': True, 'recomendaciones': True,
+        'categorizacion': False
+    }
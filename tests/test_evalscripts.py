@@ -0,0 +1,83 @@
+import re
+
+import numpy as np
+import pytest
+
+from evalscripts import INDEX_RANGES, NamedBands, build_evalscript, quantization_params
+
+def cuantizar(valores, lo, escala, qmin, qmax, nodata, dtype):
+    """quantize() del evalscript en numpy: Math.round redondea las mitades hacia arriba"""
+    niveles = np.floor((valores - lo) / escala + 0.5) + qmin
+    salida = np.clip(np.nan_to_num(niveles, nan=nodata), qmin, qmax)
+    salida[~np.isfinite(valores)] = nodata
+    return salida.astype(dtype)
+
+def reflectancias(forma=(40, 30), semilla=3):
+    rng = np.random.default_rng(semilla)
+    bandas = {banda: rng.uniform(0.01, 0.6, forma) for banda in ('B03', 'B04', 'B05', 'B08')}
+    # Píxeles sin dato (nubes o fuera de la escena) en todas las bandas
+    for banda in bandas.values():
+        banda[:3, :5] = np.nan
+    return bandas
+
+def indices_referencia(b):
+    return {
+        'NDVI': (b['B08'] - b['B04']) / (b['B08'] + b['B04']),
+        'NDRE': (b['B08'] - b['B05']) / (b['B08'] + b['B05']),
+        'GNDVI': (b['B08'] - b['B03']) / (b['B08'] + b['B03']),
+        'NDWI': (b['B03'] - b['B08']) / (b['B03'] + b['B08']),
+    }
+
+@pytest.mark.parametrize('tipo, dtype', [('INT16', np.int16), ('UINT8', np.uint8)])
+def test_ida_y_vuelta_dentro_del_paso(tipo, dtype):
+    indices = indices_referencia(reflectancias())
+    nombres = list(indices)
+    parametros = quantization_params(nombres, tipo)
+    # Los parámetros de quantization_params son los que viajan en el evalscript
+    en_script = re.findall(r'quantize\(.*, (\S+), (\S+), (-?\d+), (-?\d+), (-?\d+)\)', build_evalscript(nombres, tipo))
+    assert [tuple(float(v) for v in p) for p in en_script] == [tuple(map(float, p)) for p in parametros]
+
+    datos = np.stack([cuantizar(indices[nombre], *p, dtype) for nombre, p in zip(nombres, parametros)], axis=-1)
+    bandas = NamedBands(datos, nombres, quantization=parametros)
+    for nombre, (lo, escala, _, _, _) in zip(nombres, parametros):
+        recuperado = bandas[nombre]
+        assert recuperado.dtype == np.float32
+        np.testing.assert_array_equal(np.isnan(recuperado), np.isnan(indices[nombre]))
+        valido = ~np.isnan(indices[nombre])
+        error = np.abs(recuperado[valido] - indices[nombre][valido])
+        assert error.max() <= escala / 2 + 1e-6
+        # Decuantizada una sola vez: el segundo acceso devuelve el mismo array
+        assert bandas[nombre] is recuperado
+
+@pytest.mark.parametrize('tipo, dtype', [('INT16', np.int16), ('UINT8', np.uint8)])
+def test_extremos_del_rango_y_recorte(tipo, dtype):
+    (lo, escala, qmin, qmax, nodata), = parametros = quantization_params(['NDVI'], tipo)
+    hi = INDEX_RANGES['NDVI'][1]
+    valores = np.array([[lo, hi, lo - 0.5, hi + 0.5, np.nan, np.inf]])
+    datos = cuantizar(valores, *parametros[0], dtype)
+    np.testing.assert_array_equal(datos[0], [qmin, qmax, qmin, qmax, nodata, nodata])
+    recuperado = NamedBands(datos, ['NDVI'], quantization=parametros)['NDVI'][0]
+    np.testing.assert_allclose(recuperado[:4], [lo, hi, lo, hi], atol=1e-6)
+    assert np.isnan(recuperado[4:]).all()
+
+def test_rango_ajustado_reduce_el_paso():
+    (_, paso_completo, *_), = quantization_params(['NDVI'], 'UINT8')
+    (lo, paso, qmin, qmax, nodata), = quantization_params(['NDVI'], 'UINT8', ranges={'ndvi': (0.0, 1.0)})
+    assert lo == 0.0 and paso == pytest.approx(paso_completo / 2)
+    ndvi = indices_referencia(reflectancias())['NDVI'].clip(0, 1)
+    datos = cuantizar(ndvi, lo, paso, qmin, qmax, nodata, np.uint8)
+    recuperado = NamedBands(datos, ['NDVI'], quantization=[(lo, paso, qmin, qmax, nodata)])['NDVI']
+    valido = ~np.isnan(ndvi)
+    assert np.abs(recuperado[valido] - ndvi[valido]).max() <= paso / 2 + 1e-6
+
+def test_bandas_crudas_sin_cuantizar_son_vistas():
+    # Reflectancias como números digitales UINT16 (0 = sin datos): se devuelven tal cual, sin copia
+    b = reflectancias()
+    numeros = np.stack([np.nan_to_num(b[banda] * 10000).round().astype(np.uint16) for banda in ('B04', 'B08')],
+                       axis=-1)
+    bandas = NamedBands(numeros, ['B04', 'B08'])
+    assert np.shares_memory(bandas['B08'], numeros)
+    np.testing.assert_array_equal(bandas['B04'], numeros[..., 0])
+    valido = ~np.isnan(b['B04'])
+    assert np.abs(bandas['B04'][valido] / 10000 - b['B04'][valido]).max() <= 0.5 / 10000
+    assert (bandas['B04'][~valido] == 0).all()
@@ -0,0 +1,23 @@
+import numpy as np
+import pytest
+
+from evalscripts import INDEX_FORMULAS
+from indices_espectrales import CALCULO_LOCAL, bandas_requeridas, calcular_indices
+
+def test_registro_unico_de_indices():
+    # Cada índice del evalscript se puede calcular también sobre escenas locales
+    assert set(CALCULO_LOCAL) == set(INDEX_FORMULAS)
+
+def test_calculo_local_de_todos_los_indices():
+    rng = np.random.default_rng(0)
+    bandas = {banda: rng.uniform(0.01, 0.6, (7, 5)).astype(np.float32)
+              for banda in bandas_requeridas(INDEX_FORMULAS)}
+    resultado = calcular_indices(list(INDEX_FORMULAS), bandas, pixeles_por_bloque=10)
+    assert list(resultado) == list(INDEX_FORMULAS)
+    b04, b08 = bandas['B04'].astype(np.float64), bandas['B08'].astype(np.float64)
+    np.testing.assert_allclose(resultado['NDVI'], (b08 - b04) / (b08 + b04), rtol=1e-5)
+    np.testing.assert_allclose(resultado['savi'], 1.5 * (b08 - b04) / (b08 + b04 + 0.5), rtol=1e-5)
+
+def test_indice_no_soportado():
+    with pytest.raises(ValueError, match="Índice no soportado"):
+        bandas_requeridas(['NDVI', 'XYZ'])
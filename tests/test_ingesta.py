@@ -0,0 +1,105 @@
+import io
+import os
+import tempfile
+import zipfile
+
+import geopandas as gpd
+import pytest
+
+import ingesta
+from ingesta import cargar_parcela, leer_parcela
+
+def archivos_shapefile(gdf, tmp_path, nombre='lote'):
+    directorio = tmp_path / f'shp_{nombre}'
+    directorio.mkdir()
+    gdf.to_file(directorio / f'{nombre}.shp')
+    return {ruta.name: ruta.read_bytes() for ruta in directorio.iterdir()}
+
+def comprimir(miembros):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for nombre, datos in miembros.items():
+            zf.writestr(nombre, datos)
+    return buf.getvalue()
+
+def leer_extrayendo(datos):
+    """Lectura original: extraer el ZIP a un directorio temporal y abrir el .shp de la raíz"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with zipfile.ZipFile(io.BytesIO(datos)) as zf:
+            zf.extractall(tmp_dir)
+        shp = [f for f in os.listdir(tmp_dir) if f.endswith('.shp')][0]
+        return gpd.read_file(os.path.join(tmp_dir, shp))
+
+def prohibir_extraccion(monkeypatch):
+    def extraer(*args, **kwargs):
+        raise AssertionError("la ingesta no debe extraer el ZIP a disco")
+    monkeypatch.setattr(zipfile.ZipFile, 'extractall', extraer)
+    monkeypatch.setattr(zipfile.ZipFile, 'extract', extraer)
+
+@pytest.fixture
+def sin_extraer(monkeypatch):
+    prohibir_extraccion(monkeypatch)
+
+@pytest.fixture
+def lote(parcela):
+    return parcela.assign(nombre=['lote norte'], superficie=[80.5])
+
+def test_shapefile_en_zip_igual_a_extraer(lote, tmp_path, monkeypatch):
+    datos = comprimir(archivos_shapefile(lote, tmp_path))
+    esperado = leer_extrayendo(datos)
+    prohibir_extraccion(monkeypatch)
+    leido = leer_parcela('lote.zip', datos)
+    assert leido.crs == esperado.crs
+    assert leido.geom_equals(esperado).all()
+    assert leido.drop(columns='geometry').equals(esperado.drop(columns='geometry'))
+
+def test_zip_anidado_con_basura(lote, parcela, tmp_path, sin_extraer):
+    otro = parcela.translate(1, 1)
+    miembros = {f'campo/sub/{n}': d for n, d in archivos_shapefile(otro, tmp_path, 'profundo').items()}
+    miembros.update({f'campo/{n}': d for n, d in archivos_shapefile(lote, tmp_path).items()})
+    miembros.update({'__MACOSX/campo/._lote.shp': b'basura', 'campo/.DS_Store': b'basura', 'leeme.txt': b'hola'})
+    leido = leer_parcela('campo.zip', comprimir(miembros))
+    # Gana el shapefile menos anidado, con todos sus componentes (.prj incluido)
+    assert leido.geom_equals(lote.geometry).all() and leido.crs == lote.crs
+    assert list(leido['nombre']) == ['lote norte']
+
+@pytest.mark.parametrize('extension, driver', [('geojson', 'GeoJSON'), ('gpkg', 'GPKG')])
+def test_formatos_directos_y_dentro_del_zip(lote, tmp_path, sin_extraer, extension, driver):
+    ruta = tmp_path / f'lote.{extension}'
+    lote.to_file(ruta, driver=driver)
+    datos = ruta.read_bytes()
+    for nombre, contenido in ((ruta.name, datos), ('lote.zip', comprimir({f'x/{ruta.name}': datos}))):
+        leido = leer_parcela(nombre, contenido)
+        assert leido.geom_equals(gpd.read_file(ruta)).all()
+    # ZIP reconocido por su firma aunque el nombre no lo diga
+    assert len(leer_parcela('descarga', comprimir({ruta.name: datos}))) == 1
+
+def test_errores_claros():
+    with pytest.raises(ValueError, match='no contiene'):
+        leer_parcela('vacio.zip', comprimir({'leeme.txt': b'hola'}))
+    with pytest.raises(ValueError, match='Formato no soportado'):
+        leer_parcela('lote.kml', b'<kml/>')
+
+def test_cache_de_parcelas_por_contenido(lote, tmp_path, monkeypatch):
+    monkeypatch.setattr(ingesta, '_cache_parcelas', type(ingesta._cache_parcelas)())
+    monkeypatch.setattr(ingesta, 'MAX_PARCELAS_CACHE', 2)
+    leidas = []
+    leer = ingesta.leer_parcela
+    monkeypatch.setattr(ingesta, 'leer_parcela', lambda nombre, datos: leidas.append(nombre) or leer(nombre, datos))
+
+    contenidos = {}
+    for i in range(3):
+        ruta = tmp_path / f'lote_{i}.geojson'
+        lote.translate(i).to_file(ruta, driver='GeoJSON')
+        contenidos[i] = ruta.read_bytes()
+
+    gdf, clave = cargar_parcela('lote_0.geojson', contenidos[0])
+    # Mismo contenido con otro nombre: el mismo GeoDataFrame, sin volver a parsear
+    copia, clave_copia = cargar_parcela('copia.geojson', contenidos[0])
+    assert copia is gdf and clave_copia == clave and leidas == ['lote_0.geojson']
+    cargar_parcela('lote_1.geojson', contenidos[1])
+    cargar_parcela('lote_2.geojson', contenidos[2])
+    # Con capacidad 2, la menos usada (lote_0) se expulsó
+    cargar_parcela('lote_0.geojson', contenidos[0])
+    assert leidas == ['lote_0.geojson', 'lote_1.geojson', 'lote_2.geojson', 'lote_0.geojson']
+    assert clave == ingesta.hash_archivo(contenidos[0])
@@ -0,0 +1,82 @@
+import geopandas as gpd
+import numpy as np
+import pytest
+import rasterio
+from affine import Affine
+from shapely.geometry import box
+
+from escenas_locales import indices_escena
+from mascara_nubes import (BITS_QA_INVALIDOS, CLASES_SCL_INVALIDAS, mascara_calidad, mascara_qa_pixel,
+                           mascara_scl)
+
+def scl_referencia(scl, clases=CLASES_SCL_INVALIDAS):
+    """Referencia: un píxel es válido si su clase (0 fuera de 0..255) no está en la lista"""
+    return np.array([(int(v) if 0 <= v < 256 else 0) not in clases for v in np.ravel(scl)]).reshape(np.shape(scl))
+
+def qa_referencia(qa, bits=BITS_QA_INVALIDOS):
+    """Referencia: un píxel es válido si ninguno de los bits indicados está encendido"""
+    return np.array([not any((int(v) >> bit) & 1 for bit in bits) for v in np.ravel(qa)]).reshape(np.shape(qa))
+
+def test_scl_todas_las_clases():
+    scl = np.arange(256, dtype=np.uint8).reshape(16, 16)
+    np.testing.assert_array_equal(mascara_scl(scl), scl_referencia(scl))
+    assert [clase for clase in range(12) if mascara_scl(scl).flat[clase]] == [2, 4, 5, 6, 7]
+
+@pytest.mark.parametrize('dtype', [np.uint16, np.int16, np.int32, np.float32])
+def test_scl_otros_tipos_y_fuera_de_rango(dtype):
+    rng = np.random.default_rng(1)
+    valores = rng.integers(-300, 700, size=(40, 50))
+    if np.dtype(dtype).kind == 'u':
+        valores = np.abs(valores)
+    scl = valores.astype(dtype)
+    # 260 no es la clase 4 aunque 260 % 256 == 4: fuera de rango se toma como sin datos
+    scl[0, :3] = [4, 260, -1 if np.dtype(dtype).kind != 'u' else 65535]
+    esperada = scl_referencia(scl)
+    np.testing.assert_array_equal(mascara_scl(scl), esperada)
+    assert list(mascara_scl(scl)[0, :3]) == [True, False, False]
+
+def test_scl_clases_propias():
+    scl = np.random.default_rng(2).integers(0, 12, size=(30, 30)).astype(np.uint8)
+    for clases in ((), (4,), [8, 9, 10], tuple(range(12))):
+        np.testing.assert_array_equal(mascara_scl(scl, clases), scl_referencia(scl, tuple(clases)))
+    # La tabla por defecto no queda modificada por listas propias
+    np.testing.assert_array_equal(mascara_scl(scl), scl_referencia(scl))
+
+def test_qa_pixel_todos_los_valores():
+    qa = np.arange(2 ** 16, dtype=np.uint16).reshape(256, 256)
+    np.testing.assert_array_equal(mascara_qa_pixel(qa), qa_referencia(qa))
+    for bits in ((3,), (1, 3, 4), (15,)):
+        np.testing.assert_array_equal(mascara_qa_pixel(qa, bits), qa_referencia(qa, bits))
+    # Valor típico de Landsat C2 para tierra despejada (21824) y nube de alta confianza (22280)
+    assert mascara_qa_pixel(np.uint16(21824)) and not mascara_qa_pixel(np.uint16(22280))
+
+def test_despacho_por_sensor():
+    banda = np.array([[4, 8], [21824, 22280]], dtype=np.uint16)
+    np.testing.assert_array_equal(mascara_calidad('SENTINEL-2', banda), mascara_scl(banda))
+    np.testing.assert_array_equal(mascara_calidad('LANDSAT-8', banda), mascara_qa_pixel(banda))
+
+def escribir(ruta, data, resolucion):
+    perfil = {'driver': 'GTiff', 'height': data.shape[0], 'width': data.shape[1], 'count': 1,
+              'dtype': data.dtype, 'crs': 'EPSG:32720',
+              'transform': Affine(resolucion, 0, 400000.0, 0, -resolucion, 6240000.0)}
+    with rasterio.open(ruta, 'w', **perfil) as ds:
+        ds.write(data, 1)
+
+def test_escena_local_con_scl(tmp_path):
+    escena = tmp_path / 'S2A_MSIL2A_20240110T140049.SAFE'
+    escena.mkdir()
+    rng = np.random.default_rng(3)
+    escribir(escena / 'T20HNH_20240110T140049_B04_10m.tif', rng.integers(500, 1500, (40, 40)).astype(np.uint16), 10)
+    escribir(escena / 'T20HNH_20240110T140049_B08_10m.tif', rng.integers(2000, 4000, (40, 40)).astype(np.uint16), 10)
+    scl = rng.integers(0, 12, (20, 20)).astype(np.uint8)
+    escribir(escena / 'T20HNH_20240110T140049_SCL_20m.tif', scl, 20)
+    gdf = gpd.GeoDataFrame(geometry=[box(400000, 6239600, 400400, 6240000)], crs='EPSG:32720')
+
+    con, lectura = indices_escena(str(tmp_path), gdf, ['NDVI'])
+    sin, _ = indices_escena(str(tmp_path), gdf, ['NDVI'], mascara_nubes=False)
+    # SCL de 20 m llevada a la grilla de 10 m por vecino más cercano
+    valida = scl_referencia(np.repeat(np.repeat(scl, 2, axis=0), 2, axis=1))
+    np.testing.assert_array_equal(np.isnan(con['NDVI']), ~valida)
+    np.testing.assert_array_equal(con['NDVI'][valida], sin['NDVI'][valida])
+    assert not np.isnan(sin['NDVI']).any()
+    assert lectura['fraccion_valida'] == pytest.approx(valida.mean())
@@ -0,0 +1,105 @@
+import os
+
+import pandas as pd
+import pytest
+
+import procesamiento_lotes
+from procesamiento_lotes import listar_parcelas, nombre_salida, procesar_lote
+
+OPCIONES = {'satelite': 'DATOS_SIMULADOS', 'n_divisiones': 4, 'dpi_mapa': 30}
+
+@pytest.fixture
+def lote(tmp_path, parcela):
+    """Directorio con tres parcelas (una en un subdirectorio), un archivo roto y un .json que no es parcela"""
+    entrada = tmp_path / 'entrada'
+    (entrada / 'campo_b').mkdir(parents=True)
+    parcela.to_file(entrada / 'lote_1.geojson', driver='GeoJSON')
+    parcela.translate(0.02).to_file(entrada / 'lote_2.gpkg', driver='GPKG')
+    parcela.translate(-0.02).to_file(entrada / 'campo_b' / 'lote_1.geojson', driver='GeoJSON')
+    (entrada / 'roto.geojson').write_text('{"type": "FeatureCollection"')
+    (entrada / 'metadatos.json').write_text('{"campaña": "2024/25"}')
+    return entrada
+
+def test_listar_directorio_sin_json_sueltos_ni_salida(lote):
+    salida = lote / 'resultados'
+    salida.mkdir()
+    (salida / 'lote_1.gpkg').write_bytes(b'')
+    nombres = [tarea['nombre'] for tarea in listar_parcelas(str(lote), excluir=[str(salida)])]
+    assert nombres == ['lote_1', 'lote_2', 'roto', 'campo_b__lote_1']
+    with pytest.raises(ValueError):
+        listar_parcelas(str(lote), excluir=[str(lote)])
+
+def test_listar_manifiesto_con_opciones(lote):
+    manifiesto = lote / 'manifiesto.csv'
+    manifiesto.write_text("archivo,cultivo,n_divisiones,ignorada\n"
+                          "lote_1.geojson,SOJA,9,x\n"
+                          "campo_b/lote_1.geojson,,,\n")
+    tareas = listar_parcelas(str(manifiesto))
+    assert tareas == [
+        {'archivo': str(lote / 'lote_1.geojson'), 'nombre': 'lote_1', 'cultivo': 'SOJA', 'n_divisiones': 9},
+        {'archivo': str(lote / 'campo_b' / 'lote_1.geojson'), 'nombre': 'campo_b__lote_1'},
+    ]
+
+def test_nombre_salida_relativo():
+    assert nombre_salida(os.path.join('base', 'a', 'b', 'lote.zip'), 'base') == 'a__b__lote'
+
+def test_pool_escribe_resultados_y_resumen(lote, tmp_path):
+    salida = tmp_path / 'salida'
+    tareas = listar_parcelas(str(lote))
+    vistas = []
+    resumen = procesar_lote(tareas, str(salida), OPCIONES, procesos=2,
+                            progreso=lambda fila, hechas, total: vistas.append((hechas, total)))
+
+    assert vistas == [(i, len(tareas)) for i in range(1, len(tareas) + 1)]
+    assert list(resumen['parcela']) == [tarea['nombre'] for tarea in tareas]
+    assert list(resumen['estado']) == ['ok', 'ok', 'error', 'ok']
+    columnas = ['parcela', 'archivo', 'estado', 'zonas', 'area_ha', 'valor_promedio', 'salida', 'mapa']
+    pd.testing.assert_frame_equal(pd.read_csv(salida / 'resumen.csv')[columnas], resumen[columnas],
+                                  check_dtype=False)
+    for fila in resumen[resumen['estado'] == 'ok'].to_dict('records'):
+        assert fila['zonas'] == 4
+        assert os.path.exists(fila['salida']) and os.path.exists(fila['mapa'])
+    assert sorted(os.listdir(salida)) == ['campo_b__lote_1.gpkg', 'campo_b__lote_1.png', 'lote_1.gpkg',
+                                          'lote_1.png', 'lote_2.gpkg', 'lote_2.png', 'resumen.csv']
+
+def test_nombres_repetidos_no_se_pisan(lote, tmp_path):
+    tareas = [{'archivo': str(lote / 'lote_1.geojson'), 'nombre': 'lote'},
+              {'archivo': str(lote / 'lote_2.gpkg'), 'nombre': 'lote'}]
+    resumen = procesar_lote(tareas, str(tmp_path / 'salida'), OPCIONES, procesos=1)
+    assert list(resumen['estado']) == ['error', 'error']
+    assert resumen['error'].str.startswith('Nombre de salida repetido').all()
+
+def test_reanudar_omite_solo_lo_ya_analizado(lote, tmp_path, monkeypatch):
+    salida = tmp_path / 'salida'
+    tareas = listar_parcelas(str(lote))
+    primera = procesar_lote(tareas, str(salida), OPCIONES, procesos=1)
+
+    procesadas = []
+    procesar_parcela = procesamiento_lotes.procesar_parcela
+    def registrar(tarea, *args):
+        procesadas.append(tarea['nombre'])
+        return procesar_parcela(tarea, *args)
+    monkeypatch.setattr(procesamiento_lotes, 'procesar_parcela', registrar)
+
+    # Solo se reintenta la que falló; las demás conservan su fila del resumen anterior
+    segunda = procesar_lote(tareas, str(salida), OPCIONES, procesos=1, reanudar=True)
+    assert procesadas == ['roto']
+    columnas = ['parcela', 'estado', 'zonas', 'valor_promedio', 'clave', 'segundos']
+    ok = primera['estado'] == 'ok'
+    pd.testing.assert_frame_equal(segunda.loc[ok, columnas], primera.loc[ok, columnas], check_dtype=False)
+    assert list(segunda['estado']) == list(primera['estado'])
+
+    # Un resultado borrado o una opción distinta vuelven a procesar la parcela
+    procesadas.clear()
+    os.remove(salida / 'lote_2.png')
+    procesar_lote(tareas, str(salida), OPCIONES, procesos=1, reanudar=True)
+    assert procesadas == ['lote_2', 'roto']
+    procesadas.clear()
+    procesar_lote(tareas, str(salida), {**OPCIONES, 'cultivo': 'SOJA'}, procesos=1, reanudar=True)
+    assert procesadas == [tarea['nombre'] for tarea in tareas]
+
+def test_parquet_sin_pyarrow_error_claro(lote, tmp_path, monkeypatch):
+    monkeypatch.setattr(procesamiento_lotes.importlib.util, 'find_spec',
+                        lambda nombre: None if nombre == 'pyarrow' else object())
+    with pytest.raises(ValueError, match='pyarrow'):
+        procesar_lote(listar_parcelas(str(lote)), str(tmp_path / 'salida'), {**OPCIONES, 'formato': 'parquet'})
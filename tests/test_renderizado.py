@@ -0,0 +1,85 @@
+import io
+
+import numpy as np
+import pytest
+from matplotlib.figure import Figure
+from matplotlib.path import Path
+from PIL import Image
+from shapely.geometry import GeometryCollection, LineString, MultiPolygon, Polygon, box
+from shapely.geometry.polygon import orient
+
+from renderizado import _dibujar_etiquetas, escala_mapa, geometrias_a_paths, renderizar_mapa_zonas
+
+def path_referencia(geometria):
+    """Un anillo por vez, como lo haría un bucle sobre exterior e interiores de cada polígono orientado"""
+    poligonos = [orient(g) for g in getattr(geometria, 'geoms', [geometria]) if g.geom_type == 'Polygon']
+    vertices, codigos = [], []
+    for poligono in poligonos:
+        for anillo in [poligono.exterior, *poligono.interiors]:
+            coordenadas = np.asarray(anillo.coords)
+            vertices.append(coordenadas)
+            codigos += [Path.MOVETO] + [Path.LINETO] * (len(coordenadas) - 2) + [Path.CLOSEPOLY]
+    return np.concatenate(vertices), np.array(codigos)
+
+def geometrias():
+    # Hueco con la misma orientación que el exterior y un triángulo horario: hay que reorientarlos
+    con_hueco = Polygon([(0, 0), (4, 0), (4, 4), (0, 4)], holes=[[(1, 1), (2, 1), (2, 2), (1, 2)]])
+    multi = MultiPolygon([box(5, 0, 6, 1), Polygon([(7, 0), (8, 2), (9, 0)])])
+    mixta = GeometryCollection([box(10, 0, 11, 1), LineString([(10, 0), (12, 2)])])
+    return [con_hueco, multi, box(0, 5, 1, 6), mixta]
+
+def test_paths_iguales_a_la_referencia():
+    paths = geometrias_a_paths(geometrias())
+    assert len(paths) == 4
+    for path, geometria in zip(paths, geometrias()):
+        vertices, codigos = path_referencia(geometria)
+        np.testing.assert_array_equal(path.vertices, vertices)
+        np.testing.assert_array_equal(path.codes, codigos)
+
+def test_hueco_sin_relleno():
+    # Agg rellena por número de vueltas: un hueco con la orientación del exterior saldría pintado
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.patches import PathPatch
+    fig = Figure(figsize=(4, 4))
+    FigureCanvasAgg(fig)
+    ax = fig.add_axes([0, 0, 1, 1])
+    ax.set_xlim(0, 4)
+    ax.set_ylim(0, 4)
+    ax.axis('off')
+    ax.add_patch(PathPatch(geometrias_a_paths(geometrias()[:1])[0], facecolor='red', edgecolor='none'))
+    fig.canvas.draw()
+    imagen = np.asarray(fig.canvas.buffer_rgba())
+    alto, ancho = imagen.shape[:2]
+    def color(x, y):
+        return tuple(imagen[int(alto * (1 - y / 4)), int(ancho * x / 4), :3])
+    assert color(3, 3) == (255, 0, 0)
+    assert color(1.5, 1.5) == (255, 255, 255)
+
+@pytest.mark.parametrize('n_zonas, esperadas', [(4, 4), (12, 4)])
+def test_etiquetas_completas_o_diezmadas(n_zonas, esperadas):
+    ax = Figure().add_subplot(1, 1, 1)
+    zonas = [box(i, 0, i + 1, 1) for i in range(n_zonas)]
+    _dibujar_etiquetas(ax, np.array(zonas, dtype=object), np.arange(n_zonas, dtype=float),
+                       range(1, n_zonas + 1), umbral_etiquetas=10, max_etiquetas=4)
+    assert len(ax.texts) == esperadas
+    if n_zonas <= 10:
+        assert [t.get_text() for t in ax.texts] == [f"Z{i + 1}\n{i:.1f}" for i in range(n_zonas)]
+    else:
+        # Una de cada ceil(12 / 4) = 3 zonas, sin recuadro
+        assert [t.get_text() for t in ax.texts] == ['0.0', '3.0', '6.0', '9.0']
+
+def test_png_con_la_resolucion_pedida():
+    cmap, vmin, vmax, _, etiqueta = escala_mapa("FERTILIDAD ACTUAL", "NITRÓGENO", "TRIGO")
+    tamanos = []
+    for dpi in (40, 80):
+        png = renderizar_mapa_zonas(geometrias(), [0.2, 0.5, 0.9, np.nan], [1, 2, 3, 4], cmap, vmin, vmax,
+                                    'Mapa', etiqueta, dpi=dpi)
+        imagen = Image.open(io.BytesIO(png.getvalue()))
+        assert imagen.format == 'PNG'
+        tamanos.append(imagen.size)
+    assert tamanos[1][0] == pytest.approx(2 * tamanos[0][0], rel=0.05)
+
+def test_escala_de_recomendaciones_por_cultivo():
+    _, vmin, vmax, columna, etiqueta = escala_mapa("RECOMENDACIONES NPK", "NITRÓGENO", "MAÍZ")
+    assert columna == 'valor_recomendado' and 'NITRÓGENO' in etiqueta
+    assert vmin < vmax
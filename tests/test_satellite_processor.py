@@ -0,0 +1,132 @@
+import io
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import geopandas as gpd
+import numpy as np
+import pytest
+from shapely.geometry import box
+
+import satellite_processor
+from satellite_processor import SatelliteProcessor
+
+# El mock escribe las teselas en TIFF; tifffile llega con sentinelhub pero no está en requirements.txt
+tifffile = pytest.importorskip('tifffile')
+
+# Parcela de ~0.9 x 1.1 km: con teselas de 50 px se descarga en varias
+LIMITES = (-60.01, -34.01, -60.0, -34.0)
+
+class MockProcessAPI(BaseHTTPRequestHandler):
+    """Token OAuth y Process API: cada píxel vale fila * 10000 + columna del mosaico completo"""
+
+    def log_message(self, *args):
+        pass
+
+    def _responder(self, estado, cuerpo=b'', tipo='application/json'):
+        self.send_response(estado)
+        self.send_header('Content-Type', tipo)
+        self.send_header('Content-Length', str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def do_POST(self):
+        cuerpo = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.path.startswith('/oauth/token'):
+            token = {'access_token': 'token', 'token_type': 'Bearer', 'expires_in': 3600,
+                     'expires_at': time.time() + 3600}
+            return self._responder(200, json.dumps(token).encode())
+
+        servidor = self.server
+        with servidor.lock:
+            servidor.requests += 1
+            estado = servidor.fallos.pop(0) if servidor.fallos else 200
+        if estado != 200:
+            return self._responder(estado, b'{"error": {"status": %d}}' % estado)
+
+        payload = json.loads(cuerpo)
+        minx, miny, maxx, maxy = payload['input']['bounds']['bbox']
+        ancho, alto = payload['output']['width'], payload['output']['height']
+        n_bandas = int(re.search(r'bands:\s*(\d+)', payload['evalscript']).group(1))
+        dx, dy = (maxx - minx) / ancho, (maxy - miny) / alto
+        # Posición de la tesela en el mosaico, desde el borde noroeste de la parcela
+        col0 = round((minx - servidor.limites[0]) / dx)
+        fila0 = round((servidor.limites[3] - maxy) / dy)
+        filas, columnas = np.mgrid[fila0:fila0 + alto, col0:col0 + ancho]
+        tesela = np.repeat((filas * 10000 + columnas).astype(np.float32)[..., np.newaxis], n_bandas, axis=2)
+        buffer = io.BytesIO()
+        tifffile.imwrite(buffer, tesela.squeeze(axis=2) if n_bandas == 1 else tesela)
+        self._responder(200, buffer.getvalue(), 'image/tiff')
+
+@pytest.fixture
+def servidor(monkeypatch):
+    # Token por HTTP local y sin reintentos propios de sentinelhub: los reintentos son los del processor
+    monkeypatch.setenv('OAUTHLIB_INSECURE_TRANSPORT', '1')
+    servidor = ThreadingHTTPServer(('127.0.0.1', 0), MockProcessAPI)
+    servidor.lock = threading.Lock()
+    servidor.requests = 0
+    servidor.fallos = []
+    servidor.limites = LIMITES
+    hilo = threading.Thread(target=servidor.serve_forever, daemon=True)
+    hilo.start()
+    yield servidor
+    servidor.shutdown()
+    servidor.server_close()
+
+@pytest.fixture
+def esperas(monkeypatch):
+    """Esperas del backoff registradas en lugar de dormir"""
+    registradas = []
+
+    class Tiempo:
+        perf_counter = staticmethod(time.perf_counter)
+
+        @staticmethod
+        def sleep(segundos):
+            registradas.append(segundos)
+
+    monkeypatch.setattr(satellite_processor, 'time', Tiempo)
+    return registradas
+
+def crear_processor(servidor):
+    url = f"http://127.0.0.1:{servidor.server_address[1]}"
+    processor = SatelliteProcessor({'instance_id': 'instancia', 'client_id': f'cliente-{url}',
+                                    'client_secret': 'secreto', 'base_url': url, 'token_url': f"{url}/oauth/token"})
+    processor.sh_config.max_download_attempts = 1
+    processor.sh_config.max_retries = 1
+    return processor
+
+def parcela():
+    return gpd.GeoDataFrame(geometry=[box(*LIMITES)], crs='EPSG:4326')
+
+def test_mosaico_unido_por_teselas(servidor, esperas):
+    resultado = crear_processor(servidor).download_sentinel2_tiled(parcela(), '2024-01-01', '2024-01-31',
+                                                                   max_tile_size=50)
+    mosaico = resultado['data']
+    filas, columnas = np.mgrid[0:mosaico.shape[0], 0:mosaico.shape[1]]
+    assert len(resultado['tile_times']) > 1
+    assert servidor.requests == len(resultado['tile_times'])
+    np.testing.assert_array_equal(mosaico, (filas * 10000 + columnas).astype(np.float32))
+    assert esperas == []
+
+def test_reintentos_con_backoff_en_429_y_5xx(servidor, esperas):
+    servidor.fallos = [429, 503]
+    resultado = crear_processor(servidor).download_sentinel2_tiled(parcela(), '2024-01-01', '2024-01-31',
+                                                                   max_tile_size=50)
+    intentos = [tesela['attempts'] for tesela in resultado['tile_times']]
+    assert sum(intentos) == len(intentos) + 2
+    assert servidor.requests == len(intentos) + 2
+    assert np.isfinite(resultado['data']).all()
+    # Backoff exponencial: 1 s tras el primer fallo de una tesela, 2 s tras el segundo
+    backoff = satellite_processor.BACKOFF_SECONDS
+    assert sorted(esperas) in ([backoff, backoff], [backoff, 2 * backoff])
+
+def test_error_tras_agotar_los_intentos(servidor, esperas):
+    servidor.fallos = [500] * satellite_processor.MAX_ATTEMPTS
+    with pytest.raises(Exception):
+        crear_processor(servidor).download_sentinel2_tiled(parcela(), '2024-01-01', '2024-01-31')
+    backoff = satellite_processor.BACKOFF_SECONDS
+    assert esperas == [backoff * 2 ** i for i in range(satellite_processor.MAX_ATTEMPTS - 1)]
+    assert servidor.requests == satellite_processor.MAX_ATTEMPTS
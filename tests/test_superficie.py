@@ -0,0 +1,59 @@
+import geopandas as gpd
+import numpy as np
+import pytest
+from pyproj import Geod
+from shapely.geometry import box
+
+import superficie
+from superficie import calcular_superficie, crs_area_igual, superficies_ha
+
+GEOD = Geod(ellps='WGS84')
+
+def hectareas_geodesicas(gdf):
+    """Referencia: área geodésica sobre el elipsoide, geometría por geometría"""
+    gdf = gdf.to_crs('EPSG:4326')
+    return np.array([abs(GEOD.geometry_area_perimeter(g)[0]) for g in gdf.geometry]) / 10000
+
+@pytest.fixture
+def zonas(parcela):
+    # Zonas de tamaños distintos, una de ellas lejos (otro centro de proyección)
+    return gpd.GeoDataFrame(geometry=[parcela.geometry.iloc[0], box(-60.0, -34.0, -59.99, -33.99),
+                                      box(-58.0, -38.0, -57.9, -37.95)], index=[10, 20, 30], crs='EPSG:4326')
+
+def test_igual_al_area_geodesica(zonas):
+    areas = calcular_superficie(zonas)
+    assert list(areas.index) == [10, 20, 30]
+    np.testing.assert_allclose(areas, hectareas_geodesicas(zonas), rtol=1e-5)
+
+def test_crs_proyectado_da_lo_mismo(parcela):
+    utm = parcela.to_crs(parcela.estimate_utm_crs())
+    # UTM deforma las áreas (factor de escala); la reproyección a área igual lo corrige
+    np.testing.assert_allclose(calcular_superficie(utm), hectareas_geodesicas(parcela), rtol=1e-5)
+    assert abs(utm.area.iloc[0] / 10000 / hectareas_geodesicas(parcela)[0] - 1) > 1e-4
+
+def test_sin_crs_en_metros():
+    gdf = gpd.GeoDataFrame(geometry=[box(0, 0, 100, 200), box(0, 0, 1000, 1000)])
+    np.testing.assert_allclose(calcular_superficie(gdf), [2.0, 100.0])
+
+def test_grupos_con_una_sola_reproyeccion(zonas, monkeypatch):
+    llamadas = []
+    reproyectar = superficie._reproyectar
+    monkeypatch.setattr(superficie, '_reproyectar', lambda *a: llamadas.append(1) or reproyectar(*a))
+    parcela, partes = superficies_ha(zonas.geometry.values[:1], zonas.geometry.values[:2], crs=zonas.crs)
+    assert len(llamadas) == 1
+    assert len(parcela) == 1 and len(partes) == 2
+    np.testing.assert_allclose(parcela, hectareas_geodesicas(zonas.iloc[:1]), rtol=1e-5)
+    np.testing.assert_allclose(partes, hectareas_geodesicas(zonas.iloc[:2]), rtol=1e-5)
+
+def test_parcelas_vecinas_comparten_crs(parcela):
+    superficie._crs_laea.cache_clear()
+    primera = crs_area_igual(parcela.geometry.values, parcela.crs)
+    vecina = crs_area_igual(parcela.translate(0.001, 0.001).geometry.values, parcela.crs)
+    assert vecina is primera
+    assert superficie._crs_laea.cache_info().hits == 1
+    lejana = crs_area_igual(parcela.translate(2, 0).geometry.values, parcela.crs)
+    assert lejana != primera
+
+def test_parcela_vacia(parcela):
+    vacia = calcular_superficie(parcela.iloc[:0])
+    assert len(vacia) == 0 and vacia.index.equals(parcela.index[:0])
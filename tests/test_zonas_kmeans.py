@@ -0,0 +1,108 @@
+import geopandas as gpd
+import numpy as np
+import pytest
+import shapely
+from affine import Affine
+from shapely.geometry import box
+
+from evalscripts import NamedBands
+from zonas_kmeans import asignar_clusters, filtro_moda, minibatch_kmeans, zonificar_kmeans
+
+ORIGEN = (500000.0, 6200000.0)
+TRANSFORM = Affine(10, 0, ORIGEN[0], 0, -10, ORIGEN[1])
+
+def lloyd(datos, centros, iteraciones=100):
+    """Referencia: k-means de Lloyd con todos los puntos en cada iteración"""
+    centros = centros.astype(np.float64)
+    for _ in range(iteraciones):
+        asignacion = ((datos[:, None, :] - centros[None]) ** 2).sum(axis=2).argmin(axis=1)
+        centros = np.array([datos[asignacion == j].mean(axis=0) for j in range(len(centros))])
+    return centros
+
+def moda_referencia(clases, n_clases, radio, mascara=None):
+    """Referencia: recorre cada ventana; gana la clase de mayor conteo y, en empate, la de menor número"""
+    alto, ancho = clases.shape
+    resultado = np.zeros_like(clases)
+    for f in range(alto):
+        for c in range(ancho):
+            ventana = clases[max(f - radio, 0):f + radio + 1, max(c - radio, 0):c + radio + 1]
+            conteos = [np.count_nonzero(ventana == clase) for clase in range(1, n_clases + 1)]
+            if max(conteos) > 0:
+                resultado[f, c] = int(np.argmax(conteos)) + 1
+    if mascara is not None:
+        resultado[~mascara] = 0
+    return resultado
+
+def test_minibatch_igual_a_lloyd_en_grupos_separados():
+    rng = np.random.default_rng(0)
+    medias = np.array([[0, 0], [4, 0], [0, 4], [4, 4]], dtype=np.float32)
+    datos = np.concatenate([m + rng.normal(0, 0.5, (12000, 2)) for m in medias]).astype(np.float32)
+    centros = minibatch_kmeans(datos, 4, semilla=1)
+    referencia = lloyd(datos, centros)
+    orden = np.lexsort(centros.T[::-1])
+    np.testing.assert_allclose(centros[orden], referencia[np.lexsort(referencia.T[::-1])], atol=0.05)
+    # Casi todos los puntos quedan en el mismo grupo que con Lloyd
+    asignacion = asignar_clusters(datos, centros)
+    asignacion_ref = asignar_clusters(datos, referencia.astype(np.float32))
+    assert (asignacion == asignacion_ref).mean() > 0.995
+
+def test_asignacion_por_bloques_igual_a_fuerza_bruta():
+    rng = np.random.default_rng(5)
+    datos = rng.normal(size=(1003, 3)).astype(np.float32)
+    centros = rng.normal(size=(5, 3)).astype(np.float32)
+    esperada = ((datos[:, None, :] - centros[None]) ** 2).sum(axis=2).argmin(axis=1)
+    for pixeles_por_bloque in (7, 1000, 4096):
+        np.testing.assert_array_equal(asignar_clusters(datos, centros, pixeles_por_bloque), esperada)
+
+@pytest.mark.parametrize('radio', [1, 2])
+def test_filtro_moda_igual_a_la_referencia(radio):
+    rng = np.random.default_rng(radio)
+    clases = rng.integers(0, 4, size=(23, 31)).astype(np.uint8)
+    mascara = rng.random(clases.shape) > 0.1
+    np.testing.assert_array_equal(filtro_moda(clases, 3, radio), moda_referencia(clases, 3, radio))
+    np.testing.assert_array_equal(filtro_moda(clases, 3, radio, mascara=mascara),
+                                  moda_referencia(clases, 3, radio, mascara))
+
+def caja_pixeles(f0, c0, f1, c1):
+    """Rectángulo sobre los píxeles [f0, f1) x [c0, c1) de la grilla de 10 m"""
+    x0, y0 = ORIGEN
+    return box(x0 + c0 * 10, y0 - f1 * 10, x0 + c1 * 10, y0 - f0 * 10)
+
+@pytest.fixture
+def raster():
+    """Mitad oeste de bajo vigor y este de alto, con una mancha chica, una grande y un hueco sin datos"""
+    rng = np.random.default_rng(7)
+    ndvi = np.where(np.arange(60) < 30, 0.3, 0.7)[None, :].repeat(60, axis=0)
+    ndvi[10:13, 5:8] = 0.7       # 9 píxeles (~0.09 ha): se absorbe
+    ndvi[40:48, 10:18] = 0.7     # 64 píxeles (~0.64 ha): se conserva
+    ndvi = (ndvi + rng.normal(0, 0.02, ndvi.shape)).astype(np.float32)
+    ndvi[50:52, 45:47] = np.nan
+    gdf = gpd.GeoDataFrame(geometry=[caja_pixeles(0, 0, 60, 60)], crs='EPSG:32720')
+    return gdf, NamedBands(ndvi[..., None], ['NDVI'], transform=TRANSFORM, crs='EPSG:32720')
+
+def test_zonificacion_con_eliminacion_de_fragmentos(raster):
+    gdf, bandas = raster
+    zonas = zonificar_kmeans(gdf, bandas, n_clases=2, radio_moda=0, disolver=True)
+    assert list(zonas['clase']) == [1, 2] and zonas.crs == gdf.crs
+    # Referencia: el ráster de clases esperado tras absorber la mancha chica y el hueco sin datos
+    alto_vigor = shapely.union_all([caja_pixeles(0, 30, 60, 60), caja_pixeles(40, 10, 48, 18)])
+    bajo_vigor = caja_pixeles(0, 0, 60, 60).difference(alto_vigor)
+    for geometria, esperada in zip(zonas.geometry, (bajo_vigor, alto_vigor)):
+        assert geometria.symmetric_difference(esperada).area < 1e-6
+    assert zonas.area.sum() == pytest.approx(gdf.area.iloc[0])
+
+def test_zonas_sin_disolver_y_filtro_moda(raster):
+    gdf, bandas = raster
+    zonas = zonificar_kmeans(gdf, bandas, n_clases=2)
+    # Una zona por polígono conexo: el oeste, el este y la mancha grande; sin solapes ni huecos
+    assert sorted(zonas['clase']) == [1, 2, 2]
+    assert list(zonas['id_zona']) == [1, 2, 3]
+    assert zonas.area.sum() == pytest.approx(gdf.area.iloc[0])
+    assert shapely.union_all(zonas.geometry.values).area == pytest.approx(gdf.area.iloc[0])
+
+def test_parcela_en_geograficas_y_pocos_pixeles(raster):
+    gdf, bandas = raster
+    zonas = zonificar_kmeans(gdf.to_crs('EPSG:4326'), bandas, n_clases=2, disolver=True)
+    assert zonas.crs == 'EPSG:4326' and len(zonas) == 2
+    with pytest.raises(ValueError, match='suficientes'):
+        zonificar_kmeans(gpd.GeoDataFrame(geometry=[caja_pixeles(50, 45, 52, 47)], crs='EPSG:32720'), bandas)
@@ -0,0 +1,129 @@
+import geopandas as gpd
+import numpy as np
+import pytest
+import shapely
+from affine import Affine
+from shapely.geometry import box
+
+from evalscripts import NamedBands
+from zonificacion import _suma_rectangulos, _tablas_sumas, dividir_parcela_en_zonas, dividir_parcela_quadtree
+
+ORIGEN = (500000.0, 6200000.0)
+TRANSFORM = Affine(10, 0, ORIGEN[0], 0, -10, ORIGEN[1])
+
+def area_utm(gdf):
+    return gdf.to_crs(gdf.estimate_utm_crs()).area
+
+@pytest.mark.parametrize('n_zonas', [1, 2, 3, 7, 16, 20, 32, 50])
+def test_rectangulo_con_exactamente_n_zonas(n_zonas):
+    rectangulo = gpd.GeoDataFrame(geometry=[box(-60.0, -34.01, -59.99, -34.0)], crs='EPSG:4326')
+    zonas = dividir_parcela_en_zonas(rectangulo, n_zonas)
+    assert len(zonas) == n_zonas
+    assert list(zonas['id_zona']) == list(range(1, n_zonas + 1))
+    # Sin huecos ni solapamientos: las zonas cubren la parcela
+    assert area_utm(zonas).sum() == pytest.approx(area_utm(rectangulo).sum(), rel=1e-7)
+    diferencia = shapely.symmetric_difference(shapely.union_all(zonas.geometry.values), rectangulo.geometry.iloc[0])
+    assert diferencia.area < 1e-12
+
+def test_filas_de_32_zonas():
+    rectangulo = gpd.GeoDataFrame(geometry=[box(0, 0, 6, 6)])
+    zonas = dividir_parcela_en_zonas(rectangulo, 32)
+    # 6 filas de igual alto: las dos de abajo con 6 celdas, las demás con 5
+    por_fila = zonas.geometry.bounds.groupby('miny').size()
+    assert list(por_fila) == [6, 6, 5, 5, 5, 5]
+    np.testing.assert_allclose(zonas.area.groupby(zonas.geometry.bounds['miny']).sum(), 6.0)
+
+def caja_pixeles(f0, c0, f1, c1):
+    """Rectángulo sobre los píxeles [f0, f1) x [c0, c1) de la grilla de 10 m"""
+    return box(ORIGEN[0] + c0 * 10, ORIGEN[1] - f1 * 10, ORIGEN[0] + c1 * 10, ORIGEN[1] - f0 * 10)
+
+def quadtree_referencia(valores, f0, c0, f1, c1, varianza_maxima, minimo_pixeles, maximo_pixeles=np.inf):
+    """Referencia: recursión directa con np.var sobre los píxeles finitos de cada celda"""
+    celda = valores[f0:f1, c0:c1]
+    celda = celda[np.isfinite(celda)]
+    alto, ancho = f1 - f0, c1 - c0
+    partir = (celda.size > 1 and np.var(celda) > varianza_maxima and min(alto, ancho) >= 2 * minimo_pixeles) or \
+             (max(alto, ancho) > maximo_pixeles and min(alto, ancho) > 1)
+    if not partir:
+        return [(f0, c0, f1, c1)]
+    fm, cm = (f0 + f1) // 2, (c0 + c1) // 2
+    hojas = []
+    for g0, d0, g1, d1 in ((f0, c0, fm, cm), (f0, cm, fm, c1), (fm, c0, f1, cm), (fm, cm, f1, c1)):
+        if g1 > g0 and d1 > d0:
+            hojas += quadtree_referencia(valores, g0, d0, g1, d1, varianza_maxima, minimo_pixeles, maximo_pixeles)
+    return hojas
+
+@pytest.fixture
+def ndvi():
+    """Ráster 64 x 64: cuadrante NO constante, NE ruidoso, SO en gradiente y SE constante con una mancha"""
+    rng = np.random.default_rng(11)
+    ndvi = np.full((64, 64), 0.5, dtype=np.float32)
+    ndvi[:32, 32:] += rng.normal(0, 0.2, (32, 32)).astype(np.float32)
+    ndvi[32:, :32] = np.linspace(0.1, 0.9, 32, dtype=np.float32)[None, :]
+    ndvi[40:44, 52:56] = 0.9
+    ndvi[5:9, 40:42] = np.nan
+    return ndvi
+
+def test_sumas_acumuladas_igual_a_numpy(ndvi):
+    validos = np.isfinite(ndvi) & (np.random.default_rng(3).random(ndvi.shape) > 0.2)
+    conteo, suma, cuadrados = _tablas_sumas(ndvi, validos)
+    rng = np.random.default_rng(4)
+    f0, c0 = rng.integers(0, 63, 200), rng.integers(0, 63, 200)
+    f1, c1 = f0 + rng.integers(1, 64 - f0), c0 + rng.integers(1, 64 - c0)
+    n = _suma_rectangulos(conteo, f0, c0, f1, c1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        media = _suma_rectangulos(suma, f0, c0, f1, c1) / n
+        varianza = _suma_rectangulos(cuadrados, f0, c0, f1, c1) / n - media * media
+    for i in range(200):
+        celda = ndvi[f0[i]:f1[i], c0[i]:c1[i]][validos[f0[i]:f1[i], c0[i]:c1[i]]]
+        assert n[i] == celda.size
+        if celda.size:
+            assert varianza[i] == pytest.approx(np.var(celda.astype(np.float64)), abs=1e-9)
+
+@pytest.mark.parametrize('varianza_maxima, tamano_maximo_m', [(0.0025, None), (1e-4, None), (0.0025, 170)])
+def test_quadtree_igual_a_la_referencia(ndvi, varianza_maxima, tamano_maximo_m):
+    gdf = gpd.GeoDataFrame(geometry=[caja_pixeles(0, 0, 64, 64)], crs='EPSG:32720')
+    bandas = NamedBands(ndvi[..., None], ['NDVI'], transform=TRANSFORM, crs='EPSG:32720')
+    zonas = dividir_parcela_quadtree(gdf, bandas, 'NDVI', varianza_maxima, ancho_minimo_m=40,
+                                     tamano_maximo_m=tamano_maximo_m)
+    # Píxeles de 10 m: 40 m de ancho mínimo son 4 píxeles; 170 m de tamaño máximo, 17
+    maximo = tamano_maximo_m / 10 if tamano_maximo_m else np.inf
+    esperadas = quadtree_referencia(ndvi, 0, 0, 64, 64, varianza_maxima, 4, maximo)
+    assert sorted(map(tuple, np.round(zonas.bounds.values, 6))) == \
+           sorted(map(tuple, np.round([caja_pixeles(*hoja).bounds for hoja in esperadas], 6)))
+    assert list(zonas['id_zona']) == list(range(1, len(zonas) + 1))
+    # El cuadrante constante del noroeste queda entero; el ruidoso baja hasta el ancho mínimo
+    if tamano_maximo_m is None:
+        assert caja_pixeles(0, 0, 32, 32).bounds in [tuple(b) for b in zonas.bounds.values]
+    assert (zonas.bounds['maxx'] - zonas.bounds['minx']).min() >= 40
+    assert zonas.area.sum() == pytest.approx(gdf.area.iloc[0])
+
+def test_quadtree_raster_homogeneo_una_sola_zona():
+    gdf = gpd.GeoDataFrame(geometry=[caja_pixeles(0, 0, 30, 50)], crs='EPSG:32720')
+    bandas = NamedBands(np.full((30, 50, 1), 0.6, dtype=np.float32), ['NDVI'], transform=TRANSFORM, crs='EPSG:32720')
+    zonas = dividir_parcela_quadtree(gdf, bandas)
+    assert len(zonas) == 1 and zonas.geometry.iloc[0].equals(gdf.geometry.iloc[0])
+
+def test_quadtree_parcela_fuera_de_la_grilla_de_pixeles(ndvi):
+    # Límites a mitad de píxel: la celda raíz incluye el último píxel parcial de cada lado
+    parcela = box(ORIGEN[0] + 5.0, ORIGEN[1] - 473.0, ORIGEN[0] + 473.0, ORIGEN[1] - 5.0)
+    gdf = gpd.GeoDataFrame(geometry=[parcela], crs='EPSG:32720')
+    bandas = NamedBands(ndvi[..., None], ['NDVI'], transform=TRANSFORM, crs='EPSG:32720')
+    zonas = dividir_parcela_quadtree(gdf, bandas, ancho_minimo_m=40)
+    assert zonas.area.sum() == pytest.approx(parcela.area)
+    assert shapely.union_all(zonas.geometry.values).symmetric_difference(parcela).area < 1e-6
+    with pytest.raises(ValueError, match='no intersecta'):
+        dividir_parcela_quadtree(gpd.GeoDataFrame(geometry=[box(0, 0, 10, 10)], crs='EPSG:32720'), bandas)
+
+def test_parcela_irregular_no_supera_n_zonas(parcela):
+    parcela = parcela.to_crs(parcela.estimate_utm_crs())
+    for n_zonas in (9, 32, 50):
+        zonas = dividir_parcela_en_zonas(parcela, n_zonas)
+        assert len(zonas) <= n_zonas
+        assert zonas.area.sum() == pytest.approx(parcela.area.sum(), rel=1e-9)
+
+def test_por_tamano_en_metros(parcela):
+    zonas = dividir_parcela_en_zonas(parcela, tamano_zona_m=250)
+    assert zonas.crs == parcela.crs
+    assert area_utm(zonas).max() <= 250 * 250 * 1.001
+    assert area_utm(zonas).sum() == pytest.approx(area_utm(parcela).sum(), rel=1e-6)
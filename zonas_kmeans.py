@@ -0,0 +1,194 @@
+import numpy as np
+import shapely
+import geopandas as gpd
+from pyproj import CRS
+from rasterio.features import geometry_mask, shapes, sieve
+
+from superficie import superficies_ha
+
+# Minibatch k-means: tamaño de lote, iteraciones máximas y tolerancia de desplazamiento de centros
+TAMANO_LOTE = 8192
+MAX_ITERACIONES = 200
+TOLERANCIA = 1e-4
+# Píxeles de la muestra para estandarizar e inicializar (k-means++)
+TAMANO_MUESTRA = 20000
+# Píxeles por bloque en la asignación final
+PIXELES_POR_BLOQUE = 1024 * 1024
+# Fragmentos menores que esta superficie se absorben en la clase vecina
+SUPERFICIE_MINIMA_HA = 0.5
+# Radio (píxeles) del filtro de moda que suaviza los bordes ruidosos antes de poligonizar
+RADIO_MODA = 2
+
+# ===== MINIBATCH K-MEANS =====
+def _distancias(x, centros, out=None):
+    """Distancias euclídeas al cuadrado (n, k) sin materializar x - c"""
+    d = np.matmul(x, centros.T, out=out)
+    d *= -2
+    d += np.einsum('ij,ij->i', x, x)[:, None]
+    d += np.einsum('ij,ij->i', centros, centros)[None, :]
+    return d
+
+def _kmeans_mas_mas(muestra, k, rng):
+    """Inicialización k-means++ sobre la muestra"""
+    centros = [muestra[rng.integers(len(muestra))]]
+    d_min = _distancias(muestra, np.array(centros))[:, 0]
+    for _ in range(1, k):
+        np.maximum(d_min, 0, out=d_min)
+        total = d_min.sum()
+        i = rng.choice(len(muestra), p=d_min / total) if total > 0 else rng.integers(len(muestra))
+        centros.append(muestra[i])
+        np.minimum(d_min, _distancias(muestra, muestra[i:i + 1])[:, 0], out=d_min)
+    return np.array(centros, dtype=np.float32)
+
+def minibatch_kmeans(datos, k, tamano_lote=TAMANO_LOTE, max_iteraciones=MAX_ITERACIONES, tolerancia=TOLERANCIA,
+                     semilla=0):
+    """Centros por minibatch k-means (Sculley) con tasa de aprendizaje 1 / cantidad por centro"""
+    rng = np.random.default_rng(semilla)
+    n = len(datos)
+    muestra = datos[rng.choice(n, min(n, TAMANO_MUESTRA), replace=False)]
+    centros = _kmeans_mas_mas(muestra, k, rng)
+    cuentas = np.zeros(k)
+    distancias = np.empty((min(tamano_lote, n), k), dtype=np.float32)
+
+    for _ in range(max_iteraciones):
+        lote = datos[rng.integers(0, n, min(tamano_lote, n))]
+        asignacion = _distancias(lote, centros, out=distancias[:len(lote)]).argmin(axis=1)
+        n_lote = np.bincount(asignacion, minlength=k)
+        suma_lote = np.stack([np.bincount(asignacion, weights=lote[:, j], minlength=k)
+                              for j in range(datos.shape[1])], axis=1)
+        cuentas += n_lote
+        activos = n_lote > 0
+        anteriores = centros.copy()
+        centros[activos] += ((suma_lote[activos] - n_lote[activos, None] * centros[activos])
+                             / cuentas[activos, None]).astype(np.float32)
+        if np.abs(centros - anteriores).max() < tolerancia:
+            break
+    return centros
+
+def asignar_clusters(datos, centros, pixeles_por_bloque=PIXELES_POR_BLOQUE):
+    """Centro más cercano para cada fila, por bloques con un buffer de distancias reutilizado"""
+    etiquetas = np.empty(len(datos), dtype=np.uint8)
+    distancias = np.empty((min(pixeles_por_bloque, len(datos)), len(centros)), dtype=np.float32)
+    for inicio in range(0, len(datos), pixeles_por_bloque):
+        bloque = datos[inicio:inicio + pixeles_por_bloque]
+        etiquetas[inicio:inicio + len(bloque)] = _distancias(bloque, centros, out=distancias[:len(bloque)]).argmin(axis=1)
+    return etiquetas
+
+# ===== LIMPIEZA DEL RÁSTER DE CLASES =====
+def _suma_ventana(mascara, radio, integral):
+    """Cantidad de píxeles True en la ventana (2 radio + 1)² de cada píxel, con una tabla de sumas acumuladas
+
+    integral es un buffer int32 de (alto + 2 radio + 1, ancho + 2 radio + 1) reutilizado entre clases; el
+    borde de ceros hace que cada término de la suma de la ventana sea una vista, sin copias indexadas.
+    """
+    alto, ancho = mascara.shape
+    lado = 2 * radio + 1
+    integral.fill(0)
+    interior = integral[radio + 1:radio + 1 + alto, radio + 1:radio + 1 + ancho]
+    np.copyto(interior, mascara, casting='unsafe')
+    np.cumsum(integral, axis=0, out=integral)
+    np.cumsum(integral, axis=1, out=integral)
+    suma = integral[lado:, lado:] - integral[:-lado, lado:]
+    suma -= integral[lado:, :-lado]
+    suma += integral[:-lado, :-lado]
+    return suma
+
+def filtro_moda(clases, n_clases, radio=RADIO_MODA, mascara=None):
+    """Clase más frecuente en la vecindad de cada píxel (la clase 0, sin datos, no vota)"""
+    alto, ancho = clases.shape
+    integral = np.empty((alto + 2 * radio + 1, ancho + 2 * radio + 1), dtype=np.int32)
+    mejor = np.zeros(clases.shape, dtype=np.int32)
+    resultado = np.zeros_like(clases)
+    for clase in range(1, n_clases + 1):
+        conteo = _suma_ventana(clases == clase, radio, integral)
+        gana = conteo > mejor
+        resultado[gana] = clase
+        np.maximum(mejor, conteo, out=mejor)
+    if mascara is not None:
+        resultado[~mascara] = 0
+    return resultado
+
+# ===== ZONIFICACIÓN =====
+def _superficie_pixel_ha(transform, crs, parcela):
+    """Superficie de un píxel en el centro de la parcela, en hectáreas (también para CRS geográficos)"""
+    x, y = shapely.get_coordinates(parcela.centroid)[0]
+    pixel = shapely.box(x, y, x + abs(transform.a), y + abs(transform.e))
+    superficie, = superficies_ha([pixel], crs=crs)
+    return float(superficie[0])
+
+def _caracteristicas(bandas, nombres, validos):
+    """Matriz (n_validos, bandas) float32 estandarizada con media y desvío de cada banda"""
+    datos = np.empty((int(validos.sum()), len(nombres)), dtype=np.float32)
+    for j, nombre in enumerate(nombres):
+        columna = bandas[nombre][validos]
+        media, desvio = float(columna.mean()), float(columna.std()) or 1.0
+        np.subtract(columna, media, out=datos[:, j])
+        datos[:, j] /= desvio
+    return datos
+
+def zonificar_kmeans(gdf, bandas, n_clases=4, nombres=None, superficie_minima_ha=SUPERFICIE_MINIMA_HA,
+                     radio_moda=RADIO_MODA, semilla=0, disolver=False):
+    """Zonas de manejo por k-means de píxeles: clasificación, eliminación de fragmentos y poligonización
+
+    Las clases se numeran de menor a mayor valor medio de la primera banda (1 = menor vigor). Devuelve un
+    GeoDataFrame en el CRS de la parcela con id_zona y clase; disolver=True une cada clase en una zona.
+    """
+    nombres = [nombre for nombre in (nombres or bandas.names) if nombre in bandas]
+    crs = gdf.crs if bandas.crs is None else CRS.from_user_input(bandas.crs)
+    parcela = shapely.union_all(gdf.to_crs(crs).geometry.values if gdf.crs is not None else gdf.geometry.values)
+    alto, ancho = bandas.shape
+
+    # Píxeles válidos: dentro de la parcela y con todas las bandas finitas
+    dentro = geometry_mask([parcela], out_shape=(alto, ancho), transform=bandas.transform, invert=True)
+    validos = dentro.copy()
+    for nombre in nombres:
+        validos &= np.isfinite(bandas[nombre])
+    if validos.sum() < n_clases:
+        raise ValueError("No hay suficientes píxeles válidos para la zonificación")
+
+    datos = _caracteristicas(bandas, nombres, validos)
+    centros = minibatch_kmeans(datos, n_clases, semilla=semilla)
+    # Clases ordenadas por la primera banda (centros estandarizados conservan el orden)
+    orden = np.argsort(np.argsort(centros[:, 0])).astype(np.uint8)
+    clases = np.zeros((alto, ancho), dtype=np.uint8)
+    clases[validos] = orden[asignar_clusters(datos, centros)] + 1
+    del datos
+
+    # Bordes ruidosos suavizados; los huecos sin datos toman la clase de su vecindad
+    if radio_moda:
+        clases = filtro_moda(clases, n_clases, radio_moda, mascara=dentro)
+
+    # Fragmentos chicos (y huecos sin datos restantes, clase 0) se absorben en el polígono vecino más grande
+    minimo_pixeles = int(superficie_minima_ha / _superficie_pixel_ha(bandas.transform, crs, parcela))
+    if minimo_pixeles > 1:
+        clases = sieve(clases, size=minimo_pixeles, connectivity=8, mask=dentro)
+
+    geometrias, valores = [], []
+    for geometria, valor in shapes(clases, mask=dentro & (clases > 0), connectivity=8, transform=bandas.transform):
+        # Anillos como arrays: evita construir cada vértice como objeto de Python
+        anillos = [shapely.linearrings(anillo) for anillo in geometria['coordinates']]
+        geometrias.append(shapely.polygons(anillos[0], holes=anillos[1:] or None))
+        valores.append(int(valor))
+    if not geometrias:
+        raise ValueError("La zonificación no produjo polígonos")
+    geometrias = np.array(geometrias, dtype=object)
+    valores = np.array(valores, dtype=np.int64)
+
+    if disolver:
+        geometrias = np.array([shapely.union_all(geometrias[valores == clase]) for clase in np.unique(valores)],
+                              dtype=object)
+        valores = np.unique(valores)
+    # Bordes en escalera recortados al contorno real de la parcela (solo los polígonos que lo cruzan)
+    shapely.prepare(parcela)
+    cruzan = ~shapely.contains_properly(parcela, geometrias)
+    geometrias[cruzan] = shapely.intersection(geometrias[cruzan], parcela)
+    conservar = shapely.area(geometrias) > 0
+
+    zonas = gpd.GeoDataFrame({
+        'id_zona': np.arange(1, conservar.sum() + 1),
+        'clase': valores[conservar],
+        'geometry': geometrias[conservar]
+    }, crs=crs)
+    if gdf.crs is not None and zonas.crs != gdf.crs:
+        zonas = zonas.to_crs(gdf.crs)
+    return zonas
@@ -0,0 +1,210 @@
+import math
+import numpy as np
+import shapely
+from pyproj import CRS
+
+from superficie import superficies_ha
+
+# Quadtree: varianza del índice por encima de la cual una celda se subdivide (desvío 0.05 de NDVI)
+VARIANZA_MAXIMA = 0.0025
+# Ancho de aplicación de la maquinaria: ninguna celda se subdivide por debajo de este lado (m)
+ANCHO_APLICACION_M = 20
+
+# ===== SUBDIVISIÓN VECTORIZADA EN GRILLA =====
+def _construir_grilla(minx, miny, n_cols, n_rows, ancho, alto):
+    """Construye todas las celdas de la grilla en orden fila por fila"""
+    cols, filas = np.meshgrid(np.arange(n_cols), np.arange(n_rows))
+    x0 = minx + cols.ravel() * ancho
+    y0 = miny + filas.ravel() * alto
+    return shapely.box(x0, y0, x0 + ancho, y0 + alto)
+
+def _grilla_n_celdas(minx, miny, maxx, maxy, n_zonas):
+    """Exactamente n_zonas celdas que cubren el rectángulo, en filas de igual alto
+
+    Las filas tienen n_zonas // n_filas celdas y las de abajo una más cuando la cuenta no es exacta
+    (32 zonas: dos filas de 6 y cuatro de 5), en lugar de una grilla completa de 6 x 6.
+    """
+    n_cols = math.ceil(math.sqrt(n_zonas))
+    n_rows = math.ceil(n_zonas / n_cols)
+    por_fila = np.full(n_rows, n_zonas // n_rows)
+    por_fila[:n_zonas % n_rows] += 1
+    filas = np.repeat(np.arange(n_rows), por_fila)
+    cols = np.arange(n_zonas) - np.repeat(np.cumsum(por_fila) - por_fila, por_fila)
+    ancho = (maxx - minx) / por_fila[filas]
+    alto = (maxy - miny) / n_rows
+    x0 = minx + cols * ancho
+    y0 = miny + filas * alto
+    return shapely.box(x0, y0, x0 + ancho, y0 + alto)
+
+def subdividir_geometria(parcela, n_cols, n_rows, ancho, alto):
+    """Intersecta una grilla con la parcela recortando solo las celdas del borde"""
+    minx, miny = parcela.bounds[:2]
+    celdas = _construir_grilla(minx, miny, n_cols, n_rows, ancho, alto)
+
+    return _recortar_a_parcela(celdas, parcela)
+
+def _recortar_a_parcela(celdas, parcela):
+    """Celdas que tocan la parcela, recortando solo las del borde"""
+    # Prefiltro con STRtree: celdas que tocan la parcela y celdas completamente interiores
+    arbol = shapely.STRtree(celdas)
+    candidatas = np.sort(arbol.query(parcela, predicate='intersects'))
+    interiores = arbol.query(parcela, predicate='contains')
+    borde = np.setdiff1d(candidatas, interiores)
+
+    celdas[borde] = shapely.intersection(celdas[borde], parcela)
+    zonas = celdas[candidatas]
+    return zonas[shapely.area(zonas) > 0]
+
+def dividir_parcela_en_zonas(gdf, n_zonas=None, tamano_zona_m=None):
+    """Divide todos los polígonos de la parcela en zonas de manejo (por cantidad o por tamaño en metros)
+
+    Por cantidad la grilla tiene exactamente n_zonas celdas sobre el rectángulo de la parcela; en
+    parcelas irregulares las celdas que no la tocan se descartan y pueden quedar menos zonas.
+    """
+    import geopandas as gpd
+    if len(gdf) == 0:
+        return gdf
+
+    # Para tamaños en metros se trabaja en UTM y se vuelve al CRS original
+    gdf_trabajo = gdf
+    if tamano_zona_m:
+        if gdf.crs is None:
+            raise ValueError("La parcela no tiene CRS: no se puede dividir por tamaño en metros")
+        if gdf.crs.is_geographic:
+            gdf_trabajo = gdf.to_crs(gdf.estimate_utm_crs())
+
+    parcela = shapely.union_all(gdf_trabajo.geometry.values)
+    minx, miny, maxx, maxy = parcela.bounds
+
+    if maxx <= minx or maxy <= miny:
+        return gdf
+    if tamano_zona_m:
+        ancho = alto = float(tamano_zona_m)
+        n_cols = max(1, math.ceil((maxx - minx) / ancho))
+        n_rows = max(1, math.ceil((maxy - miny) / alto))
+        sub_poligonos = subdividir_geometria(parcela, n_cols, n_rows, ancho, alto)
+    else:
+        sub_poligonos = _recortar_a_parcela(_grilla_n_celdas(minx, miny, maxx, maxy, n_zonas), parcela)
+    if len(sub_poligonos) == 0:
+        return gdf
+
+    nuevo_gdf = gpd.GeoDataFrame({
+        'id_zona': np.arange(1, len(sub_poligonos) + 1),
+        'geometry': sub_poligonos
+    }, crs=gdf_trabajo.crs)
+
+    if gdf_trabajo is not gdf:
+        nuevo_gdf = nuevo_gdf.to_crs(gdf.crs)
+    return nuevo_gdf
+
+
+# ===== SUBDIVISIÓN ADAPTATIVA (QUADTREE) =====
+def _tablas_sumas(valores, validos):
+    """Tablas de sumas acumuladas (con borde de ceros) de conteo, suma y suma de cuadrados de los válidos"""
+    alto, ancho = valores.shape
+    conteo = np.zeros((alto + 1, ancho + 1), dtype=np.int32)
+    np.cumsum(validos, axis=0, dtype=np.int32, out=conteo[1:, 1:])
+    np.cumsum(conteo[1:, 1:], axis=1, out=conteo[1:, 1:])
+
+    # Valores centrados en la media: menos cancelación al restar sumas de cuadrados grandes
+    datos = np.where(validos, valores, 0).astype(np.float64)
+    datos[validos] -= datos[validos].mean() if validos.any() else 0.0
+    suma = np.zeros((alto + 1, ancho + 1), dtype=np.float64)
+    np.cumsum(datos, axis=0, out=suma[1:, 1:])
+    np.cumsum(suma[1:, 1:], axis=1, out=suma[1:, 1:])
+    np.square(datos, out=datos)
+    cuadrados = np.zeros((alto + 1, ancho + 1), dtype=np.float64)
+    np.cumsum(datos, axis=0, out=cuadrados[1:, 1:])
+    np.cumsum(cuadrados[1:, 1:], axis=1, out=cuadrados[1:, 1:])
+    return conteo, suma, cuadrados
+
+def _suma_rectangulos(tabla, f0, c0, f1, c1):
+    """Suma de cada rectángulo [f0, f1) x [c0, c1) con cuatro lecturas de la tabla"""
+    return tabla[f1, c1] - tabla[f0, c1] - tabla[f1, c0] + tabla[f0, c0]
+
+def _lado_pixel_m(transform, crs, parcela):
+    """Lado de un píxel en metros en el centro de la parcela (también para CRS geográficos)"""
+    x, y = shapely.get_coordinates(parcela.centroid)[0]
+    pixel = shapely.box(x, y, x + abs(transform.a), y + abs(transform.e))
+    superficie, = superficies_ha([pixel], crs=crs)
+    return math.sqrt(float(superficie[0]) * 10000)
+
+def dividir_parcela_quadtree(gdf, bandas, indice='NDVI', varianza_maxima=VARIANZA_MAXIMA,
+                             ancho_minimo_m=ANCHO_APLICACION_M, tamano_maximo_m=None):
+    """Divide la parcela con un quadtree sobre el ráster del índice: solo se subdividen las celdas heterogéneas
+
+    Partiendo del rectángulo de la parcela, una celda se parte en cuatro cuando la varianza del índice
+    en sus píxeles válidos supera varianza_maxima (sin bajar de ancho_minimo_m de lado) o cuando es más
+    grande que tamano_maximo_m. Cada varianza sale de tablas de sumas acumuladas en O(1).
+    """
+    # rasterio solo se carga cuando hay un ráster que subdividir
+    import geopandas as gpd
+    from rasterio import windows
+    from rasterio.features import geometry_mask
+
+    from escenas_locales import ventana_entera
+
+    if len(gdf) == 0:
+        return gdf
+    indice = indice if indice in bandas else bandas.names[0]
+    crs = gdf.crs if bandas.crs is None else CRS.from_user_input(bandas.crs)
+    parcela = shapely.union_all(gdf.to_crs(crs).geometry.values if gdf.crs is not None else gdf.geometry.values)
+
+    # Celda raíz: ventana del ráster que cubre la parcela
+    alto, ancho = bandas.shape
+    raiz = ventana_entera(windows.from_bounds(*parcela.bounds, transform=bandas.transform))
+    try:
+        raiz = raiz.intersection(windows.Window(0, 0, ancho, alto))
+    except windows.WindowError:
+        raise ValueError("La parcela no intersecta el ráster")
+
+    dentro = geometry_mask([parcela], out_shape=(alto, ancho), transform=bandas.transform, invert=True)
+    valores = bandas[indice]
+    conteo, suma, cuadrados = _tablas_sumas(valores, dentro & np.isfinite(valores))
+    lado_pixel = _lado_pixel_m(bandas.transform, crs, parcela)
+    minimo_pixeles = max(1.0, ancho_minimo_m / lado_pixel)
+    maximo_pixeles = tamano_maximo_m / lado_pixel if tamano_maximo_m else np.inf
+
+    # Recorrido por niveles: todas las celdas de un nivel se evalúan juntas
+    f0 = np.array([int(raiz.row_off)])
+    c0 = np.array([int(raiz.col_off)])
+    f1 = f0 + int(raiz.height)
+    c1 = c0 + int(raiz.width)
+    hojas = []
+    while len(f0):
+        n = _suma_rectangulos(conteo, f0, c0, f1, c1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            media = _suma_rectangulos(suma, f0, c0, f1, c1) / n
+            varianza = _suma_rectangulos(cuadrados, f0, c0, f1, c1) / n - media * media
+        alto_celda, ancho_celda = f1 - f0, c1 - c0
+        # La mitad de la celda no puede quedar más angosta que el ancho de aplicación
+        divisible = np.minimum(alto_celda, ancho_celda) >= 2 * minimo_pixeles
+        partir = ((n > 1) & (varianza > varianza_maxima) & divisible) | \
+                 ((np.maximum(alto_celda, ancho_celda) > maximo_pixeles) & (np.minimum(alto_celda, ancho_celda) > 1))
+        hojas.append(np.column_stack([f0, c0, f1, c1])[~partir])
+
+        # Cuatro hijas por celda partida (en las celdas de un píxel de ancho, dos)
+        f0, c0, f1, c1 = f0[partir], c0[partir], f1[partir], c1[partir]
+        fm, cm = (f0 + f1) // 2, (c0 + c1) // 2
+        f0, c0, f1, c1 = (np.concatenate(partes) for partes in (
+            (f0, f0, fm, fm), (c0, cm, c0, cm), (fm, fm, f1, f1), (cm, c1, cm, c1)
+        ))
+        no_vacias = (f1 > f0) & (c1 > c0)
+        f0, c0, f1, c1 = f0[no_vacias], c0[no_vacias], f1[no_vacias], c1[no_vacias]
+
+    hojas = np.concatenate(hojas)
+    t = bandas.transform
+    xs = t.c + t.a * hojas[:, [1, 3]]
+    ys = t.f + t.e * hojas[:, [0, 2]]
+    celdas = shapely.box(xs.min(axis=1), ys.min(axis=1), xs.max(axis=1), ys.max(axis=1))
+    zonas = _recortar_a_parcela(celdas, parcela)
+    if len(zonas) == 0:
+        return gdf
+
+    nuevo_gdf = gpd.GeoDataFrame({
+        'id_zona': np.arange(1, len(zonas) + 1),
+        'geometry': zonas
+    }, crs=crs)
+    if gdf.crs is not None and nuevo_gdf.crs != gdf.crs:
+        nuevo_gdf = nuevo_gdf.to_crs(gdf.crs)
+    return nuevo_gdf